@@ -3,6 +3,7 @@ import jwt from "jsonwebtoken";
 import User from "../models/User.js";
 import { Chat, Message } from "../models/Chat.js";
 import { createNotificationSafely } from '../utils/notificationHelper.js';
+import { moderateChatMessage, startChatModeration } from '../utils/chatModeration.js';
 
 const setupSocket = (server) => {
   const io = new Server(server, {
@@ -15,6 +16,9 @@ const setupSocket = (server) => {
     pingInterval: 25000
   });
 
+  // One persistent connection to the ML service for all chat messages
+  startChatModeration();
+
   const onlineUsers = new Map(); // socketId -> userId
   const userSockets = new Map(); // userId -> socketId
   const userRooms = new Map(); // userId -> [roomIds]
@@ -167,6 +171,18 @@ const setupSocket = (server) => {
           return socket.emit("error", { message: "Chat not found" });
         }
 
+        // ✅ ML CHAT MODERATION (fails open if the service is down or slow)
+        const verdict = await moderateChatMessage({ chatId, text });
+        if (verdict.flagged) {
+          console.log(`🚫 Chat message blocked in ${chatId}: ${verdict.reason}`);
+          return socket.emit("message_blocked", {
+            chatId,
+            tempId: tempId || null,
+            reason: verdict.reason,
+            categories: verdict.flagged_categories
+          });
+        }
+
         // Create message
         const message = new Message({
           chat: chatId,
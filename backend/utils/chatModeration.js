@@ -0,0 +1,95 @@
+// backend/utils/chatModeration.js - Chat message moderation over one WebSocket to the ML service
+// Uses the global WebSocket (Node 22+). Fails open: if the service is down or slow, messages go through.
+
+const ML_CHAT_URL = process.env.ML_CHAT_URL || 'ws://localhost:5001/moderate-chat';
+const VERDICT_TIMEOUT_MS = Number(process.env.ML_CHAT_TIMEOUT_MS || 300);
+const RECONNECT_MS = 5000;
+
+let socket = null;
+let connecting = false;
+let nextId = 0;
+const pending = new Map(); // message id -> { resolve, timer }
+
+const allowed = (extra = {}) => ({
+  flagged: false,
+  reason: null,
+  flagged_categories: [],
+  confidence: 0,
+  serviceUnavailable: true,
+  ...extra
+});
+
+const connect = () => {
+  if (typeof WebSocket === 'undefined') {
+    console.warn('⚠️ Chat moderation needs Node 22+ (global WebSocket) - chat is not moderated');
+    return;
+  }
+  if (connecting || socket) return;
+  connecting = true;
+
+  const ws = new WebSocket(ML_CHAT_URL);
+
+  ws.addEventListener('open', () => {
+    connecting = false;
+    socket = ws;
+    console.log(`💬 Chat moderation connected: ${ML_CHAT_URL}`);
+  });
+
+  // Verdicts arrive as arrays, one frame per batch on the service
+  ws.addEventListener('message', (event) => {
+    let verdicts;
+    try {
+      verdicts = JSON.parse(event.data);
+    } catch {
+      return;
+    }
+
+    for (const verdict of [].concat(verdicts)) {
+      const entry = pending.get(verdict.id);
+      if (!entry) continue;
+      pending.delete(verdict.id);
+      clearTimeout(entry.timer);
+      entry.resolve(verdict.error ? allowed({ error: verdict.error }) : verdict);
+    }
+  });
+
+  ws.addEventListener('close', () => {
+    connecting = false;
+    if (socket === ws) {
+      socket = null;
+      console.warn('⚠️ Chat moderation disconnected - allowing messages until it reconnects');
+    }
+    setTimeout(connect, RECONNECT_MS);
+  });
+
+  // 'close' follows every error, so reconnecting is handled there
+  ws.addEventListener('error', () => {});
+};
+
+/**
+ * Moderate one chat message
+ * @param {Object} message - { chatId, text }
+ * @returns {Promise<Object>} { flagged, reason, flagged_categories, confidence, ... }
+ */
+export const moderateChatMessage = ({ chatId, text }) => {
+  if (!text || text.trim().length === 0) {
+    return Promise.resolve(allowed({ serviceUnavailable: false }));
+  }
+  if (!socket || socket.readyState !== WebSocket.OPEN) {
+    connect();
+    return Promise.resolve(allowed());
+  }
+
+  const id = `m${++nextId}`;
+  return new Promise((resolve) => {
+    const timer = setTimeout(() => {
+      pending.delete(id);
+      resolve(allowed({ timedOut: true }));
+    }, VERDICT_TIMEOUT_MS);
+
+    pending.set(id, { resolve, timer });
+    socket.send(JSON.stringify({ id, conversation: String(chatId), text }));
+  });
+};
+
+export const startChatModeration = connect;
@@ -3,6 +3,7 @@ import axios from 'axios';
 
 const ML_SERVICE_URL = process.env.ML_SERVICE_URL || 'http://localhost:5002';
 const DEFAULT_THRESHOLD = 0.7;
+const ML_TIMEOUT_MS = 5000;
 
 /**
  * Check content using ML moderation service
@@ -17,7 +18,11 @@ export const moderateContent = async (text, threshold = DEFAULT_THRESHOLD) => {
     const response = await axios.post(
       `${ML_SERVICE_URL}/moderate`,
       { text },
-      { timeout: 5000 }
+      {
+        timeout: ML_TIMEOUT_MS,
+        // The service drops or sheds work it can't finish before we give up
+        headers: { 'X-Deadline-Ms': String(ML_TIMEOUT_MS) }
+      }
     );
     
     const data = response.data;
@@ -58,8 +63,11 @@ export const moderateContent = async (text, threshold = DEFAULT_THRESHOLD) => {
     
   } catch (error) {
     // Handle ML service unavailable
-    if (error.code === 'ECONNREFUSED' || error.code === 'ETIMEDOUT') {
-      console.warn('⚠️ ML moderation service unavailable');
+    // (503 overloaded / 504 deadline exceeded come back at once instead of timing out)
+    const status = error.response?.status;
+    if (error.code === 'ECONNREFUSED' || error.code === 'ETIMEDOUT' || error.code === 'ECONNABORTED' ||
+        status === 503 || status === 504) {
+      console.warn(`⚠️ ML moderation service unavailable${status ? ` (HTTP ${status})` : ''}`);
       console.warn('   Allowing content (fail-open mode)');
       
       // Return safe default - allow content if service is down
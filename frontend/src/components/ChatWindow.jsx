@@ -155,6 +155,14 @@ const ChatWindow = () => {
       }
     };
 
+    const handleMessageBlocked = (data) => {
+      if (data.chatId === chatId && data.tempId) {
+        setMessages(prev => prev.map(msg => 
+          msg._id === data.tempId ? { ...msg, status: 'error', isSending: false } : msg
+        ));
+      }
+    };
+
     const handleMessageDelivered = (data) => {
       if (data.chatId === chatId && data.messageId) {
         setMessages(prev => prev.map(msg => 
@@ -187,6 +195,7 @@ const ChatWindow = () => {
     socket.on("user_typing", handleTyping);
     socket.on("user_stop_typing", handleStopTyping);
     socket.on("message_sent", handleMessageSent);
+    socket.on("message_blocked", handleMessageBlocked);
     socket.on("message_delivered", handleMessageDelivered);
     socket.on("message_read", handleMessageRead);
     socket.on("message_deleted", handleMessageDeleted);
@@ -199,6 +208,7 @@ const ChatWindow = () => {
       socket.off("user_typing", handleTyping);
       socket.off("user_stop_typing", handleStopTyping);
       socket.off("message_sent", handleMessageSent);
+      socket.off("message_blocked", handleMessageBlocked);
       socket.off("message_delivered", handleMessageDelivered);
       socket.off("message_read", handleMessageRead);
       socket.off("message_deleted", handleMessageDeleted);
@@ -0,0 +1,202 @@
+"""
+Admission Control
+Requests carry a deadline (X-Deadline-Ms header or deadline_ms field, in
+milliseconds from arrival) and a priority. A bounded number of requests run
+the model at once. The others wait in a bounded priority queue, ordered by
+priority and then earliest deadline. A request is answered "overloaded" at
+once when the queue ahead of it predicts it would miss its deadline. Work
+whose deadline passed while it waited is dropped before it reaches the model.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from settings import load_config_section
+
+DEFAULT_ADMISSION_CONFIG = {
+    'enabled': True,
+    'max_concurrent': 1,          # requests running the model at once per process
+    'max_queue': 64,              # requests waiting beyond that; more are shed
+    'default_deadline_ms': None,  # for requests that send none; null = no deadline
+    'initial_ms_per_text': 20,    # service time estimate until requests have been measured
+    'smoothing': 0.2              # weight of the newest request in the moving average
+}
+
+PRIORITIES = {'high': 0, 'normal': 1, 'low': 2}
+
+class Overloaded(Exception):
+    """Shed without running: the queue is full or predicts a missed deadline"""
+
+    def __init__(self, retry_after):
+        super().__init__('Moderation service overloaded')
+        self.retry_after = retry_after
+
+class DeadlineExceeded(Exception):
+    """The deadline passed before the request reached the model"""
+
+    def __init__(self):
+        super().__init__('Deadline exceeded before moderation started')
+
+def load_admission_config(config_path='config.yaml'):
+    """Read the admission section of config.yaml"""
+    return {**DEFAULT_ADMISSION_CONFIG, **load_config_section('admission', {}, config_path)}
+
+def parse_deadline(headers, data, received, default_ms=None):
+    """
+    Absolute deadline (time.perf_counter) from X-Deadline-Ms or deadline_ms, or None
+
+    The budget is relative to when the request arrived, so client and server
+    clocks never need to agree.
+    """
+    value = headers.get('X-Deadline-Ms')
+    if value is None and isinstance(data, dict):
+        value = data.get('deadline_ms')
+    if value is None:
+        value = default_ms
+    if value is None:
+        return None
+    try:
+        milliseconds = float(value)
+    except (TypeError, ValueError):
+        raise ValueError('deadline must be a number of milliseconds')
+    return received + milliseconds / 1000
+
+def parse_priority(headers, data):
+    """Queue rank from X-Priority or priority (high, normal, low); lower runs first"""
+    value = headers.get('X-Priority')
+    if value is None and isinstance(data, dict):
+        value = data.get('priority')
+    value = str(value or 'normal').lower()
+    if value not in PRIORITIES:
+        raise ValueError(f"priority must be one of: {', '.join(PRIORITIES)}")
+    return PRIORITIES[value]
+
+class _Waiter:
+    __slots__ = ('key', 'texts', 'deadline', 'state')
+
+    def __init__(self, key, texts, deadline):
+        self.key = key
+        self.texts = texts
+        self.deadline = deadline
+        self.state = 'waiting'  # -> granted | expired | evicted
+
+    def __lt__(self, other):
+        return self.key < other.key
+
+class AdmissionController:
+    """Bounded concurrency in front of the model, with a priority queue and load shedding"""
+
+    def __init__(self, config=None):
+        self.config = {**DEFAULT_ADMISSION_CONFIG, **(config or {})}
+        self.max_concurrent = max(1, self.config['max_concurrent'])
+        self.max_queue = self.config['max_queue']
+        self.seconds_per_text = self.config['initial_ms_per_text'] / 1000
+        self.condition = threading.Condition()
+        self.waiting = []
+        self.active = 0
+        self.active_texts = 0
+        self.sequence = itertools.count()
+        self.counts = {'admitted': 0, 'shed': 0, 'expired': 0}
+
+    def depth(self):
+        """Requests waiting for a model slot"""
+        return len(self.waiting)
+
+    def estimated_wait(self, priority, deadline):
+        """Seconds until a new request with this rank would start, from the texts ahead of it"""
+        key = (priority, deadline if deadline is not None else float('inf'))
+        ahead = self.active_texts + sum(w.texts for w in self.waiting if w.key[:2] <= key)
+        return ahead * self.seconds_per_text / self.max_concurrent
+
+    @contextmanager
+    def admit(self, texts, deadline=None, priority=PRIORITIES['normal']):
+        """
+        Hold a model slot for the with-block
+
+        Raises:
+            Overloaded: shed up front, the caller should answer at once
+            DeadlineExceeded: the deadline passed while queued
+        """
+        self._acquire(texts, deadline, priority)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(texts, time.perf_counter() - start)
+
+    def _acquire(self, texts, deadline, priority):
+        with self.condition:
+            now = time.perf_counter()
+            if deadline is not None and now >= deadline:
+                self.counts['expired'] += 1
+                raise DeadlineExceeded()
+
+            if self.active < self.max_concurrent and not self.waiting:
+                self._start(texts)
+                return
+
+            wait = self.estimated_wait(priority, deadline)
+            own = texts * self.seconds_per_text
+            if deadline is not None and now + wait + own > deadline:
+                self.counts['shed'] += 1
+                raise Overloaded(wait)
+
+            waiter = _Waiter((priority, deadline if deadline is not None else float('inf'), next(self.sequence)),
+                             texts, deadline)
+            if len(self.waiting) >= self.max_queue:
+                # Full: the lowest-ranked request makes room, unless that is the new one
+                worst = max(self.waiting) if self.waiting else None
+                if worst is None or not waiter < worst:
+                    self.counts['shed'] += 1
+                    raise Overloaded(wait)
+                self.waiting.remove(worst)
+                heapq.heapify(self.waiting)
+                worst.state = 'evicted'
+                self.condition.notify_all()
+            heapq.heappush(self.waiting, waiter)
+
+            while waiter.state == 'waiting':
+                timeout = None if deadline is None else deadline - time.perf_counter()
+                if timeout is not None and timeout <= 0:
+                    self.waiting.remove(waiter)
+                    heapq.heapify(self.waiting)
+                    waiter.state = 'expired'
+                    break
+                self.condition.wait(timeout)
+
+            if waiter.state == 'evicted':
+                self.counts['shed'] += 1
+                raise Overloaded(self.estimated_wait(priority, deadline))
+            if waiter.state == 'expired':
+                self.counts['expired'] += 1
+                raise DeadlineExceeded()
+
+    def _start(self, texts):
+        self.active += 1
+        self.active_texts += texts
+        self.counts['admitted'] += 1
+
+    def _release(self, texts, seconds):
+        with self.condition:
+            self.active -= 1
+            self.active_texts -= texts
+            smoothing = self.config['smoothing']
+            self.seconds_per_text += smoothing * (seconds / max(texts, 1) - self.seconds_per_text)
+
+            # Hand free slots to the best-ranked waiters; expired ones never reach the model
+            now = time.perf_counter()
+            while self.waiting and self.active < self.max_concurrent:
+                waiter = heapq.heappop(self.waiting)
+                if waiter.deadline is not None and now >= waiter.deadline:
+                    waiter.state = 'expired'
+                    continue
+                waiter.state = 'granted'
+                self._start(waiter.texts)
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {**self.counts, 'active': self.active, 'queued': len(self.waiting),
+                    'ms_per_text': round(self.seconds_per_text * 1000, 3)}
@@ -3,14 +3,43 @@ Production Inference API
 Flask server that loads trained model and serves predictions
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
 import logging
+import math
 import os
+import threading
+import time
 from datetime import datetime
-from functools import lru_cache
+from admission import (
+    PRIORITIES, AdmissionController, DeadlineExceeded, Overloaded,
+    load_admission_config, parse_deadline, parse_priority
+)
+from chat_stream import TRY_AGAIN_LATER, ChatBatcher, ChatSession, ConnectionLimit, load_chat_config
+from backends import BACKENDS, BackendSlot, LexicalBackend, build_result, create_backend
+from job_queue import JobQueue, JobWorkers, check_callback_url, load_jobs_config, validate_threshold
+from language_router import LanguageRouter, load_routing_config
+from memory_budget import load_memory_budget_config
+from metrics import (
+    CONTENT_TYPE, LENGTH_BUCKETS, REGISTRY, SIZE_BUCKETS,
+    Counter, Gauge, Histogram, process_memory, sampled
+)
+from settings import load_config_section
+from score_store import ScoreStore, load_score_store_config
+from simhash_cache import SimHashCache, load_simhash_config
+from streaming import NDJSONModerationStream, load_stream_config, queued_items
+from windowing import load_long_text_config
+
+# flask-sock is optional - without it the /moderate-chat WebSocket is not served
+try:
+    from flask_sock import Sock
+    from simple_websocket import ConnectionClosed
+    SOCK_AVAILABLE = True
+except ImportError:
+    SOCK_AVAILABLE = False
+
+# torch/transformers are imported by load_model (usually on a background
+# thread) so the server can bind its port before they finish importing
 
 # Configure logging
 logging.basicConfig(
@@ -22,112 +51,486 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)
 
-# Global variables
-model = None
-tokenizer = None
-device = None
 label_names = ['toxic', 'severe_toxic', 'obscene', 'threat', 'insult', 'identity_hate']
 
-def load_model(model_path='models/toxic-classifier'):
-    """Load trained model and tokenizer"""
-    global model, tokenizer, device
+# Any registered backend: transformer, quantized, early_exit, onnx, lexical, nlp, ensemble (see backends.py)
+MODEL_BACKEND = os.environ.get('MODEL_BACKEND', 'transformer')
+# fp32 by default; point at models/toxic-classifier-int8 to serve the quantized artifact
+MODEL_PATH = os.environ.get('MODEL_PATH', 'models/toxic-classifier')
+
+MAX_LENGTH = load_config_section('model', {'max_length': 256})['max_length']
+LONG_TEXT = load_long_text_config()
+STREAM_CONFIG = load_stream_config()
+CHAT_CONFIG = load_chat_config()
+# Memory-mapped reduced-precision weights for more workers per node (memory_budget.py prepare)
+MEMORY_BUDGET_CONFIG = load_memory_budget_config()
+
+# The backend serving traffic; POST /admin/load swaps in a new one without a restart
+backend_slot = BackendSlot()
+fallback_backend = LexicalBackend()
+swap_lock = threading.Lock()
+swap_status = {'state': 'idle'}
+# Unset: admin endpoints only answer requests from localhost
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+# Per-language backends in front of the main model (routing in config.yaml)
+ROUTING_CONFIG = load_routing_config()
+router = LanguageRouter(ROUTING_CONFIG) if ROUTING_CONFIG['enabled'] else None
+
+# Async jobs (POST /jobs) persisted in a local SQLite queue
+JOBS_CONFIG = load_jobs_config()
+job_queue = JobQueue(JOBS_CONFIG['db_path']) if JOBS_CONFIG['enabled'] else None
+
+# Chat messages from every /moderate-chat connection are batched together
+# (the lambda defers the lookup of moderate_batch, defined below)
+chat_batcher = ChatBatcher(lambda texts, threshold: moderate_batch(texts, threshold), CHAT_CONFIG) if SOCK_AVAILABLE else None
+# Each connection holds a request thread; serve.py lowers an unset limit to fit serving.request_threads
+chat_connections = ConnectionLimit(CHAT_CONFIG['max_connections'] or None)
+
+# Deadlines, priorities and load shedding in front of the model (/moderate, /batch-moderate)
+ADMISSION_CONFIG = load_admission_config()
+admission = AdmissionController(ADMISSION_CONFIG) if ADMISSION_CONFIG['enabled'] else None
+
+# Reuses model scores for exact and near-duplicate texts (spam waves)
+SIMHASH_CONFIG = load_simhash_config()
+score_cache = SimHashCache(
+    max_distance=SIMHASH_CONFIG['max_distance'],
+    max_size=SIMHASH_CONFIG['max_size'],
+    min_chars=SIMHASH_CONFIG['min_chars']
+) if SIMHASH_CONFIG['enabled'] else None
+
+# Scores shared by all workers and kept across restarts (SQLite, WAL mode)
+SCORE_STORE_CONFIG = load_score_store_config()
+score_store = ScoreStore(
+    SCORE_STORE_CONFIG['db_path'],
+    max_mb=SCORE_STORE_CONFIG['max_mb'],
+    evict_fraction=SCORE_STORE_CONFIG['evict_fraction'],
+    check_every=SCORE_STORE_CONFIG['check_every'],
+    hot_size=SCORE_STORE_CONFIG['hot_size'],
+    touch_every_seconds=SCORE_STORE_CONFIG['touch_every_seconds']
+) if SCORE_STORE_CONFIG['enabled'] else None
+
+# not_loaded -> loading -> loaded -> warming_up -> ready | failed (reported by /ready)
+model_state = 'not_loaded'
+
+# Per-request info logs are sampled; flagged warnings and errors are always logged
+LOG_SAMPLE_RATE = load_config_section('metrics', {'log_sample_rate': 0.01})['log_sample_rate']
+
+# Exposed on /metrics (Prometheus text format)
+REQUEST_SECONDS = Histogram('moderation_request_seconds', 'End-to-end request latency', ['endpoint'])
+STAGE_SECONDS = Histogram('moderation_stage_seconds', 'Time spent per stage (parse, tokenize, forward, postprocess)', ['stage'])
+BATCH_SIZE = Histogram('moderation_batch_size', 'Windows per model forward pass', buckets=SIZE_BUCKETS)
+SEQUENCE_LENGTH = Histogram('moderation_sequence_length', 'Padded tokens per model forward pass', buckets=LENGTH_BUCKETS)
+EXIT_LAYER = Histogram('moderation_exit_layer', 'Layer each window exited at (early_exit backend)', buckets=tuple(range(1, 25)))
+TEXTS_TOTAL = Counter('moderation_texts_total', 'Texts moderated by path (model, cache, store, fallback)', ['path'])
+CACHE_LOOKUPS = Counter(
+    'moderation_cache_lookups_total', 'Near-duplicate cache lookups by result', ['result'],
+    fn=lambda: {(key,): value for key, value in score_cache.counts.items()} if score_cache else {}
+)
+STORE_LOOKUPS = Counter(
+    'moderation_score_store_lookups_total', 'Persistent score store lookups by result', ['result'],
+    fn=lambda: {(key,): value for key, value in score_store.counts.items()} if score_store else {}
+)
+IN_FLIGHT = Gauge('moderation_in_flight_requests', 'Requests currently being handled')
+QUEUE_DEPTH = Gauge('moderation_queue_depth', 'Items waiting in internal queues', ['queue'],
+                    fn=lambda: {('stream',): queued_items(),
+                                **({('jobs',): job_queue.depth()} if job_queue else {}),
+                                **({('admission',): admission.depth()} if admission else {}),
+                                **({('chat',): chat_batcher.depth()} if chat_batcher else {})})
+ADMISSION_TOTAL = Counter(
+    'moderation_admission_total', 'Model requests by admission outcome (admitted, shed, expired)', ['outcome'],
+    fn=lambda: {(key,): value for key, value in admission.counts.items()} if admission else {}
+)
+ENSEMBLE_TOTAL = Counter(
+    'moderation_ensemble_total', 'Ensemble predictions by outcome (complete, partial, fallback)', ['outcome'],
+    fn=lambda: {(key,): value for key, value in active_ensemble().counts.items()} if active_ensemble() else {}
+)
+ENSEMBLE_MISSED = Counter(
+    'moderation_ensemble_member_missed_total', 'Fusions an ensemble member was left out of (budget, backlog or error)', ['member'],
+    fn=lambda: {(name,): value for name, value in active_ensemble().missed.items()} if active_ensemble() else {}
+)
+LANGUAGE_TEXTS = Counter('moderation_language_texts_total', 'Texts scored by detected language (routing only)', ['language'])
+ROUTE_SECONDS = Histogram('moderation_route_seconds', 'Scoring time per language route (routing only)', ['route'])
+PROCESS_MEMORY = Gauge('moderation_process_memory_bytes', 'Memory of this worker by kind (rss, pss, shared, private, anonymous)', ['kind'],
+                       fn=lambda: {(key[:-3],): int(value * 1024 * 1024) for key, value in (process_memory() or {}).items()})
+CHAT_CONNECTIONS = Gauge('moderation_chat_connections', 'Open /moderate-chat connections',
+                         fn=lambda: chat_connections.open)
+CHAT_REJECTED = Counter('moderation_chat_rejected_total', '/moderate-chat connections refused at the connection limit',
+                        fn=lambda: chat_connections.rejected)
+MODEL_READY = Gauge('moderation_model_ready', '1 once the model serves predictions, 0 while on the fallback',
+                    fn=lambda: 1 if model_ready() else 0)
+
+def active_ensemble():
+    """The serving backend if it is an ensemble, else None"""
+    backend = backend_slot.active
+    return backend if backend is not None and backend.kind == 'ensemble' else None
+
+def build_backend(kind=MODEL_BACKEND, model_path=MODEL_PATH, version=None):
+    """Create (not yet load) a backend with this server's inference settings"""
+    if kind in BACKENDS and not BACKENDS[kind].needs_model:
+        model_path = None
+    return create_backend(kind, model_path=model_path, version=version,
+                          max_length=MAX_LENGTH, long_text=LONG_TEXT,
+                          memory_budget=MEMORY_BUDGET_CONFIG['enabled'])
+
+def load_model(model_path=MODEL_PATH, warm_up=True, kind=MODEL_BACKEND):
+    """Load the startup backend (fp32 or int8 model by default), then warm it up"""
+    global model_state
     
+    model_state = 'loading'
+    start = time.time()
     try:
-        logger.info(f"🔄 Loading model from: {model_path}")
+        logger.info(f"🔄 Loading {kind} backend from: {model_path}")
         
-        # Check if model exists
-        if not os.path.exists(model_path):
+        # Check if model exists (lexical and nlp need none)
+        if kind in BACKENDS and BACKENDS[kind].needs_model and not os.path.exists(model_path):
             logger.error(f"❌ Model not found at: {model_path}")
             logger.info("💡 Please train the model first using: python train_model.py")
+            model_state = 'failed'
             return False
         
-        # Load tokenizer and model
-        tokenizer = AutoTokenizer.from_pretrained(model_path)
-        model = AutoModelForSequenceClassification.from_pretrained(model_path)
+        backend = build_backend(kind, model_path)
+        backend.load()
+        backend_slot.swap(backend)
+        if router:
+            router.load(build_backend)
+        if score_cache:
+            score_cache.clear()
         
-        # Set device
-        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        model.to(device)
-        model.eval()
+        model_state = 'loaded'
+        info = backend.info()
+        logger.info(f"✅ Model loaded successfully on {info['device']}{' (int8)' if info['quantized'] else ''} "
+                    f"in {time.time() - start:.1f}s")
         
-        logger.info(f"✅ Model loaded successfully on {device}")
-        return True
+        return warm_up_model() if warm_up else True
         
     except Exception as e:
+        model_state = 'failed'
         logger.error(f"❌ Error loading model: {str(e)}")
         return False
 
-@lru_cache(maxsize=1000)
-def predict_cached(text, threshold):
-    """Cached prediction for frequently seen texts"""
-    return predict_text(text, threshold)
+def warm_up_model():
+    """Run warm-up inference so the first real requests don't pay first-call costs"""
+    global model_state
+    
+    model_state = 'warming_up'
+    try:
+        start = time.time()
+        backend_slot.active.warm_up()
+        if router:
+            router.warm_up()
+        warm_score_store(backend_slot.active)
+        model_state = 'ready'
+        logger.info(f"🔥 Warm-up finished in {time.time() - start:.1f}s - serving model predictions")
+        log_memory()
+        return True
+        
+    except Exception as e:
+        model_state = 'failed'
+        logger.error(f"❌ Warm-up failed: {str(e)}")
+        return False
 
-def predict_text(text, threshold=0.7):
+def warm_score_store(backend):
+    """Load the backend's most-hit stored scores into memory (score_store.warm_on_start)"""
+    if score_store and SCORE_STORE_CONFIG['warm_on_start']:
+        count = score_store.warm(score_store.version_for(backend))
+        logger.info(f"🗄️ Loaded {count} stored scores into memory")
+
+def log_memory():
+    """Log this worker's memory after loading, against memory_budget.target_rss_mb"""
+    memory = process_memory()
+    if memory is None:
+        return
+    target = MEMORY_BUDGET_CONFIG['target_rss_mb']
+    message = (f"{memory['rss_mb']:.0f} MB RSS ({memory['shared_mb']:.0f} MB shared, "
+               f"{memory['private_mb']:.0f} MB private), target {target} MB")
+    if memory['rss_mb'] > target:
+        logger.warning(f"⚠️ Worker {os.getpid()} memory over budget: {message}")
+    else:
+        logger.info(f"🧠 Worker {os.getpid()} memory: {message}")
+
+def start_background_load(model_path=MODEL_PATH):
+    """Load and warm up the model without blocking the server from starting"""
+    thread = threading.Thread(target=load_model, args=(model_path,), daemon=True)
+    thread.start()
+    return thread
+
+def hot_swap(kind, model_path, version=None):
     """
-    Predict toxicity for given text
+    Load and warm up a new backend next to the active one, then switch to it
     
-    Returns:
-        dict with predictions and confidence scores
+    Requests already running on the old backend finish on it; it is
+    unloaded when the last of them is done (see BackendSlot). Runs on a
+    background thread started by /admin/load, which holds swap_lock.
     """
+    global model_state
+    
+    start = time.time()
     try:
-        # Tokenize
-        encodings = tokenizer(
-            text,
-            truncation=True,
-            padding=True,
-            max_length=256,
-            return_tensors='pt'
-        )
+        if BACKENDS[kind].needs_model and not os.path.exists(model_path):
+            raise FileNotFoundError(f"Model not found at: {model_path}")
         
-        # Move to device
-        input_ids = encodings['input_ids'].to(device)
-        attention_mask = encodings['attention_mask'].to(device)
+        backend = build_backend(kind, model_path, version)
+        swap_status.update(state='loading', version=backend.version)
+        backend.load()
         
-        # Predict
-        with torch.no_grad():
-            outputs = model(input_ids=input_ids, attention_mask=attention_mask)
-            logits = outputs.logits
-            predictions = torch.sigmoid(logits).cpu().numpy()[0]
+        swap_status['state'] = 'warming_up'
+        backend.warm_up()
+        warm_score_store(backend)
         
-        # Parse results
-        results = {}
-        flagged_labels = []
-        max_confidence = 0.0
+        old = backend_slot.swap(backend)
+        # Retrained weights in the same directory keep the version name, so old scores must go
+        if score_cache:
+            score_cache.clear()
+        model_state = 'ready'
+        swap_status.update(state='ready', seconds=round(time.time() - start, 2))
+        logger.info(f"🔀 Now serving {backend.version} (loaded in {time.time() - start:.1f}s"
+                    f"{f', replaced {old.version}' if old else ''})")
+                    
+    except Exception as e:
+        swap_status.update(state='failed', error=str(e))
+        logger.error(f"❌ Hot swap failed, previous backend still serving: {str(e)}")
         
-        for i, label in enumerate(label_names):
-            score = float(predictions[i])
-            results[label] = score
+    finally:
+        swap_lock.release()
+
+def start_job_workers():
+    """Drain the async job queue in this process (model predictions only, never the fallback)"""
+    if not job_queue:
+        return None
+    return JobWorkers(job_queue, predict_batch, model_ready, JOBS_CONFIG).start()
+
+def model_ready():
+    """Serve model predictions only once the model has loaded and warmed up"""
+    return model_state == 'ready'
+
+def predict_text(text, threshold=0.7):
+    """
+    Predict toxicity for given text
+    
+    Returns:
+        dict with predictions and confidence scores
+    """
+    return predict_batch([text], threshold)[0]
+
+def predict_batch(texts, threshold=0.7):
+    """
+    Predict toxicity for many texts in length-sorted batches
+    
+    Long texts are split into overlapping windows (inference.long_text in
+    config.yaml) so content past the first max_length tokens is still seen.
+    Texts whose SimHash is close to a recently scored text reuse its scores.
+    """
+    try:
+        # One backend for the whole batch, even if a hot swap lands mid-request
+        with backend_slot.use() as backend:
+            scores = [None] * len(texts)
+            # Texts an ensemble scored without all its members; never cached
+            partial = set()
+            postprocess_seconds = 0.0
             
-            if score >= threshold:
-                flagged_labels.append(label)
-                max_confidence = max(max_confidence, score)
-        
-        is_flagged = len(flagged_labels) > 0
-        
-        return {
-            'flagged': is_flagged,
-            'reason': flagged_labels[0] if flagged_labels else None,
-            'flagged_categories': flagged_labels,
-            'confidence': max_confidence,
-            'scores': results
-        }
+            # Route first: cached and stored scores are keyed by the backend that produced them
+            for language, positions in route_texts(texts).items():
+                scorer = router.backends[language] if language else backend
+                routed, routed_partial, seconds = score_routed(scorer, [texts[p] for p in positions], language)
+                for p, row in zip(positions, routed):
+                    scores[p] = row
+                partial.update(positions[i] for i in routed_partial)
+                postprocess_seconds += seconds
+        
+        start = time.perf_counter()
+        results = [build_result(row, threshold) for row in scores]
+        for i in partial:
+            results[i]['partial'] = True
+        STAGE_SECONDS.observe(postprocess_seconds + time.perf_counter() - start, stage='postprocess')
+        return results
         
     except Exception as e:
         logger.error(f"Prediction error: {str(e)}")
         raise
 
+def score_routed(scorer, texts, route=None):
+    """
+    Scores from one backend for the texts routed to it
+    
+    The near-duplicate cache is checked first, then the persistent store,
+    both under this backend's version, and only the rest go to the model.
+    
+    Returns:
+        (scores, positions scored partially, aggregation seconds)
+    """
+    # Cached scores carry the version that produced them; other versions are misses
+    cached = [score_cache.get(text) if score_cache else None for text in texts]
+    scores = [entry[1] if entry and entry[0] == scorer.version else None for entry in cached]
+    missing = [i for i, row in enumerate(scores) if row is None]
+    TEXTS_TOTAL.inc(len(texts) - len(missing), path='cache')
+    
+    # Second level: exact texts scored by any worker, before or since the last restart
+    store_version = score_store.version_for(scorer) if score_store else None
+    # A backend swapped out meanwhile must not refill the cache hot_swap cleared
+    cache = score_cache if score_cache and scorer not in backend_slot.retired else None
+    if missing and score_store:
+        stored = score_store.get_many(store_version, [texts[i] for i in missing])
+        for i, row in zip(missing, stored):
+            if row is not None:
+                scores[i] = row
+                if cache:
+                    cache.put(texts[i], (scorer.version, row))
+        TEXTS_TOTAL.inc(sum(1 for row in stored if row is not None), path='store')
+        missing = [i for i in missing if scores[i] is None]
+    
+    partial = set()
+    if not missing:
+        return scores, partial, 0.0
+    
+    TEXTS_TOTAL.inc(len(missing), path='model')
+    start = time.perf_counter()
+    stats = {}
+    fresh = scorer.predict_scores([texts[i] for i in missing], stats=stats)
+    if router:
+        ROUTE_SECONDS.observe(time.perf_counter() - start, route=route or 'default')
+    postprocess_seconds = record_model_stats(stats)
+    # The swap may have landed during the forward pass
+    cache = score_cache if score_cache and scorer not in backend_slot.retired else None
+    
+    for i, row in zip(missing, fresh):
+        scores[i] = row
+        if stats.get('partial'):
+            partial.add(i)
+        elif cache:
+            cache.put(texts[i], (scorer.version, row))
+    
+    if score_store:
+        complete = [i for i in missing if i not in partial]
+        score_store.put_many(store_version, [texts[i] for i in complete], [scores[i] for i in complete])
+    return scores, partial, postprocess_seconds
+
+def route_texts(texts):
+    """Group positions by language route; None is the main model (all texts without routing)"""
+    if not router:
+        return {None: list(range(len(texts)))}
+    
+    start = time.perf_counter()
+    groups, languages = router.split(texts)
+    STAGE_SECONDS.observe(time.perf_counter() - start, stage='detect')
+    for language in languages:
+        LANGUAGE_TEXTS.inc(language=language)
+    return groups
+
+def record_model_stats(stats):
+    """Record stage timings and batch shapes from predict_scores; returns aggregation seconds"""
+    # Only the transformer backends (and ensembles of them) report per-stage timings
+    if 'tokenize_seconds' not in stats:
+        return 0.0
+    STAGE_SECONDS.observe(stats['tokenize_seconds'], stage='tokenize')
+    STAGE_SECONDS.observe(stats['forward_seconds'], stage='forward')
+    for windows, length in stats['batch_shapes']:
+        BATCH_SIZE.observe(windows)
+        SEQUENCE_LENGTH.observe(length)
+    for layer in stats.get('exit_layers', ()):
+        EXIT_LAYER.observe(layer)
+    return stats['aggregate_seconds']
+
+def predict_lexical(texts, threshold=0.7):
+    """Keyword-lexicon answers used while the model is loading (or failed to load)"""
+    results = [build_result(row, threshold) for row in fallback_backend.predict_scores(texts)]
+    for result in results:
+        result['degraded'] = True
+    return results
+
+def moderate_batch(texts, threshold=0.7):
+    """Model predictions when ready, lexical fallback with a degraded flag otherwise"""
+    if not model_ready():
+        TEXTS_TOTAL.inc(len(texts), path='fallback')
+        return predict_lexical(texts, threshold)
+    
+    results = predict_batch(texts, threshold)
+    for result in results:
+        result['degraded'] = False
+    return results
+
+def moderate_text(text, threshold=0.7):
+    """Moderate a single text (see moderate_batch)"""
+    return moderate_batch([text], threshold)[0]
+
+def admission_request(data):
+    """(deadline, priority) of the current request; ValueError if either is malformed"""
+    deadline = parse_deadline(request.headers, data, g.request_start, ADMISSION_CONFIG['default_deadline_ms'])
+    return deadline, parse_priority(request.headers, data)
+
+def moderate_admitted(texts, threshold, deadline=None, priority=PRIORITIES['normal']):
+    """
+    moderate_batch behind admission control
+    
+    Raises Overloaded or DeadlineExceeded instead of running the model when
+    the request can't finish in time. The lexical fallback is cheap and
+    skips the queue.
+    """
+    if not admission or not model_ready():
+        return moderate_batch(texts, threshold)
+    
+    with admission.admit(len(texts), deadline, priority):
+        return moderate_batch(texts, threshold)
+
+def overloaded_response(error):
+    """503 with Retry-After - answered at once so the caller can fail open"""
+    response = jsonify({
+        'error': 'overloaded',
+        'overloaded': True,
+        'flagged': False,
+        'retry_after_ms': round(error.retry_after * 1000)
+    })
+    response.headers['Retry-After'] = str(max(1, math.ceil(error.retry_after)))
+    return response, 503
+
+def expired_response():
+    """504 - the deadline passed before the request reached the model"""
+    return jsonify({'error': 'deadline exceeded', 'expired': True, 'flagged': False}), 504
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    IN_FLIGHT.inc()
+
+@app.teardown_request
+def record_request_time(exc=None):
+    # Runs after streamed responses finish, so /moderate-stream counts its whole body
+    if 'request_start' in g:
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, endpoint=request.endpoint or 'unknown')
+        IN_FLIGHT.dec()
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    model_loaded = model is not None and tokenizer is not None
+    backend = backend_slot.active
+    model_loaded = backend is not None
     
     return jsonify({
         'status': 'healthy' if model_loaded else 'unhealthy',
         'model_loaded': model_loaded,
-        'device': str(device) if device else None,
+        'model_state': model_state,
+        'degraded': not model_ready(),
+        'device': backend.info()['device'] if backend else None,
+        'model_version': backend.version if backend else None,
         'timestamp': datetime.now().isoformat()
     })
 
+@app.route('/live', methods=['GET'])
+def liveness():
+    """Liveness probe - the worker process is up and serving HTTP"""
+    return jsonify({'status': 'alive', 'pid': os.getpid()})
+
+@app.route('/ready', methods=['GET'])
+def readiness():
+    """Readiness probe - 503 until this worker's model has loaded and warmed up"""
+    ready = model_state == 'ready'
+    
+    return jsonify({
+        'ready': ready,
+        'model_state': model_state,
+        'pid': os.getpid()
+    }), 200 if ready else 503
+
 @app.route('/moderate', methods=['POST'])
 def moderate():
     """
@@ -136,7 +539,9 @@ def moderate():
     Request:
     {
         "text": "Text to moderate",
-        "threshold": 0.7  (optional)
+        "threshold": 0.7,  (optional)
+        "deadline_ms": 4500,  (optional, or X-Deadline-Ms header)
+        "priority": "normal"  (optional: high, normal, low, or X-Priority header)
     }
     
     Response:
@@ -151,17 +556,15 @@ def moderate():
             ...
         }
     }
+    
+    503 {"overloaded": true, "retry_after_ms": ...} when shed under load,
+    504 {"expired": true} when the deadline passed while queued.
     """
     try:
-        # Validate model is loaded
-        if model is None or tokenizer is None:
-            return jsonify({
-                'error': 'Model not loaded',
-                'flagged': False
-            }), 503
-        
         # Parse request
+        start = time.perf_counter()
         data = request.get_json()
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage='parse')
         
         if not data or 'text' not in data:
             return jsonify({
@@ -171,6 +574,11 @@ def moderate():
         text = data.get('text', '').strip()
         threshold = data.get('threshold', 0.7)
         
+        try:
+            deadline, priority = admission_request(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         # Empty text
         if not text:
             return jsonify({
@@ -181,18 +589,24 @@ def moderate():
                 'scores': {}
             })
         
-        logger.info(f"📝 Moderating: {text[:50]}...")
+        log_request = sampled(LOG_SAMPLE_RATE)
+        if log_request:
+            logger.info(f"📝 Moderating: {text[:50]}...")
         
-        # Predict
-        result = predict_text(text, threshold)
+        # Predict (lexical fallback with degraded=true until the model is ready)
+        result = moderate_admitted([text], threshold, deadline, priority)[0]
         
         if result['flagged']:
             logger.warning(f"🚫 FLAGGED: {result['reason']} (confidence: {result['confidence']:.2f})")
-        else:
+        elif log_request:
             logger.info("✅ Content approved")
         
         return jsonify(result)
         
+    except Overloaded as e:
+        return overloaded_response(e)
+    except DeadlineExceeded:
+        return expired_response()
     except Exception as e:
         logger.error(f"❌ Moderation error: {str(e)}")
         return jsonify({
@@ -208,28 +622,32 @@ def batch_moderate():
     Request:
     {
         "texts": ["text1", "text2", ...],
-        "threshold": 0.7
+        "threshold": 0.7,
+        "deadline_ms": 4500,  (optional, as for /moderate)
+        "priority": "normal"
     }
     """
     try:
-        if model is None or tokenizer is None:
-            return jsonify({
-                'error': 'Model not loaded'
-            }), 503
-        
+        start = time.perf_counter()
         data = request.get_json()
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage='parse')
         texts = data.get('texts', [])
         threshold = data.get('threshold', 0.7)
         
         if not texts:
             return jsonify({'error': 'Missing texts field'}), 400
+        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            return jsonify({'error': 'Every text must be a string'}), 400
+        
+        try:
+            deadline, priority = admission_request(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         logger.info(f"📦 Batch moderating {len(texts)} texts")
         
-        results = []
-        for text in texts:
-            result = predict_text(text, threshold)
-            results.append(result)
+        # One batched pass over all texts (and all windows of long texts)
+        results = moderate_admitted(texts, threshold, deadline, priority)
         
         flagged_count = sum(1 for r in results if r['flagged'])
         
@@ -240,50 +658,270 @@ def batch_moderate():
             'flagged_percentage': (flagged_count / len(results) * 100) if results else 0
         })
         
+    except Overloaded as e:
+        return overloaded_response(e)
+    except DeadlineExceeded:
+        return expired_response()
     except Exception as e:
         logger.error(f"Batch moderation error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/moderate-stream', methods=['POST'])
+def moderate_stream():
+    """
+    Streaming moderation endpoint (NDJSON in, NDJSON out)
+    
+    Request body, one JSON object per line (read incrementally):
+    {"id": "post-1", "text": "Text to moderate"}
+    {"id": "post-2", "text": "..."}
+    
+    Response, one line per input line in the same order, then a summary
+    (line is the input line number; id is the client's id, null if it sent none):
+    {"line": 1, "id": "post-1", "flagged": false, "scores": {...}, ...}
+    {"line": 2, "id": null, "error": "Invalid JSON"}
+    {"done": true, "total": 1, "flagged_count": 0}
+    
+    Results are written while the body is still being read, so clients must
+    read the response as they upload (full duplex).
+    
+    Query: ?threshold=0.7 (optional)
+    """
+    threshold = request.args.get('threshold', 0.7, type=float)
+    logger.info("🌊 Streaming moderation started")
+    
+    results = NDJSONModerationStream(request.stream, moderate_batch, threshold, STREAM_CONFIG)
+    return Response(stream_with_context(iter(results)), mimetype='application/x-ndjson')
+
+if SOCK_AVAILABLE:
+    # The WebSocket server counts a frame's bytes as they arrive and closes the
+    # connection (1009, message too big) past the limit, before buffering it whole
+    app.config['SOCK_SERVER_OPTIONS'] = {'max_message_size': CHAT_CONFIG['max_frame_bytes']}
+    sock = Sock(app)
+    
+    @sock.route('/moderate-chat')
+    def moderate_chat(ws):
+        """
+        Chat moderation WebSocket - one long-lived connection per chat server
+        
+        Send (one object or an array per frame):
+        {"id": "msg-1", "conversation": "chat-42", "text": "Message text"}
+        
+        Receive (an array per frame, as batches complete):
+        [{"id": "msg-1", "conversation": "chat-42", "flagged": false, "reason": null,
+          "flagged_categories": [], "confidence": 0.0, "degraded": false, "context": 2}]
+        
+        Query: ?threshold=0.7&scores=1 (optional; scores adds per-label scores)
+        
+        Above chat.max_connections the connection is closed with code 1013
+        (try again later) so it doesn't hold a request thread.
+        """
+        if not chat_connections.acquire():
+            logger.warning(f"⚠️ Chat connection refused: {chat_connections.limit} already open in this worker")
+            ws.close(reason=TRY_AGAIN_LATER, message='Too many chat connections, retry later')
+            return
+        
+        session = ChatSession(
+            ws.send,
+            chat_batcher,
+            threshold=request.args.get('threshold', 0.7, type=float),
+            include_scores=request.args.get('scores', '0') not in ('0', 'false')
+        )
+        logger.info("💬 Chat moderation connection opened")
+        try:
+            while not session.closed:
+                session.receive(ws.receive())
+        except ConnectionClosed:
+            pass
+        finally:
+            session.close()
+            chat_connections.release()
+            logger.info(f"💬 Chat moderation connection closed after {session.received} messages")
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """
+    Asynchronous moderation: queue texts and return a job id at once
+    
+    Request:
+    {
+        "texts": ["text1", "text2", ...]       (or "items": [{"id": "post-1", "text": "..."}, ...])
+        "threshold": 0.7,                     (optional)
+        "callback_url": "https://.../hook"    (optional, receives the finished job as JSON)
+    }
+    
+    Response (202): {"job_id": "...", "status": "queued", "total": 2, "status_url": "/jobs/<job_id>"}
+    """
+    if not job_queue:
+        return jsonify({'error': 'Async jobs are disabled'}), 404
+    
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    entries = data['items'] if 'items' in data else (data.get('texts') or [])
+    if not isinstance(entries, list):
+        return jsonify({'error': f"{'items' if 'items' in data else 'texts'} must be a list"}), 400
+    if 'items' in data:
+        if not all(isinstance(item, dict) for item in entries):
+            return jsonify({'error': 'Every item must be an object with a text field'}), 400
+        items = [(item.get('id', i), item.get('text')) for i, item in enumerate(entries)]
+    else:
+        items = list(enumerate(entries))
+    threshold = data.get('threshold', 0.7)
+    callback_url = data.get('callback_url')
+    
+    if not items:
+        return jsonify({'error': 'Missing texts field'}), 400
+    if len(items) > JOBS_CONFIG['max_texts']:
+        return jsonify({'error': f"At most {JOBS_CONFIG['max_texts']} texts per job"}), 400
+    if not all(isinstance(text, str) for _, text in items):
+        return jsonify({'error': 'Every text must be a string'}), 400
+    try:
+        threshold = validate_threshold(threshold)
+        if callback_url is not None:
+            check_callback_url(callback_url, JOBS_CONFIG['callback_allowed_hosts'], JOBS_CONFIG['callback_allow_private'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    job_id = job_queue.submit(items, threshold, callback_url)
+    logger.info(f"🗂️ Job {job_id} queued ({len(items)} texts)")
+    
+    return jsonify({
+        'job_id': job_id,
+        'status': 'queued',
+        'total': len(items),
+        'status_url': f'/jobs/{job_id}'
+    }), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Job progress; results (in submission order) once status is done. ?results=0 omits them"""
+    if not job_queue:
+        return jsonify({'error': 'Async jobs are disabled'}), 404
+    
+    status = job_queue.get(job_id, include_results=request.args.get('results', '1') != '0')
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(status)
+
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    """Near-duplicate cache and persistent score store hit rates"""
+    stats = {'enabled': True, **score_cache.stats()} if score_cache else {'enabled': False}
+    if score_store:
+        stats['store'] = score_store.stats()
+    return jsonify(stats)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
 @app.route('/info', methods=['GET'])
 def model_info():
     """Get model information"""
+    backend = backend_slot.active
+    info = backend.info() if backend else {'backend': MODEL_BACKEND, 'model_path': MODEL_PATH,
+                                           'version': None, 'device': None, 'quantized': False}
+    
     return jsonify({
-        'model_loaded': model is not None,
+        'model_loaded': backend is not None,
         'labels': label_names,
-        'device': str(device) if device else None,
-        'model_path': 'models/toxic-classifier'
+        'routes': {language: b.version for language, b in router.backends.items()} if router else {},
+        'memory_budget': MEMORY_BUDGET_CONFIG['enabled'],
+        'memory': process_memory(),
+        **info
+    })
+
+def admin_allowed():
+    """X-Admin-Token must match ADMIN_TOKEN; without one, only localhost may call admin endpoints"""
+    if ADMIN_TOKEN:
+        return request.headers.get('X-Admin-Token') == ADMIN_TOKEN
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+@app.route('/admin/load', methods=['POST'])
+def admin_load():
+    """
+    Hot-swap the serving backend without a restart
+    
+    Request:
+    {
+        "backend": "quantized",                        (optional, default MODEL_BACKEND)
+        "model_path": "models/toxic-classifier-int8",  (optional, default MODEL_PATH)
+        "version": "int8-2024-06-01"                   (optional label for /info and logs)
+    }
+    
+    Returns 202 at once; the new backend loads and warms up in the
+    background while the current one keeps serving. Poll /admin/backend.
+    """
+    if not admin_allowed():
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    kind = data.get('backend', MODEL_BACKEND)
+    
+    if kind not in BACKENDS:
+        return jsonify({'error': f"Unknown backend: {kind}", 'backends': list(BACKENDS)}), 400
+    model_path = data.get('model_path', MODEL_PATH) if BACKENDS[kind].needs_model else None
+    
+    if not swap_lock.acquire(blocking=False):
+        return jsonify({'error': 'A backend is already loading', **swap_status}), 409
+    
+    swap_status.clear()
+    swap_status.update(state='starting', backend=kind, model_path=model_path)
+    response = {'accepted': True, **swap_status}
+    logger.info(f"🔀 Hot swap requested: {kind} from {model_path}")
+    threading.Thread(target=hot_swap, args=(kind, model_path, data.get('version')), daemon=True).start()
+    
+    return jsonify(response), 202
+
+@app.route('/admin/backend', methods=['GET'])
+def admin_backend():
+    """Active backend, in-flight requests per backend and the last hot swap"""
+    if not admin_allowed():
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    backend = backend_slot.active
+    return jsonify({
+        'active': backend.info() if backend else None,
+        'slot': backend_slot.stats(),
+        'swap': swap_status,
+        'backends': list(BACKENDS)
     })
 
 if __name__ == '__main__':
     logger.info("🚀 Starting ML Moderation Service...")
     
-    # Load model
-    model_loaded = load_model()
-    
-    if not model_loaded:
-        logger.error("="*60)
-        logger.error("❌ FAILED TO LOAD MODEL")
-        logger.error("="*60)
-        logger.error("")
-        logger.error("Please train the model first:")
-        logger.error("  1. Collect data: python data_collector.py")
-        logger.error("  2. Train model: python train_model.py")
-        logger.error("  3. Start server: python app.py")
-        logger.error("")
-        logger.error("="*60)
-    else:
-        logger.info("="*60)
-        logger.info("✅ ML Moderation Service Ready!")
-        logger.info("="*60)
-        logger.info("")
-        logger.info("API Endpoints:")
-        logger.info("  GET  /health          - Health check")
-        logger.info("  POST /moderate        - Moderate single text")
-        logger.info("  POST /batch-moderate  - Moderate multiple texts")
-        logger.info("  GET  /info            - Model information")
-        logger.info("")
-        logger.info("Starting server on http://0.0.0.0:5001")
-        logger.info("="*60)
+    # Load and warm up the model in the background; until it is ready,
+    # requests are answered by the keyword lexicon with "degraded": true
+    start_background_load()
+    start_job_workers()
+    
+    logger.info("="*60)
+    logger.info("✅ ML Moderation Service listening (model loading in background)")
+    logger.info("="*60)
+    logger.info("")
+    logger.info("API Endpoints:")
+    logger.info("  GET  /health          - Health check")
+    logger.info("  GET  /live, /ready    - Liveness / readiness probes")
+    logger.info("  POST /moderate        - Moderate single text")
+    logger.info("  POST /batch-moderate  - Moderate multiple texts")
+    logger.info("  POST /moderate-stream - Moderate NDJSON stream")
+    if SOCK_AVAILABLE:
+        logger.info("  WS   /moderate-chat   - Moderate chat messages over a WebSocket")
+    logger.info("  POST /jobs            - Queue texts for async moderation")
+    logger.info("  GET  /jobs/<id>       - Async job status and results")
+    logger.info("  GET  /cache-stats     - Near-duplicate cache and score store stats")
+    logger.info("  GET  /metrics         - Prometheus metrics")
+    logger.info("  GET  /info            - Model information")
+    logger.info("  POST /admin/load      - Hot-swap the model backend")
+    logger.info("  GET  /admin/backend   - Active backend and swap status")
+    logger.info("")
+    logger.info("If the model fails to load, train it first:")
+    logger.info("  1. Collect data: python data_collector.py")
+    logger.info("  2. Train model: python train_model.py")
+    logger.info("")
+    logger.info("Starting server on http://0.0.0.0:5001")
+    logger.info("="*60)
     
     # Start Flask server
     app.run(host='0.0.0.0', port=5001, debug=False)
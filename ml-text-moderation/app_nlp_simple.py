@@ -6,7 +6,11 @@ Fast and lightweight - no heavy models needed
 
 from flask import Flask, request, jsonify
 from flask_cors import CORS
+import os
 import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from lexicon import KeywordMatcher
 
 app = Flask(__name__)
 CORS(app)
@@ -37,50 +41,52 @@ TOXIC_PATTERNS = {
         'maar', 'qatal', 'maut', 'dhoka', 'bandook', 'hamla', 'khudkushi'
     ]
 }
+TOXIC_MATCHER = KeywordMatcher(TOXIC_PATTERNS)
 
-def get_sentiment_score(text):
-    """Get sentiment polarity using NLP (-1 to 1)"""
-    if not NLP_AVAILABLE:
-        return 0.0
-    
-    try:
-        blob = TextBlob(text)
-        return blob.sentiment.polarity
-    except:
-        return 0.0
+# Batches at least this large are spread across a process pool
+POOL_MIN_BATCH = int(os.environ.get('NLP_POOL_MIN_BATCH', 64))
+POOL_WORKERS = int(os.environ.get('NLP_POOL_WORKERS', os.cpu_count() or 1))
+_pool = None
+_pool_lock = threading.Lock()
 
-def get_subjectivity_score(text):
-    """Get subjectivity (0=objective, 1=subjective)"""
-    if not NLP_AVAILABLE:
-        return 0.5
-    
-    try:
-        blob = TextBlob(text)
-        return blob.sentiment.subjectivity
-    except:
-        return 0.5
+def extract_features(text):
+    """
+    Compute all per-text features in one step
 
-def count_toxic_words(text):
-    """Count toxic keywords in text"""
-    text_lower = text.lower()
-    
-    severe = sum(1 for word in TOXIC_PATTERNS['severe'] if word in text_lower)
-    moderate = sum(1 for word in TOXIC_PATTERNS['moderate'] if word in text_lower)
-    violence = sum(1 for word in TOXIC_PATTERNS['violence'] if word in text_lower)
-    
-    return severe, moderate, violence
+    Builds a single TextBlob for polarity (-1 to 1) and subjectivity
+    (0=objective, 1=subjective) and runs one lexicon pass for the counts.
+    """
+    polarity, subjectivity = 0.0, 0.5
+    
+    if NLP_AVAILABLE:
+        try:
+            sentiment = TextBlob(text).sentiment
+            polarity, subjectivity = sentiment.polarity, sentiment.subjectivity
+        except Exception:
+            pass
+    
+    counts = TOXIC_MATCHER.count(text)
+    
+    return {
+        'polarity': polarity,
+        'subjectivity': subjectivity,
+        'severe': counts['severe'],
+        'moderate': counts['moderate'],
+        'violence': counts['violence']
+    }
 
 def analyze_text_with_nlp(text):
     """NLP-enhanced text analysis"""
     if not text or len(text.strip()) < 2:
-        return False, 0.0, {}
+        return False, 0.0, {}, {}
     
-    # Get NLP features
-    sentiment = get_sentiment_score(text)
-    subjectivity = get_subjectivity_score(text)
-    
-    # Get pattern matches
-    severe_count, moderate_count, violence_count = count_toxic_words(text)
+    # Get NLP features and pattern matches
+    features = extract_features(text)
+    sentiment = features['polarity']
+    subjectivity = features['subjectivity']
+    severe_count = features['severe']
+    moderate_count = features['moderate']
+    violence_count = features['violence']
     
     # Calculate toxicity using NLP + patterns
     pattern_score = (severe_count * 0.9) + (moderate_count * 0.5) + (violence_count * 0.95)
@@ -115,6 +121,28 @@ def analyze_text_with_nlp(text):
     
     return is_toxic, confidence, labels, nlp_info
 
+def analyze_batch(texts):
+    """
+    Analyze many texts, spreading large batches across a process pool
+    
+    TextBlob is pure Python, so threads don't help; below POOL_MIN_BATCH
+    the pool's pickling overhead outweighs the parallelism.
+    """
+    if len(texts) < POOL_MIN_BATCH or POOL_WORKERS < 2:
+        return [analyze_text_with_nlp(text) for text in texts]
+    
+    chunksize = max(1, len(texts) // (POOL_WORKERS * 4))
+    return list(get_pool().map(analyze_text_with_nlp, texts, chunksize=chunksize))
+
+def get_pool():
+    """Create the worker pool on first use"""
+    global _pool
+    
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=POOL_WORKERS)
+        return _pool
+
 @app.route('/health', methods=['GET'])
 def health():
     return jsonify({
@@ -155,8 +183,7 @@ def batch_moderate():
         texts = data.get('texts', [])
         
         results = []
-        for text in texts:
-            is_toxic, confidence, labels, nlp_info = analyze_text_with_nlp(text)
+        for text, (is_toxic, confidence, labels, nlp_info) in zip(texts, analyze_batch(texts)):
             results.append({
                 'text': text,
                 'is_toxic': is_toxic,
@@ -180,9 +207,10 @@ def analyze():
         if not text:
             return jsonify({'error': 'No text provided'}), 400
         
-        sentiment = get_sentiment_score(text)
-        subjectivity = get_subjectivity_score(text)
-        severe, moderate, violence = count_toxic_words(text)
+        features = extract_features(text)
+        sentiment = features['polarity']
+        subjectivity = features['subjectivity']
+        severe, moderate, violence = features['severe'], features['moderate'], features['violence']
         
         return jsonify({
             'text': text,
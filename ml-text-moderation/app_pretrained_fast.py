@@ -6,53 +6,97 @@ Trained on millions of comments - NO TRAINING NEEDED!
 
 from flask import Flask, request, jsonify
 from flask_cors import CORS
+import threading
+import time
 import warnings
 warnings.filterwarnings('ignore')
+from lexicon import KeywordMatcher
+from cascade import CascadeModerator, load_cascade_config
+from inference_engine import InferenceEngine
+from windowing import load_long_text_config
 
 app = Flask(__name__)
 CORS(app)
 
-print("🔄 Loading pre-trained ML model...")
-print("⏳ First time will download ~250MB...")
-
-# Try to load pre-trained model
+# Model loads in a background thread so Flask binds its port immediately;
+# until it is ready, requests get the keyword fallback with "degraded": true
 MODEL_LOADED = False
 classifier = None
+# Scores every 512-token window of long texts (used when long_text is enabled)
+engine = None
+model_loaded_event = threading.Event()
+
+LONG_TEXT = load_long_text_config()
+# Representative post lengths for the warm-up pass (words for the pipeline, tokens for the engine)
+# Representative post lengths (in words) for the warm-up pass
+WARMUP_LENGTHS = [8, 32, 128, 400]
 
-try:
-    from transformers import pipeline
+def load_pretrained_model():
+    """Load toxic-bert (safetensors, memory-mapped when available) and warm it up"""
+    global classifier, engine, MODEL_LOADED
+    
+    print("🔄 Loading pre-trained ML model in background...")
+    print("⏳ First time will download ~250MB...")
+    start = time.time()
     
-    # This model is trained on 200k+ toxic comments
-    # NO TRAINING NEEDED - Ready to use!
-    classifier = pipeline(
-        "text-classification",
-        model="unitary/toxic-bert",
-        device=-1,  # CPU
-        top_k=None
-    )
-    MODEL_LOADED = True
-    print("✅ Pre-trained ML model loaded successfully!")
-    print("📊 Trained on 200,000+ labeled comments")
+    try:
+        from transformers import pipeline
+        
+        # This model is trained on 200k+ toxic comments
+        # NO TRAINING NEEDED - Ready to use!
+        pipe = pipeline(
+            "text-classification",
+            model="unitary/toxic-bert",
+            device=-1,  # CPU
+            top_k=None,
+            model_kwargs={'low_cpu_mem_usage': True}
+        )
+        
+        engine = InferenceEngine.from_model(pipe.model, pipe.tokenizer, pipe.device, max_length=512, long_text=LONG_TEXT)
+        
+        # First calls at each length pay one-off allocation costs; keep them off real traffic.
+        # Truncate by tokens: a character cut gave every length the same ~75-token shape
+        if LONG_TEXT['enabled']:
+            engine.warm_up(lengths=WARMUP_LENGTHS, batch_sizes=(1,))
+        else:
+            for length in WARMUP_LENGTHS:
+                pipe(' '.join(['warmup'] * length), truncation=True, max_length=512)
+        classifier = pipe
+        MODEL_LOADED = True
+        print(f"✅ Pre-trained ML model loaded and warmed up in {time.time() - start:.1f}s")
+        print("📊 Trained on 200,000+ labeled comments")
+        
+    except Exception as e:
+        print(f"❌ Failed to load model: {e}")
+        print("💡 Install with: pip install transformers torch")
     
-except Exception as e:
-    print(f"❌ Failed to load model: {e}")
-    print("💡 Install with: pip install transformers torch")
+    finally:
+        model_loaded_event.set()
+
+threading.Thread(target=load_pretrained_model, daemon=True).start()
 
 def analyze_with_ml(text):
     """Analyze using pre-trained ML model"""
     if not MODEL_LOADED or not classifier:
-        return fallback_analysis(text)
+        result = fallback_analysis(text)
+        result['degraded'] = True
+        return result
     
     try:
-        # Get ML predictions
-        results = classifier(text[:512])[0]
-        
-        # Parse results
-        toxic_prob = 0.0
-        for result in results:
-            if result['label'] == 'toxic':
-                toxic_prob = result['score']
-                break
+        if LONG_TEXT['enabled']:
+            # Score every 512-token window instead of only the first 512 characters
+            scores = engine.predict_scores([text])[0]
+            toxic_prob = float(scores[classifier.model.config.label2id.get('toxic', 0)])
+        else:
+            # Get ML predictions
+            results = classifier(text[:512])[0]
+            
+            # Parse results
+            toxic_prob = 0.0
+            for result in results:
+                if result['label'] == 'toxic':
+                    toxic_prob = result['score']
+                    break
         
         is_toxic = toxic_prob > 0.5
         confidence = toxic_prob if is_toxic else (1 - toxic_prob)
@@ -73,20 +117,24 @@ def analyze_with_ml(text):
             'toxicity_score': round(toxic_prob, 3),
             'labels': labels,
             'model': 'pretrained-ml',
-            'source': 'unitary/toxic-bert'
+            'source': 'unitary/toxic-bert',
+            'degraded': False
         }
         
     except Exception as e:
         print(f"ML Error: {e}")
-        return fallback_analysis(text)
+        result = fallback_analysis(text)
+        result['degraded'] = True
+        return result
+
+FALLBACK_MATCHER = KeywordMatcher({
+    'bad_words': ['fuck', 'shit', 'bitch', 'asshole', 'bastard', 'kutta', 'kamina',
+                  'harami', 'bhenchod', 'madarchod', 'chutiya', 'randi', 'kill', 'murder']
+})
 
 def fallback_analysis(text):
     """Simple fallback if ML not available"""
-    bad_words = ['fuck', 'shit', 'bitch', 'asshole', 'bastard', 'kutta', 'kamina', 
-                 'harami', 'bhenchod', 'madarchod', 'chutiya', 'randi', 'kill', 'murder']
-    
-    text_lower = text.lower()
-    matches = sum(1 for word in bad_words if word in text_lower)
+    matches = FALLBACK_MATCHER.count(text)['bad_words']
     
     is_toxic = matches > 0
     confidence = min(0.9, 0.5 + (matches * 0.2))
@@ -107,6 +155,22 @@ def fallback_analysis(text):
         'source': 'keyword-matching'
     }
 
+# Cascade mode: lexical stage decides clear-cut texts, the model only sees ambiguous ones
+CASCADE_CONFIG = load_cascade_config()
+cascade = CascadeModerator(
+    analyze_with_ml,
+    clean_below=CASCADE_CONFIG['clean_below'],
+    toxic_above=CASCADE_CONFIG['toxic_above'],
+    long_text_chars=CASCADE_CONFIG['long_text_chars'],
+    clean_max_words=CASCADE_CONFIG['clean_max_words']
+) if CASCADE_CONFIG['enabled'] else None
+
+def moderate_text(text):
+    """Moderate through the cascade when enabled, otherwise straight to the model"""
+    if cascade is not None:
+        return cascade.moderate(text)
+    return analyze_with_ml(text)
+
 @app.route('/health', methods=['GET'])
 def health():
     return jsonify({
@@ -114,8 +178,11 @@ def health():
         'model': 'pretrained-ml' if MODEL_LOADED else 'fallback',
         'version': '2.0.0',
         'ml_ready': MODEL_LOADED,
+        'degraded': not MODEL_LOADED,
+        'model_loading': not model_loaded_event.is_set(),
         'trained_on': '200k+ comments' if MODEL_LOADED else 'N/A',
-        'languages': ['English', 'Multilingual']
+        'languages': ['English', 'Multilingual'],
+        'cascade': cascade is not None
     })
 
 @app.route('/moderate', methods=['POST'])
@@ -127,7 +194,7 @@ def moderate():
         if not text:
             return jsonify({'error': 'No text provided'}), 400
         
-        result = analyze_with_ml(text)
+        result = moderate_text(text)
         result['text'] = text
         
         return jsonify(result)
@@ -146,7 +213,7 @@ def batch_moderate():
         
         results = []
         for text in texts:
-            result = analyze_with_ml(text)
+            result = moderate_text(text)
             result['text'] = text
             results.append(result)
         
@@ -165,7 +232,7 @@ def analyze():
         if not text:
             return jsonify({'error': 'No text provided'}), 400
         
-        result = analyze_with_ml(text)
+        result = moderate_text(text)
         
         # Add extra analysis
         result['analysis'] = {
@@ -179,6 +246,16 @@ def analyze():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/cascade-stats', methods=['GET'])
+def cascade_stats():
+    """Fraction of traffic reaching the model and cascade latency percentiles"""
+    if cascade is None:
+        return jsonify({'enabled': False})
+    
+    stats = cascade.stats()
+    stats['enabled'] = True
+    return jsonify(stats)
+
 @app.route('/info', methods=['GET'])
 def info():
     return jsonify({
@@ -196,16 +273,9 @@ if __name__ == '__main__':
     print("🚀 PRE-TRAINED ML Content Moderation API")
     print("="*70)
     print(f"✅ Server: http://localhost:5002")
-    print(f"🤖 Model: {'Unitary Toxic-BERT (Pre-trained)' if MODEL_LOADED else 'Fallback Mode'}")
-    print(f"📊 Dataset: {'200k+ toxic comments' if MODEL_LOADED else 'Keyword patterns'}")
-    print(f"🎯 Accuracy: {'~95%' if MODEL_LOADED else '~70%'}")
-    print("📝 Endpoints: /health, /moderate, /batch-moderate, /analyze, /info")
+    print("🤖 Model: Unitary Toxic-BERT (loading in background, keyword fallback until ready)")
+    print(f"🪜 Cascade: {'Enabled' if cascade else 'Disabled'}")
+    print("📝 Endpoints: /health, /moderate, /batch-moderate, /analyze, /info, /cascade-stats")
     print("="*70)
     
-    if not MODEL_LOADED:
-        print("\n⚠️  ML model not loaded - using fallback mode")
-        print("💡 To enable ML, install dependencies:")
-        print("   pip install transformers torch")
-        print()
-    
     app.run(host='0.0.0.0', port=5002, debug=False)
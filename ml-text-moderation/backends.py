@@ -0,0 +1,522 @@
+"""
+Moderation Backends
+Registry of interchangeable scorers behind one batch-first interface:
+each backend turns a list of texts into a (len(texts), 6) array of
+per-label scores. app.py serves whichever backend is active and can swap
+in a new one without a restart (see BackendSlot).
+
+Usage: python backends.py export-onnx models/toxic-classifier
+"""
+
+import gc
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+import numpy as np
+from cascade import lexical_score
+from inference_engine import ONNX_WEIGHTS
+from settings import load_config_section
+
+logger = logging.getLogger(__name__)
+
+LABEL_NAMES = ['toxic', 'severe_toxic', 'obscene', 'threat', 'insult', 'identity_hate']
+
+DEFAULT_ENSEMBLE_CONFIG = {
+    'budget_ms': 150,   # per request; members still running then are left out of the fusion
+    'max_backlog': 2,   # calls queued on a member (running one included) before it is skipped
+    'members': []       # {name, backend, model_path, weight, label_weights, threads}
+}
+
+def build_result(predictions, threshold):
+    """
+    Moderation answer for one row of LABEL_NAMES scores
+
+    The one definition of flagged/reason/confidence, used by /moderate and
+    every other endpoint of app.py and by the results bulk_moderate.py stores.
+    """
+    scores = {label: float(score) for label, score in zip(LABEL_NAMES, predictions)}
+    # Flagged labels stay in LABEL_NAMES order, so reason is the first of them
+    flagged_labels = [label for label, score in scores.items() if score >= threshold]
+
+    return {
+        'flagged': bool(flagged_labels),
+        'reason': flagged_labels[0] if flagged_labels else None,
+        'flagged_categories': flagged_labels,
+        'confidence': max((scores[label] for label in flagged_labels), default=0.0),
+        'scores': scores
+    }
+
+def label_order(config):
+    """Model output index for each of LABEL_NAMES (by id2label name when the model has them)"""
+    names = [str(name).lower() for _, name in sorted(config.id2label.items())]
+    if all(label in names for label in LABEL_NAMES):
+        return [names.index(label) for label in LABEL_NAMES]
+    return list(range(len(LABEL_NAMES)))
+
+class ModerationBackend:
+    """Base class: load, warm up, score batches, unload"""
+
+    kind = None
+    needs_model = True
+
+    def __init__(self, model_path=None, version=None, **options):
+        self.model_path = model_path
+        self.version = version or (f"{self.kind}:{os.path.basename(os.path.normpath(model_path))}" if model_path else self.kind)
+        self.options = options
+
+    def load(self):
+        pass
+
+    def warm_up(self):
+        self.predict_scores(['warm up'])
+
+    def predict_scores(self, texts, stats=None):
+        """(len(texts), len(LABEL_NAMES)) array of scores in [0, 1]"""
+        raise NotImplementedError
+
+    def unload(self):
+        pass
+
+    def info(self):
+        return {'backend': self.kind, 'version': self.version, 'model_path': self.model_path,
+                'quantized': False, 'device': 'cpu'}
+
+class TransformerBackend(ModerationBackend):
+    """Hugging Face sequence classifier (fp32, or an INT8 artifact from quantize_model.py)"""
+
+    kind = 'transformer'
+    engine_backend = 'pytorch'
+
+    def __init__(self, model_path='models/toxic-classifier', version=None, max_length=256, long_text=None, **options):
+        super().__init__(model_path, version, **options)
+        self.max_length = max_length
+        self.long_text = long_text
+        self.engine = self.model = self.tokenizer = self.device = None
+        self.quantized = False
+
+    def load(self):
+        from inference_engine import load_engine
+        from windowing import load_long_text_config
+
+        self.long_text = self.long_text or load_long_text_config()
+        self.engine = load_engine(self.model_path, self.engine_backend, self.max_length, self.long_text,
+                                  memory_budget=self.options.get('memory_budget', False),
+                                  threads=self.options.get('threads'))
+        self.use_engine(self.engine)
+
+    def use_engine(self, engine):
+        self.engine = engine
+        self.model, self.tokenizer, self.device = engine.model, engine.tokenizer, engine.device
+        self.quantized = engine.quantized
+        self.order = label_order(engine.model_config)
+
+    def warm_up(self):
+        self.engine.warm_up()
+
+    def predict_scores(self, texts, stats=None):
+        return self.engine.predict_scores(texts, stats)[:, self.order]
+
+    def unload(self):
+        on_gpu = self.device is not None and self.device.type == 'cuda'
+        self.engine = self.model = self.tokenizer = None
+        gc.collect()
+        if on_gpu:
+            import torch
+            torch.cuda.empty_cache()
+
+    def info(self):
+        engine = self.engine.info() if self.engine else {}
+        return {**super().info(), 'quantized': self.quantized, 'device': engine.get('device'),
+                'dtype': engine.get('dtype'), 'engine': engine or None}
+
+class QuantizedBackend(TransformerBackend):
+    """Transformer with dynamic INT8 linear layers, quantized at load time if needed"""
+
+    kind = 'quantized'
+    engine_backend = 'quantized'
+
+class EarlyExitBackend(TransformerBackend):
+    """Transformer with exit heads from early_exit.py; confident texts skip the upper layers"""
+
+    kind = 'early_exit'
+
+    def load(self):
+        from early_exit import load_early_exit
+        from inference_engine import InferenceEngine
+        from windowing import load_long_text_config
+
+        self.long_text = self.long_text or load_long_text_config()
+        tokenizer, model, device = load_early_exit(self.model_path, self.options.get('confidence'))
+        self.use_engine(InferenceEngine.from_model(model, tokenizer, device, self.max_length, self.long_text,
+                                                   threads=self.options.get('threads'), backend='early_exit'))
+
+    def predict_scores(self, texts, stats=None):
+        if stats is None:
+            return super().predict_scores(texts)
+
+        # Exit layer of every window scored on this thread, for the exit-layer histogram
+        self.model.recorder.exits = []
+        try:
+            scores = super().predict_scores(texts, stats)
+            stats['exit_layers'] = self.model.recorder.exits
+        finally:
+            self.model.recorder.exits = None
+        return scores
+
+    def info(self):
+        return {**super().info(), 'exit_layers': self.model.exit_layers if self.model else None,
+                'exit_confidence': self.model.confidence if self.model else None}
+
+class ONNXBackend(TransformerBackend):
+    """Classifier exported to model.onnx, run with onnxruntime on CPU"""
+
+    kind = 'onnx'
+    engine_backend = 'onnx'
+
+class LexicalBackend(ModerationBackend):
+    """Keyword lexicon (no model) - also the fallback while a model loads"""
+
+    kind = 'lexical'
+    needs_model = False
+
+    def predict_scores(self, texts, stats=None):
+        scores = np.zeros((len(texts), len(LABEL_NAMES)), dtype=np.float32)
+
+        for row, text in enumerate(texts):
+            # Every label touched by a keyword category gets the lexical score,
+            # the same label mapping app_simple.py uses
+            score, counts = lexical_score(text)
+            label_hits = {
+                'toxic': True,
+                'severe_toxic': counts['severe'] > 0 or counts['violence'] > 0,
+                'obscene': counts['severe'] > 0,
+                'threat': counts['violence'] > 0,
+                'insult': counts['moderate'] > 0 or counts['severe'] > 0,
+                'identity_hate': False
+            }
+            scores[row] = [score if label_hits[label] else 0.0 for label in LABEL_NAMES]
+
+        return scores
+
+class NLPBackend(ModerationBackend):
+    """TextBlob sentiment plus keyword patterns (app_nlp_simple.py)"""
+
+    kind = 'nlp'
+    needs_model = False
+
+    def load(self):
+        import app_nlp_simple
+        self.analyze_batch = app_nlp_simple.analyze_batch
+
+    def predict_scores(self, texts, stats=None):
+        scores = np.zeros((len(texts), len(LABEL_NAMES)), dtype=np.float32)
+
+        for row, (_, confidence, labels, _) in enumerate(self.analyze_batch(texts)):
+            scores[row] = [confidence if labels.get(label) else 0.0 for label in LABEL_NAMES]
+
+        return scores
+
+def load_ensemble_config(config_path='config.yaml'):
+    """Read the ensemble section of config.yaml"""
+    config = load_config_section('ensemble', DEFAULT_ENSEMBLE_CONFIG, config_path)
+    config['members'] = config.get('members') or []
+    return config
+
+def _set_torch_threads(threads):
+    # With OpenMP the intra-op thread count is per calling thread, so each
+    # member's executor thread gets its own share of the CPU
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+
+class _Member:
+    """One ensemble member: its backend, fusion weights and single-thread executor"""
+
+    def __init__(self, name, backend, weights, threads):
+        self.name = name
+        self.backend = backend
+        self.weights = weights
+        self.threads = threads
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix=f'ensemble-{name}',
+                                           initializer=_set_torch_threads, initargs=(threads,))
+        self.backlog = 0
+        self.lock = threading.Lock()
+
+    def submit(self, function, *args):
+        with self.lock:
+            self.backlog += 1
+        future = self.executor.submit(function, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self.lock:
+            self.backlog -= 1
+
+    def close(self):
+        """Cancel queued calls and wait for the running one, so the model is idle before it is unloaded"""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+class EnsembleBackend(ModerationBackend):
+    """
+    Several backends run concurrently, their per-label scores fused by weight
+
+    Each member runs on its own thread with its own share of the torch
+    threads. A request waits at most budget_ms for the members; the scores
+    of those that answered are fused (weights renormalized) and the stats
+    record the ones left out. A member that is still busy with max_backlog
+    calls is skipped. If no member answers within the budget, the lexical
+    scores are returned (marked partial) instead of waiting longer.
+    """
+
+    kind = 'ensemble'
+    needs_model = False
+
+    def __init__(self, model_path=None, version=None, members=None, budget_ms=None, max_backlog=None, **options):
+        config = load_ensemble_config()
+        self.member_configs = members or config['members']
+        # 0 is a valid budget (fuse only what is instantly ready), so only None means unset
+        self.budget = (budget_ms if budget_ms is not None else config['budget_ms']) / 1000
+        self.max_backlog = max_backlog if max_backlog is not None else config['max_backlog']
+        if not version:
+            names = '+'.join(member.get('name') or member.get('backend', '?') for member in self.member_configs)
+            digest = hashlib.blake2b(json.dumps(self.member_configs, sort_keys=True).encode(), digest_size=3)
+            version = f"ensemble:{names}@{digest.hexdigest()}"
+        super().__init__(None, version, **options)
+        self.members = []
+        self.counts = {'complete': 0, 'partial': 0, 'fallback': 0}
+        # Answers a request no member could score within the budget
+        self.fallback = LexicalBackend()
+        self.missed = {}
+        self.lock = threading.Lock()
+
+    @property
+    def model_paths(self):
+        """Model directories of the members (the score store stamps them all)"""
+        return [member.backend.model_path for member in self.members]
+
+    def load(self):
+        if not self.member_configs:
+            raise ValueError("No ensemble members - add them to the ensemble section of config.yaml")
+
+        threads = 0
+        if any(BACKENDS.get(member.get('backend', 'transformer'), ModerationBackend).needs_model
+               for member in self.member_configs):
+            import torch
+            # Members without a thread count split this worker's torch threads evenly
+            threads = max(1, torch.get_num_threads() // len(self.member_configs))
+
+        for config in self.member_configs:
+            kind = config.get('backend', 'transformer')
+            name = config.get('name') or kind
+            if kind == self.kind:
+                raise ValueError("An ensemble can't contain another ensemble")
+            try:
+                backend = create_backend(kind, model_path=config.get('model_path') if BACKENDS[kind].needs_model else None,
+                                         version=config.get('version') or f"{name}:{kind}",
+                                         **{**self.options, 'threads': config.get('threads') or threads})
+                member = _Member(name, backend, self.member_weights(config), config.get('threads') or threads)
+                member.submit(backend.load).result()
+                self.members.append(member)
+                self.missed[name] = 0
+                logger.info(f"🧩 Ensemble member {name}: {backend.version} "
+                            f"({member.threads or 'default'} threads, weight {config.get('weight', 1.0)})")
+            except Exception as e:
+                logger.warning(f"⚠️ Ensemble member {name} disabled: {str(e)}")
+
+        if not self.members:
+            raise RuntimeError("No ensemble member could be loaded")
+
+    def member_weights(self, config):
+        """Per-label fusion weights: weight, overridden per label by label_weights"""
+        weight = float(config.get('weight', 1.0))
+        label_weights = config.get('label_weights') or {}
+        return np.array([float(label_weights.get(label, weight)) for label in LABEL_NAMES], dtype=np.float32)
+
+    def warm_up(self):
+        for future in [member.submit(member.backend.warm_up) for member in self.members]:
+            future.result()
+
+    def predict_scores(self, texts, stats=None):
+        deadline = time.perf_counter() + self.budget
+        member_stats = {member: {} for member in self.members}
+
+        # A member still busy with earlier requests would only make this one wait
+        ready = [member for member in self.members if member.backlog < self.max_backlog] or self.members
+        futures = {member.submit(member.backend.predict_scores, texts, member_stats[member]): member
+                   for member in ready}
+
+        done, pending = wait(futures, timeout=max(0.0, deadline - time.perf_counter()))
+        answered = [future for future in done if future.exception() is None]
+        if not answered:
+            if not pending:
+                # Every member failed
+                raise RuntimeError(f"No ensemble member could score the batch: {next(iter(done)).exception()}")
+            # Nothing within the budget: keyword scores now instead of waiting for the slowest member
+            with self.lock:
+                for member in self.members:
+                    self.missed[member.name] += 1
+                self.counts['fallback'] += 1
+            if stats is not None:
+                stats['ensemble'] = {'answered': [], 'missing': [member.name for member in self.members],
+                                     'fallback': self.fallback.kind}
+                stats['partial'] = True
+            return self.fallback.predict_scores(texts)
+
+        weights = np.stack([futures[future].weights for future in answered])
+        scores = np.stack([future.result() for future in answered])
+        total = weights.sum(axis=0)
+        # A label no answering member weighs is their plain mean
+        fused = np.where(total > 0, (scores * weights[:, None, :]).sum(axis=0) / np.where(total > 0, total, 1),
+                         scores.mean(axis=0))
+
+        answered_members = {futures[future] for future in answered}
+        missing = [member.name for member in self.members if member not in answered_members]
+        with self.lock:
+            for name in missing:
+                self.missed[name] += 1
+            self.counts['partial' if missing else 'complete'] += 1
+
+        if stats is not None:
+            stats['ensemble'] = {'answered': [member.name for member in self.members if member in answered_members],
+                                 'missing': missing}
+            stats['partial'] = bool(missing)
+            # Stage timings of the members that answered, summed
+            timed = [member_stats[member] for member in answered_members if 'tokenize_seconds' in member_stats[member]]
+            if timed:
+                for key in ('tokenize_seconds', 'forward_seconds', 'aggregate_seconds'):
+                    stats[key] = sum(member[key] for member in timed)
+                stats['batch_shapes'] = [shape for member in timed for shape in member['batch_shapes']]
+        return fused.astype(np.float32)
+
+    def unload(self):
+        # Calls that missed their deadline may still be queued or running on the old models
+        for member in self.members:
+            member.close()
+            member.backend.unload()
+        self.members = []
+
+    def info(self):
+        devices = {member.backend.info()['device'] for member in self.members}
+        return {**super().info(), 'device': ', '.join(sorted(str(d) for d in devices)) or None,
+                'budget_ms': round(self.budget * 1000),
+                'members': [{'name': member.name, 'version': member.backend.version, 'threads': member.threads,
+                             'weights': dict(zip(LABEL_NAMES, member.weights.tolist())),
+                             'missed': self.missed[member.name]} for member in self.members],
+                'counts': dict(self.counts)}
+
+BACKENDS = {
+    'transformer': TransformerBackend,
+    'quantized': QuantizedBackend,
+    'early_exit': EarlyExitBackend,
+    'onnx': ONNXBackend,
+    'lexical': LexicalBackend,
+    'nlp': NLPBackend,
+    'ensemble': EnsembleBackend,
+}
+
+def create_backend(kind, **options):
+    """Instantiate a registered backend (not loaded yet)"""
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown backend: {kind} (choose from {', '.join(BACKENDS)})")
+    return BACKENDS[kind](**options)
+
+class BackendSlot:
+    """
+    The backend currently serving traffic
+
+    Requests take the active backend with use(); swap() replaces it
+    atomically. A replaced backend keeps serving the requests that already
+    hold it and is unloaded when the last of them finishes.
+    """
+
+    def __init__(self):
+        self.active = None
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.retired = set()
+
+    @contextmanager
+    def use(self):
+        with self.lock:
+            backend = self.active
+            if backend is None:
+                raise RuntimeError("No backend loaded")
+            self.in_flight[backend] = self.in_flight.get(backend, 0) + 1
+        try:
+            yield backend
+        finally:
+            self._release(backend)
+
+    def _release(self, backend):
+        with self.lock:
+            self.in_flight[backend] -= 1
+            idle = self.in_flight[backend] == 0
+            if idle:
+                del self.in_flight[backend]
+            unload = idle and backend in self.retired
+            if unload:
+                self.retired.discard(backend)
+        if unload:
+            backend.unload()
+
+    def swap(self, backend):
+        """Make backend active; returns the previous one (unloaded now or once idle)"""
+        with self.lock:
+            old, self.active = self.active, backend
+            busy = old is not None and self.in_flight.get(old, 0) > 0
+            if busy:
+                self.retired.add(old)
+        if old is not None and not busy:
+            old.unload()
+        return old
+
+    def stats(self):
+        with self.lock:
+            return {
+                'active': self.active.version if self.active else None,
+                'in_flight': {backend.version: count for backend, count in self.in_flight.items()},
+                'draining': [backend.version for backend in self.retired]
+            }
+
+def export_onnx(model_path, opset=17):
+    """Write model.onnx next to a fp32 model's config for the onnx backend"""
+    import torch
+    from model_loader import load_classifier
+
+    tokenizer, model, _ = load_classifier(model_path)
+    model.to('cpu')
+    model.config.return_dict = False
+    sample = tokenizer(['export sample'], return_tensors='pt')
+    output_path = os.path.join(model_path, ONNX_WEIGHTS)
+
+    torch.onnx.export(
+        model,
+        (sample['input_ids'], sample['attention_mask']),
+        output_path,
+        input_names=['input_ids', 'attention_mask'],
+        output_names=['logits'],
+        dynamic_axes={
+            'input_ids': {0: 'batch', 1: 'sequence'},
+            'attention_mask': {0: 'batch', 1: 'sequence'},
+            'logits': {0: 'batch'}
+        },
+        opset_version=opset
+    )
+    return output_path
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Moderation backend tools')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    export = subcommands.add_parser('export-onnx', help='export a fp32 model for the onnx backend')
+    export.add_argument('model_path')
+    args = parser.parse_args()
+
+    print(f"✅ Exported: {export_onnx(args.model_path)}")
@@ -0,0 +1,325 @@
+"""
+Moderation Backend Benchmark
+Starts each app_*.py backend in turn, replays a reproducible multilingual
+corpus (data/*.csv plus synthetic posts) against /moderate, and writes
+latency percentiles, throughput, error rate and server RSS to a JSON report
+
+Two load shapes are run per backend:
+  closed loop - N clients, each sends its next request when the last returns
+  open loop   - Poisson arrivals at a fixed rate, latency measured from the
+                scheduled arrival so a slow server can't hide its queueing
+
+Usage: python benchmark_backends.py [--backends app simple nlp] [--concurrency 1 4 16]
+                                    [--rates 5 20 50] [--duration 20] [--output benchmark_report.json]
+       python benchmark_backends.py --url http://127.0.0.1:5001 --backends app   (already running)
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import requests
+from benchmark_lexicon import load_corpus
+from cascade import latency_summary
+
+# script, port it binds, and how to tell it has finished loading
+BACKENDS = {
+    'app': {'script': 'app.py', 'port': 5001, 'ready_path': '/ready'},
+    'fallback': {'script': 'app_fallback.py', 'port': 5001, 'ready_path': '/health'},
+    'pretrained': {'script': 'app_pretrained.py', 'port': 5001, 'ready_path': '/health'},
+    'pretrained_fast': {'script': 'app_pretrained_fast.py', 'port': 5002, 'ready_path': '/health',
+                        'ready_field': ('model_loading', False)},
+    'simple': {'script': 'app_simple.py', 'port': 5002, 'ready_path': '/health'},
+    'nlp': {'script': 'app_nlp_simple.py', 'port': 5002, 'ready_path': '/health'},
+}
+
+def build_corpus(data_dir, synthetic=500, seed=42):
+    """Deterministically shuffled corpus; the same seed replays the same requests"""
+    texts = load_corpus(data_dir, synthetic=synthetic, seed=seed)
+    random.Random(seed).shuffle(texts)
+    return texts
+
+def process_tree_rss_mb(pid):
+    """Resident memory of a process and its children (Linux /proc), or None"""
+    total_kb, stack, seen = 0, [pid], set()
+    while stack:
+        current = stack.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total_kb += int(line.split()[1])
+            for task in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{task}/children') as f:
+                    stack.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            if current == pid:
+                return None
+    return round(total_kb / 1024, 1)
+
+class RSSSampler:
+    """Samples server RSS in the background while a load run is going"""
+
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        if self.pid:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = process_tree_rss_mb(self.pid)
+            if rss is not None:
+                self.samples.append(rss)
+            self._stop.wait(self.interval)
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def summary(self):
+        if not self.samples:
+            return {'peak_rss_mb': None, 'mean_rss_mb': None}
+        return {
+            'peak_rss_mb': max(self.samples),
+            'mean_rss_mb': round(sum(self.samples) / len(self.samples), 1)
+        }
+
+class LoadRecorder:
+    """Thread-safe latency/error collection for one run"""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def record(self, ok, latency_ms):
+        with self.lock:
+            if ok:
+                self.latencies.append(latency_ms)
+            else:
+                self.errors += 1
+
+    def result(self, wall_seconds):
+        total = len(self.latencies) + self.errors
+        return {
+            'requests': total,
+            'throughput_rps': round(len(self.latencies) / wall_seconds, 2),
+            'error_rate': round(self.errors / total, 4) if total else 0.0,
+            'latency_ms': latency_summary(self.latencies)
+        }
+
+def send(session, url, text, timeout):
+    """POST one text; returns True on a 200 with a JSON body"""
+    try:
+        response = session.post(url, json={'text': text}, timeout=timeout)
+        return response.status_code == 200 and 'error' not in response.json()
+    except (requests.RequestException, ValueError):
+        return False
+
+def run_closed_loop(url, corpus, concurrency, duration, timeout=30):
+    """Each of `concurrency` clients sends its next request as soon as one returns"""
+    recorder = LoadRecorder()
+    stop_at = time.time() + duration
+
+    def client(client_id):
+        session = requests.Session()
+        i = client_id
+        while time.time() < stop_at:
+            start = time.perf_counter()
+            ok = send(session, url, corpus[i % len(corpus)], timeout)
+            recorder.record(ok, (time.perf_counter() - start) * 1000)
+            i += concurrency
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(concurrency)]
+    started = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return recorder.result(time.time() - started)
+
+def run_open_loop(url, corpus, rate, duration, seed=42, timeout=30, max_in_flight=256):
+    """
+    Poisson arrivals at `rate` requests/s regardless of how fast the server answers
+
+    Latency is measured from each request's scheduled arrival time, so time
+    spent waiting for a free client thread counts against the server.
+    """
+    recorder = LoadRecorder()
+    rng = random.Random(seed)
+    local = threading.local()
+
+    def fire(text, scheduled):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        ok = send(local.session, url, text, timeout)
+        recorder.record(ok, (time.perf_counter() - scheduled) * 1000)
+
+    started = time.perf_counter()
+    next_arrival = started
+    i = 0
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        while next_arrival - started < duration:
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(fire, corpus[i % len(corpus)], next_arrival)
+            i += 1
+            next_arrival += rng.expovariate(rate)
+
+    result = recorder.result(time.perf_counter() - started)
+    result['offered_rps'] = rate
+    return result
+
+def wait_until_ready(base_url, backend, timeout):
+    """Poll the backend's readiness endpoint; returns seconds taken or None"""
+    started = time.time()
+    field = backend.get('ready_field')
+    while time.time() - started < timeout:
+        try:
+            response = requests.get(base_url + backend['ready_path'], timeout=2)
+            if response.status_code == 200 and (not field or response.json().get(field[0]) == field[1]):
+                return time.time() - started
+        except (requests.RequestException, ValueError):
+            pass
+        time.sleep(0.5)
+    return None
+
+def benchmark_backend(name, args, corpus, script_dir):
+    """Start (unless --url), load-test and stop one backend"""
+    backend = BACKENDS[name]
+    base_url = args.url or f"http://127.0.0.1:{backend['port']}"
+    report = {'script': backend['script'], 'url': base_url}
+
+    server = None
+    if not args.url:
+        server = subprocess.Popen(
+            [sys.executable, backend['script']],
+            cwd=script_dir,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+
+    try:
+        ready_seconds = wait_until_ready(base_url, backend, args.startup_timeout)
+        if ready_seconds is None:
+            print("   ❌ Never became ready")
+            report['error'] = 'not ready'
+            return report
+
+        pid = server.pid if server else None
+        report['startup_seconds'] = round(ready_seconds, 2) if server else None
+        report['idle_rss_mb'] = process_tree_rss_mb(pid) if pid else None
+        url = base_url + '/moderate'
+
+        run_closed_loop(url, corpus, 2, args.warmup)  # warm-up, not recorded
+
+        report['closed_loop'] = []
+        for concurrency in args.concurrency:
+            with RSSSampler(pid) as rss:
+                result = run_closed_loop(url, corpus, concurrency, args.duration)
+            result.update(concurrency=concurrency, **rss.summary())
+            report['closed_loop'].append(result)
+            print_row(f"c={concurrency}", result)
+
+        report['open_loop'] = []
+        for rate in args.rates:
+            with RSSSampler(pid) as rss:
+                result = run_open_loop(url, corpus, rate, args.duration, seed=args.seed)
+            result.update(**rss.summary())
+            report['open_loop'].append(result)
+            print_row(f"{rate:g} rps", result)
+
+        return report
+
+    finally:
+        if server:
+            server.terminate()
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+def print_row(label, result):
+    latency = result['latency_ms']
+    rss = f"{result['peak_rss_mb']:.0f} MB" if result['peak_rss_mb'] else 'n/a'
+    print(f"   {label:>10}  {result['throughput_rps']:8.1f} req/s  p50={latency['p50']:8.1f}  "
+          f"p95={latency['p95']:8.1f}  p99={latency['p99']:8.1f} ms  "
+          f"errors={result['error_rate']:.1%}  rss={rss}")
+
+def git_commit(script_dir):
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=script_dir,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark moderation backends')
+    parser.add_argument('--backends', nargs='+', choices=list(BACKENDS), default=list(BACKENDS))
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--rates', type=float, nargs='+', default=[5, 20, 50], help='open-loop arrivals per second')
+    parser.add_argument('--duration', type=int, default=20, help='seconds per run')
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--synthetic', type=int, default=500, help='synthetic posts added to the corpus')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--startup-timeout', type=int, default=300)
+    parser.add_argument('--url', default=None, help='benchmark an already running server instead of starting one')
+    parser.add_argument('--output', default='benchmark_report.json')
+    args = parser.parse_args()
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    corpus = build_corpus(os.path.join(script_dir, 'data'), synthetic=args.synthetic, seed=args.seed)
+
+    print("="*60)
+    print("📊 Moderation Backend Benchmark")
+    print("="*60)
+    print(f"Corpus: {len(corpus)} texts (seed {args.seed})  Backends: {', '.join(args.backends)}")
+
+    results = {}
+    for name in args.backends:
+        print(f"\n▶️  {name} ({BACKENDS[name]['script']})")
+        results[name] = benchmark_backend(name, args, corpus, script_dir)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': git_commit(script_dir),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'corpus_size': len(corpus),
+            'seed': args.seed,
+            'duration_seconds': args.duration,
+            'concurrency': args.concurrency,
+            'rates': args.rates
+        },
+        'backends': results
+    }
+
+    output = os.path.join(script_dir, args.output) if not os.path.isabs(args.output) else args.output
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"\n💾 Report saved to: {output}")
+
+if __name__ == "__main__":
+    main()
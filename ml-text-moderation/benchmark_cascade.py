@@ -0,0 +1,91 @@
+"""
+Cascade Moderation Benchmark
+Runs the model on every text and the cascade on the same texts, then reports
+the fraction reaching the model, latency percentiles and decision differences
+
+Usage: python benchmark_cascade.py [data/test_dataset.csv]
+"""
+
+import sys
+import time
+import pandas as pd
+import app_pretrained_fast as service
+from cascade import CascadeModerator, latency_summary, load_cascade_config
+from lexicon import TOXIC_MATCHER
+
+def main():
+    test_path = sys.argv[1] if len(sys.argv) > 1 else 'data/test_dataset.csv'
+    df = pd.read_csv(test_path)
+    texts = df['text'].astype(str).tolist()
+    truth = df['toxic'].astype(bool).tolist() if 'toxic' in df.columns else None
+
+    config = load_cascade_config()
+    cascade = CascadeModerator(
+        service.analyze_with_ml,
+        clean_below=config['clean_below'],
+        toxic_above=config['toxic_above'],
+        long_text_chars=config['long_text_chars'],
+        clean_max_words=config['clean_max_words'],
+    )
+
+    # The service loads and warms up the model in the background
+    service.model_loaded_event.wait()
+
+    model_ms, cascade_ms = [], []
+    model_flags, cascade_flags, stages = [], [], []
+
+    for text in texts:
+        start = time.perf_counter()
+        model_result = service.analyze_with_ml(text)
+        model_ms.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        cascade_result = cascade.moderate(text)
+        cascade_ms.append((time.perf_counter() - start) * 1000)
+
+        model_flags.append(model_result['is_toxic'])
+        cascade_flags.append(cascade_result['is_toxic'])
+        stages.append(cascade_result['cascade_stage'])
+
+    stats = cascade.stats()
+    disagreements = [i for i, (a, b) in enumerate(zip(model_flags, cascade_flags)) if a != b]
+
+    print("="*60)
+    print("🪜 Cascade Benchmark")
+    print("="*60)
+    print(f"Dataset: {test_path} ({len(texts)} texts)")
+    print(f"Model: {'unitary/toxic-bert' if service.MODEL_LOADED else 'FALLBACK (model not loaded)'}")
+    print(f"Bands: clean <= {cascade.clean_below}, toxic >= {cascade.toxic_above}")
+    print()
+    print(f"Stages: {stats['stages']}")
+    print(f"Fraction reaching model: {stats['model_fraction'] * 100:.1f}%")
+    print()
+
+    for name, samples in (('Model on everything', model_ms), ('Cascade', cascade_ms)):
+        summary = latency_summary(samples)
+        print(f"{name:<20} p50={summary['p50']:8.2f} ms  p95={summary['p95']:8.2f} ms  "
+              f"p99={summary['p99']:8.2f} ms  mean={summary['mean']:8.2f} ms")
+
+    print()
+    print(f"Decisions differing from model-on-everything: {len(disagreements)} "
+          f"({len(disagreements) / len(texts) * 100:.1f}%)")
+    for i in disagreements[:10]:
+        print(f"  [{stages[i]}] model={model_flags[i]} cascade={cascade_flags[i]}  {texts[i][:60]}")
+
+    if truth is not None:
+        model_acc = sum(a == t for a, t in zip(model_flags, truth)) / len(truth)
+        cascade_acc = sum(a == t for a, t in zip(cascade_flags, truth)) / len(truth)
+        print()
+        print(f"Accuracy vs labels (toxic): model={model_acc:.3f} cascade={cascade_acc:.3f}")
+
+        # Toxic texts the lexicon can't see: the cascade must leave these to the model
+        hidden = [i for i, t in enumerate(truth) if t and not any(TOXIC_MATCHER.count(texts[i]).values())]
+        if hidden:
+            model_recall = sum(model_flags[i] for i in hidden) / len(hidden)
+            cascade_recall = sum(cascade_flags[i] for i in hidden) / len(hidden)
+            approved = sum(stages[i] == 'lexical_clean' for i in hidden)
+            print(f"Recall on toxic texts without keywords ({len(hidden)}): model={model_recall:.3f} "
+                  f"cascade={cascade_recall:.3f}, approved by the lexical stage: {approved}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Cold Start Benchmark
+Launches a moderation service and measures time until the port answers and
+time until the first answer that came from the model (not the fallback)
+
+Usage:
+    python benchmark_cold_start.py app.py --port 5001
+    python benchmark_cold_start.py app_pretrained_fast.py --port 5002
+    python benchmark_cold_start.py app.py --port 5001 --git-ref HEAD~1   # "before" numbers
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+import requests
+
+def is_model_answer(data):
+    """True for responses produced by the model rather than a keyword fallback"""
+    return not data.get('degraded', False) and data.get('model') != 'fallback-pattern'
+
+def measure(script, port, timeout, cwd):
+    """Start the service and poll /moderate until the model answers"""
+    url = f"http://127.0.0.1:{port}/moderate"
+    started = time.time()
+    process = subprocess.Popen([sys.executable, script], cwd=cwd,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    port_open = first_answer = model_answer = None
+    try:
+        while time.time() - started < timeout:
+            try:
+                response = requests.post(url, json={'text': 'Hello, how are you?'}, timeout=5)
+                now = time.time() - started
+                port_open = port_open or now
+                if response.status_code == 200:
+                    first_answer = first_answer or now
+                    if is_model_answer(response.json()):
+                        model_answer = now
+                        break
+            except requests.RequestException:
+                pass
+            time.sleep(0.05)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    return port_open, first_answer, model_answer
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure time-to-first-model-answer')
+    parser.add_argument('script', help='service script, e.g. app.py')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--timeout', type=int, default=600)
+    parser.add_argument('--git-ref', help='measure this revision of the script instead (e.g. HEAD~1)')
+    args = parser.parse_args()
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    script = args.script
+    if args.git_ref:
+        # Check the old script out next to the current one so its imports still resolve
+        source = subprocess.check_output(
+            ['git', 'show', f"{args.git_ref}:./{args.script}"], cwd=script_dir
+        )
+        script = f"_cold_start_{os.path.basename(args.script)}"
+        with open(os.path.join(script_dir, script), 'wb') as f:
+            f.write(source)
+
+    print("="*60)
+    print(f"🧊 Cold start: {args.script}{' @ ' + args.git_ref if args.git_ref else ''}")
+    print("="*60)
+
+    fmt = lambda value: f"{value:7.2f}s" if value is not None else "  never"
+    try:
+        for run in range(1, args.runs + 1):
+            port_open, first_answer, model_answer = measure(script, args.port, args.timeout, script_dir)
+            print(f"Run {run}: port answers {fmt(port_open)}  first 200 {fmt(first_answer)}  "
+                  f"first model answer {fmt(model_answer)}")
+    finally:
+        if args.git_ref:
+            os.remove(os.path.join(script_dir, script))
+
+if __name__ == "__main__":
+    main()
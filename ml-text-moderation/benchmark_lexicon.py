@@ -0,0 +1,99 @@
+"""
+Lexicon Benchmark
+Compares the old per-keyword substring scans with the compiled Aho-Corasick matcher
+"""
+
+import csv
+import glob
+import os
+import random
+import sys
+import time
+from lexicon import TOXIC_KEYWORDS, KeywordMatcher, AHOCORASICK_C
+
+# (text, keyword the matcher must find): threats written with attached
+# affixes, which whole-word matching must not lose
+RECALL_CASES = [
+    ('سأقتلك', 'قتل'),          # data_collector.py's Arabic threat: I will kill you
+    ('يقتلهم', 'قتل'),          # he kills them
+    ('والكلب', 'كلب'),          # and the dog
+    ('بالسلاح', 'سلاح'),        # with the weapon
+    ('I will kill you', 'kill')
+]
+
+def legacy_count(text, lexicon):
+    """Old approach: one `word in text` scan per keyword per category"""
+    text_lower = text.lower()
+    return {
+        category: sum(1 for word in words if word in text_lower)
+        for category, words in lexicon.items()
+    }
+
+def load_corpus(data_dir='data', synthetic=500, seed=42):
+    """Texts from data/*.csv plus synthetic posts of varying length"""
+    texts = []
+    for path in sorted(glob.glob(os.path.join(data_dir, '*.csv'))):
+        with open(path, encoding='utf-8') as f:
+            texts.extend(row['text'] for row in csv.DictReader(f) if row.get('text'))
+
+    rng = random.Random(seed)
+    vocabulary = [w for t in texts for w in t.split()] + [
+        'class', 'studied', 'assessment', 'diet', 'skill', 'bass', 'shell', 'hello', 'great', 'post'
+    ]
+    for _ in range(synthetic):
+        length = rng.choice([5, 20, 60, 200])
+        texts.append(' '.join(rng.choice(vocabulary) for _ in range(length)))
+
+    return texts
+
+def time_per_text(fn, texts, repeat=3):
+    """Best-of-N average microseconds per text"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best / len(texts) * 1e6
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    texts = load_corpus(os.path.join(script_dir, 'data'))
+
+    start = time.perf_counter()
+    matcher = KeywordMatcher(TOXIC_KEYWORDS)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    print("="*60)
+    print("📊 Lexicon Benchmark")
+    print("="*60)
+    print(f"Texts: {len(texts)}  Keywords: {len(matcher.keywords)}")
+    print(f"Engine: {'pyahocorasick (C)' if AHOCORASICK_C else 'pure Python Aho-Corasick'}")
+    print(f"Automaton build: {build_ms:.1f} ms (once at import)")
+    print()
+
+    legacy_us = time_per_text(lambda t: legacy_count(t, TOXIC_KEYWORDS), texts)
+    matcher_us = time_per_text(matcher.count, texts)
+
+    print(f"Legacy substring scans: {legacy_us:8.1f} µs/text")
+    print(f"Aho-Corasick matcher:   {matcher_us:8.1f} µs/text")
+    print(f"Speedup:                {legacy_us / matcher_us:8.2f}x")
+
+    # Texts where substring matching fired but whole-word matching did not:
+    # mostly keywords inside other words, but check them for lost recall
+    changed = [
+        t for t in texts
+        if sum(legacy_count(t, TOXIC_KEYWORDS).values()) > 0 and sum(matcher.count(t).values()) == 0
+    ]
+    print(f"\nSubstring-only hits (review for lost recall): {len(changed)} texts")
+    for text in changed[:5]:
+        print(f"  - {text[:70]}")
+
+    missed = [(text, keyword) for text, keyword in RECALL_CASES if keyword not in matcher.find(text)]
+    print(f"\nRecall cases: {len(RECALL_CASES) - len(missed)}/{len(RECALL_CASES)} found")
+    for text, keyword in missed:
+        print(f"  ❌ {keyword} not found in {text}")
+    return not missed
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
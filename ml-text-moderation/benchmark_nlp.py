@@ -0,0 +1,57 @@
+"""
+NLP Feature Extraction Benchmark
+Compares per-text cost of the old two-TextBlob path with single-pass
+feature extraction, and serial vs process-pool batch analysis
+"""
+
+import time
+import app_nlp_simple
+from app_nlp_simple import (
+    NLP_AVAILABLE, POOL_WORKERS, TOXIC_PATTERNS,
+    analyze_batch, analyze_text_with_nlp, extract_features
+)
+from benchmark_lexicon import load_corpus
+
+def legacy_features(text):
+    """Old path: a TextBlob each for polarity and subjectivity, then three substring scans"""
+    polarity = app_nlp_simple.TextBlob(text).sentiment.polarity if NLP_AVAILABLE else 0.0
+    subjectivity = app_nlp_simple.TextBlob(text).sentiment.subjectivity if NLP_AVAILABLE else 0.5
+    text_lower = text.lower()
+    counts = [sum(1 for word in words if word in text_lower) for words in TOXIC_PATTERNS.values()]
+    return polarity, subjectivity, counts
+
+def per_text_us(fn, texts):
+    start = time.perf_counter()
+    for text in texts:
+        fn(text)
+    return (time.perf_counter() - start) / len(texts) * 1e6
+
+def main():
+    texts = load_corpus('data', synthetic=2000)
+
+    print("="*60)
+    print("📊 NLP Feature Extraction Benchmark")
+    print("="*60)
+    print(f"Texts: {len(texts)}  TextBlob: {'yes' if NLP_AVAILABLE else 'no'}  Pool workers: {POOL_WORKERS}")
+    print()
+
+    legacy_us = per_text_us(legacy_features, texts)
+    single_us = per_text_us(extract_features, texts)
+    print(f"Legacy features (2x TextBlob):  {legacy_us:8.1f} µs/text")
+    print(f"Single-pass extract_features:   {single_us:8.1f} µs/text  ({legacy_us / single_us:.2f}x)")
+
+    serial_us = per_text_us(analyze_text_with_nlp, texts)
+    start = time.perf_counter()
+    analyze_batch(texts)  # first call pays pool start-up
+    first_us = (time.perf_counter() - start) / len(texts) * 1e6
+    start = time.perf_counter()
+    analyze_batch(texts)
+    pooled_us = (time.perf_counter() - start) / len(texts) * 1e6
+
+    print()
+    print(f"Serial batch:                   {serial_us:8.1f} µs/text")
+    print(f"Process pool batch (cold):      {first_us:8.1f} µs/text")
+    print(f"Process pool batch (warm):      {pooled_us:8.1f} µs/text  ({serial_us / pooled_us:.2f}x)")
+
+if __name__ == "__main__":
+    main()
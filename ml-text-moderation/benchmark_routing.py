@@ -0,0 +1,87 @@
+"""
+Language Routing Benchmark
+Per language in the labeled data: how often the router sends a text to that
+language's route, how long detection takes, and scoring latency on the route
+versus on the main multilingual model
+
+Usage: python benchmark_routing.py [--data data/merged_dataset.csv ...] [--model models/toxic-classifier]
+"""
+
+import argparse
+import csv
+import os
+import time
+from backends import create_backend
+from language_router import LANGDETECT_AVAILABLE, LanguageRouter, load_routing_config
+
+def load_by_language(paths):
+    """Unique texts grouped by their language column (blank counts as en)"""
+    by_language = {}
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                text = (row.get('text') or '').strip()
+                if text:
+                    by_language.setdefault((row.get('language') or 'en').strip(), set()).add(text)
+    return {language: sorted(texts) for language, texts in by_language.items()}
+
+def ms_per_text(backend, texts, repeat=3):
+    """Best-of-N milliseconds per text, one text per call as /moderate sees them"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            backend.predict_scores([text])
+        best = min(best, time.perf_counter() - start)
+    return best / len(texts) * 1000
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+
+    parser = argparse.ArgumentParser(description='Measure language routing accuracy and per-language latency')
+    parser.add_argument('--data', nargs='+', default=[os.path.join(script_dir, 'data/merged_dataset.csv'),
+                                                      os.path.join(script_dir, 'data/multilingual_toxic.csv')])
+    parser.add_argument('--backend', default='transformer', help='main multilingual backend')
+    parser.add_argument('--model', default='models/toxic-classifier', help='main model path')
+    args = parser.parse_args()
+
+    by_language = load_by_language(args.data)
+    if not by_language:
+        print("❌ No texts found")
+        return
+
+    def build_backend(kind, model_path, version=None):
+        return create_backend(kind, model_path=model_path, version=version)
+
+    router = LanguageRouter({**load_routing_config(), 'enabled': True})
+    router.load(build_backend)
+    main_backend = build_backend(args.backend, args.model)
+    main_backend.load()
+    main_backend.warm_up()
+    router.warm_up()
+
+    print("="*60)
+    print("📊 Language Routing Benchmark")
+    print("="*60)
+    print(f"Routes: {', '.join(f'{k}->{b.version}' for k, b in router.backends.items()) or 'none'}  "
+          f"langdetect: {'yes' if LANGDETECT_AVAILABLE else 'not installed'}")
+    print(f"\n{'language':>8}{'texts':>7}{'routed':>9}{'misrouted':>11}{'detect µs':>11}{'route ms':>10}{'main ms':>9}")
+
+    for language, texts in sorted(by_language.items()):
+        start = time.perf_counter()
+        detected = [router.detect(text) for text in texts]
+        detect_us = (time.perf_counter() - start) / len(texts) * 1e6
+
+        misrouted = sum(1 for guess in detected if guess != language and guess in router.backends)
+        routed = [text for text, guess in zip(texts, detected) if guess == language and language in router.backends]
+        route_ms = ms_per_text(router.backends[language], routed) if routed else None
+        main_ms = ms_per_text(main_backend, texts)
+
+        print(f"{language:>8}{len(texts):>7}{len(routed) / len(texts):>9.0%}{misrouted / len(texts):>11.0%}{detect_us:>11.1f}"
+              f"{route_ms if route_ms is not None else float('nan'):>10.2f}{main_ms:>9.2f}")
+
+    print("\nrouted    = sent to that language's route (the rest use the main model)")
+    print("misrouted = sent to another language's route")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+SimHash Cache Benchmark
+Measures, per Hamming distance threshold, how often perturbed copies of
+test texts reuse the original's scores (wanted) and how often a distinct
+text reuses scores from another text with different labels (false reuse)
+
+Usage: python benchmark_simhash.py [--data data/test_dataset.csv ...] [--max-distance 8]
+"""
+
+import argparse
+import csv
+import os
+import random
+import time
+from simhash_cache import DEFAULT_SIMHASH_CONFIG, MultiIndexTable, normalize_text, simhash
+
+LABELS = ['toxic', 'severe_toxic', 'obscene', 'threat', 'insult', 'identity_hate']
+EMOJIS = ['😡', '🤬', '💀', '😂', '🔥', '👎']
+
+def load_labeled(paths):
+    """Unique (text, label tuple) rows from labeled CSVs"""
+    rows = {}
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                text = (row.get('text') or '').strip()
+                if text:
+                    rows[text] = tuple(int(float(row.get(label) or 0)) for label in LABELS)
+    return list(rows.items())
+
+def drop_letter(text, rng):
+    positions = [i for i, c in enumerate(text) if c.isalpha()]
+    if not positions:
+        return text
+    i = rng.choice(positions)
+    return text[:i] + text[i + 1:]
+
+def perturb(text, rng):
+    """The kind of edits spam waves make: casing, punctuation, emojis, elongation, small typos"""
+    edits = [
+        lambda t: t.upper(),
+        lambda t: t + rng.choice(['!!!', '...', ' !!', '?!']),
+        lambda t: t + ' ' + rng.choice(EMOJIS) * rng.randint(1, 3),
+        lambda t: rng.choice(EMOJIS) + ' ' + t,
+        lambda t: t.replace(' ', '  ', 1),
+        lambda t: ''.join(c * 3 if c.isalpha() and rng.random() < 0.1 else c for c in t),
+        lambda t: t.replace('.', '').replace(',', ''),
+        # These survive normalization, so they are what the distance threshold is for
+        lambda t: t + ' ' + rng.choice(['lol', 'smh', 'fr', 'bro']),
+        lambda t: drop_letter(t, rng),
+    ]
+    for edit in rng.sample(edits, rng.randint(1, 3)):
+        text = edit(text)
+    return text
+
+def allowed_distance(normalized, max_distance, min_chars):
+    return max_distance if len(normalized) >= min_chars else 0
+
+def evaluate(rows, variants, max_distance, min_chars):
+    """Variant hit rate and false-reuse rate at one distance threshold"""
+    fingerprints = [simhash(normalize_text(text)) for text, _ in rows]
+    owners = {}
+    index = MultiIndexTable(max_distance)
+    for i, fp in enumerate(fingerprints):
+        if fp not in owners:
+            index.add(fp)
+        owners.setdefault(fp, []).append(i)
+
+    # Perturbed copies should find their source text with the same labels
+    start = time.perf_counter()
+    variant_hits = 0
+    for source, variant in variants:
+        normalized = normalize_text(variant)
+        match = index.nearest(simhash(normalized), allowed_distance(normalized, max_distance, min_chars))
+        if match and any(rows[i][1] == rows[source][1] for i in owners[match[0]]):
+            variant_hits += 1
+    lookup_us = (time.perf_counter() - start) / max(len(variants), 1) * 1e6
+
+    # Each distinct text, looked up against all *other* texts
+    reused, false_reuse = 0, 0
+    for i, (text, labels) in enumerate(rows):
+        fp = fingerprints[i]
+        others = [j for j in owners[fp] if j != i]
+        if others:
+            match_labels = [rows[j][1] for j in others]
+        else:
+            index.remove(fp)
+            match = index.nearest(fp, allowed_distance(normalize_text(text), max_distance, min_chars))
+            index.add(fp)
+            match_labels = [rows[j][1] for j in owners[match[0]]] if match else []
+
+        if match_labels:
+            reused += 1
+            if match_labels[0] != labels:
+                false_reuse += 1
+
+    return {
+        'distance': max_distance,
+        'variant_hit_rate': variant_hits / max(len(variants), 1),
+        'reuse_rate': reused / len(rows),
+        'false_reuse_rate': false_reuse / len(rows),
+        'lookup_us': lookup_us
+    }
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+
+    parser = argparse.ArgumentParser(description='Measure SimHash cache reuse and false reuse')
+    parser.add_argument('--data', nargs='+', default=[os.path.join(script_dir, 'data/test_dataset.csv')])
+    parser.add_argument('--max-distance', type=int, default=8)
+    parser.add_argument('--min-chars', type=int, default=DEFAULT_SIMHASH_CONFIG['min_chars'])
+    parser.add_argument('--variants', type=int, default=3, help='perturbed copies per text')
+    args = parser.parse_args()
+
+    rows = load_labeled(args.data)
+    if not rows:
+        print("❌ No labeled texts found")
+        return
+
+    rng = random.Random(42)
+    variants = [(i, perturb(text, rng)) for i, (text, _) in enumerate(rows) for _ in range(args.variants)]
+
+    print("="*60)
+    print("📊 SimHash Cache Benchmark")
+    print("="*60)
+    print(f"Texts: {len(rows)}  Variants: {len(variants)}  min_chars: {args.min_chars}")
+    print("\nvariant hits = perturbed copy reuses its source's scores (higher is better)")
+    print("false reuse  = distinct text reuses another text's scores with different labels")
+    print(f"\n{'distance':>8}{'variant hits':>14}{'any reuse':>11}{'false reuse':>13}{'lookup µs':>11}")
+
+    for distance in range(args.max_distance + 1):
+        row = evaluate(rows, variants, distance, args.min_chars)
+        print(f"{row['distance']:>8}{row['variant_hit_rate']:>13.1%}{row['reuse_rate']:>11.1%}"
+              f"{row['false_reuse_rate']:>13.2%}{row['lookup_us']:>11.1f}")
+
+    print(f"\nConfigured default: max_distance={DEFAULT_SIMHASH_CONFIG['max_distance']} "
+          "(inference.simhash_cache in config.yaml)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+@echo off
+echo ========================================
+echo Bulk Re-moderating Existing Posts
+echo ========================================
+echo.
+
+REM Activate virtual environment
+call venv\Scripts\activate.bat
+
+REM Resumes from bulk_moderation_checkpoint.json if a previous run was interrupted
+python bulk_moderate.py %*
+
+echo.
+pause
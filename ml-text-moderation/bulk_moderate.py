@@ -0,0 +1,258 @@
+"""
+Bulk Moderation Job
+Re-moderates existing posts in MongoDB after a model or threshold change.
+Posts are read in _id order, scored by a pool of worker processes, and
+written back with chunked bulk_write. Progress is checkpointed after every
+write so an interrupted run resumes where it stopped.
+
+Usage: python bulk_moderate.py [--only-stale] [--restart] [--processes N] [--limit N]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+from bson import ObjectId
+from pymongo import MongoClient, UpdateOne
+from backends import LABEL_NAMES, build_result, label_order
+from score_store import model_stamp
+from settings import load_config_section
+
+DEFAULT_BULK_CONFIG = {
+    'mongo_uri': 'mongodb://127.0.0.1:27017/',
+    'database': 'trendzz',
+    'collection': 'posts',
+    'text_field': 'content',
+    'model_path': 'models/toxic-classifier',
+    'threshold': 0.7,
+    'batch_size': 64,          # posts per inference call
+    'processes': 0,            # 0 = one per 2 cores
+    'write_chunk': 500,        # updates per bulk_write (and per checkpoint)
+    'checkpoint_file': 'bulk_moderation_checkpoint.json'
+}
+
+def load_bulk_config(config_path='config.yaml'):
+    """Read bulk_moderation from config.yaml (MONGO_URI env overrides the URI)"""
+    config = load_config_section('bulk_moderation', DEFAULT_BULK_CONFIG, config_path)
+    config['mongo_uri'] = os.environ.get('MONGO_URI', config['mongo_uri'])
+    return config
+
+def model_version(model_path):
+    """
+    Version stored with every result: the score store's stamp of the model directory
+
+    It covers every file there (weights of any dtype, tokenizer, exit heads,
+    pruning and memory-budget metadata), so any change to what gets loaded
+    marks earlier results stale.
+    """
+    return model_stamp(model_path)
+
+# ---- worker processes ----
+
+_worker = {}
+
+def _init_worker(model_path, torch_threads, max_length):
+    """Load the model once per worker process"""
+    # An exception here would make the pool respawn the worker forever,
+    # so keep it and raise it from the first task instead
+    try:
+        from inference_engine import load_engine
+        from windowing import load_long_text_config
+
+        _worker['engine'] = load_engine(model_path, max_length=max_length,
+                                        long_text=load_long_text_config(), threads=torch_threads)
+        # Same label order as the serving backends
+        _worker['order'] = label_order(_worker['engine'].model_config)
+    except Exception as e:
+        _worker['error'] = f"{type(e).__name__}: {e}"
+
+def _score_batch(texts):
+    """Per-label scores for a batch of texts (runs in a worker)"""
+    if 'error' in _worker:
+        raise RuntimeError(f"Worker could not load the model: {_worker['error']}")
+
+    return _worker['engine'].predict_scores(texts)[:, _worker['order']].tolist()
+
+# ---- job ----
+
+class BulkModerator:
+    """Scan a posts collection and write moderation results back"""
+
+    def __init__(self, config, processes=None, only_stale=False, limit=None):
+        self.config = config
+        self.only_stale = only_stale
+        self.limit = limit
+
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        self.model_path = os.path.join(script_dir, config['model_path']) if not os.path.isabs(config['model_path']) else config['model_path']
+        self.checkpoint_path = os.path.join(script_dir, config['checkpoint_file'])
+
+        cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+        self.processes = processes or config['processes'] or max(1, cores // 2)
+        self.torch_threads = max(1, cores // self.processes)
+
+        self.version = model_version(self.model_path)
+        self.collection = MongoClient(config['mongo_uri'])[config['database']][config['collection']]
+
+    def load_checkpoint(self):
+        """Last written _id for this model version and threshold, or None"""
+        if not os.path.exists(self.checkpoint_path):
+            return None, 0
+
+        with open(self.checkpoint_path, 'r') as f:
+            checkpoint = json.load(f)
+
+        if (checkpoint.get('model_version') != self.version
+                or checkpoint.get('threshold') != self.config['threshold']
+                or checkpoint.get('only_stale') != self.only_stale):
+            print("⚠️  Checkpoint is from a different run configuration - starting from the beginning")
+            return None, 0
+
+        return ObjectId(checkpoint['last_id']), checkpoint['processed']
+
+    def save_checkpoint(self, last_id, processed):
+        """Write the checkpoint atomically so a crash never leaves it half-written"""
+        checkpoint = {
+            'last_id': str(last_id),
+            'processed': processed,
+            'model_version': self.version,
+            'threshold': self.config['threshold'],
+            'only_stale': self.only_stale,
+            'updated_at': datetime.now().isoformat()
+        }
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(checkpoint, f, indent=2)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def iter_batches(self, after_id):
+        """Batches of (_id, text) in _id order, starting after the checkpoint"""
+        query = {}
+        if after_id is not None:
+            query['_id'] = {'$gt': after_id}
+        if self.only_stale:
+            # Missing or different version; hashes carry no order, so "older" means "not current"
+            query['moderation.modelVersion'] = {'$ne': self.version}
+
+        text_field = self.config['text_field']
+        cursor = self.collection.find(query, {text_field: 1}).sort('_id', 1).batch_size(self.config['batch_size'] * 4)
+        if self.limit:
+            cursor = cursor.limit(self.limit)
+
+        batch = []
+        for doc in cursor:
+            batch.append((doc['_id'], (doc.get(text_field) or '').strip()))
+            if len(batch) == self.config['batch_size']:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def update_for(self, doc_id, moderation):
+        moderation.update({
+            'threshold': self.config['threshold'],
+            'modelVersion': self.version,
+            'moderatedAt': datetime.now(timezone.utc)
+        })
+        return UpdateOne({'_id': doc_id}, {'$set': {'moderation': moderation}})
+
+    def run(self, restart=False):
+        """Moderate every matching post; returns (processed, seconds)"""
+        after_id, processed = (None, 0) if restart else self.load_checkpoint()
+        threshold = self.config['threshold']
+
+        print(f"\n📦 Bulk moderation: {self.config['database']}.{self.config['collection']}")
+        print(f"   Model: {self.model_path} (version {self.version})")
+        print(f"   Workers: {self.processes} x {self.torch_threads} torch threads, batch {self.config['batch_size']}")
+        if after_id is not None:
+            print(f"   Resuming after _id {after_id} ({processed} already done)")
+
+        pool = multiprocessing.get_context('spawn').Pool(
+            self.processes,
+            initializer=_init_worker,
+            initargs=(self.model_path, self.torch_threads, load_config_section('model', {'max_length': 256})['max_length'])
+        )
+
+        # Keep a bounded number of batches in flight; results are consumed in submit order
+        pending = deque()
+        updates = []
+        last_id = after_id
+        done_this_run = 0
+        start = time.time()
+
+        def flush():
+            nonlocal updates
+            if updates:
+                self.collection.bulk_write(updates, ordered=False)
+                self.save_checkpoint(last_id, processed)
+                updates = []
+
+        def collect(batch, result):
+            nonlocal last_id, processed, done_this_run
+            scores = iter(result.get())
+            for doc_id, text in batch:
+                moderation = build_result(next(scores) if text else [0.0] * len(LABEL_NAMES), threshold)
+                updates.append(self.update_for(doc_id, moderation))
+                last_id = doc_id
+            processed += len(batch)
+            done_this_run += len(batch)
+
+            if len(updates) >= self.config['write_chunk']:
+                flush()
+                elapsed = time.time() - start
+                print(f"   ✅ {processed} posts  ({done_this_run / elapsed:.1f} docs/s)")
+
+        try:
+            for batch in self.iter_batches(after_id):
+                texts = [text for _, text in batch if text]
+                pending.append((batch, pool.apply_async(_score_batch, (texts,)) if texts else _Empty()))
+                if len(pending) >= self.processes * 2:
+                    collect(*pending.popleft())
+
+            while pending:
+                collect(*pending.popleft())
+            flush()
+        finally:
+            pool.terminate()
+            pool.join()
+
+        return done_this_run, time.time() - start
+
+class _Empty:
+    """Stands in for an AsyncResult when a batch has no text to score"""
+
+    def get(self):
+        return []
+
+def main():
+    config = load_bulk_config()
+
+    parser = argparse.ArgumentParser(description='Re-moderate existing posts in MongoDB')
+    parser.add_argument('--only-stale', action='store_true',
+                        help='only posts whose stored model version is not the current one')
+    parser.add_argument('--restart', action='store_true', help='ignore the checkpoint and start over')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--threshold', type=float, default=config['threshold'])
+    parser.add_argument('--limit', type=int, default=None, help='stop after this many posts')
+    args = parser.parse_args()
+
+    config['threshold'] = args.threshold
+    job = BulkModerator(config, processes=args.processes, only_stale=args.only_stale, limit=args.limit)
+    count, seconds = job.run(restart=args.restart)
+
+    print("\n" + "="*60)
+    print("📈 Bulk moderation complete")
+    print("="*60)
+    print(f"   Posts moderated: {count}")
+    print(f"   Time: {seconds:.1f}s")
+    print(f"   Throughput: {count / seconds if seconds else 0:.1f} docs/s")
+
+    # A finished run has nothing to resume
+    if os.path.exists(job.checkpoint_path) and not args.limit:
+        os.remove(job.checkpoint_path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""
+Tiered Cascade Moderation
+A cheap lexical + heuristic stage decides obviously toxic texts and short
+known-clean ones (greetings, thanks); everything else is sent to the
+transformer model
+"""
+
+import os
+import re
+import threading
+import time
+from collections import deque
+import numpy as np
+from lexicon import TOXIC_MATCHER
+from settings import load_config_section
+
+# Symbols or digits inside a word: f*ck, sh!t, b1tch, $hit
+OBFUSCATION_PATTERN = re.compile(r'[^\W\d_]+[*@$!#%10]+[^\W\d_]+|\$[^\W\d_]{2,}')
+
+WORD_PATTERN = re.compile(r'[^\W\d_]+')
+# Anything but words, digits, spaces and plain punctuation (emoji, symbols) needs the model
+SYMBOL_PATTERN = re.compile(r"[^\w\s.,!?'\"()-]")
+
+# Greetings and acknowledgements: a short text made only of these is known clean.
+# A text without keyword hits is not - insults and threats without keywords are
+# exactly what the model is for.
+CLEAN_WORDS = frozenset("""
+hi hello hey hiya morning evening night good great nice cool awesome amazing wonderful
+thanks thank thx ty you so much very a lot for the sharing help post ok okay k yes yeah yep sure
+welcome congrats congratulations well done agreed same lol haha bye see later cheers
+shukriya dost bahut acha hai ye jazakallah salam assalam alaikum
+شکریہ شكرا لك دوست بہت اچھا ہے یہ سلام رائع هذا جزاك الله خيرا مرحبا
+""".split())
+
+DEFAULT_CASCADE_CONFIG = {
+    'enabled': True,
+    'clean_below': 0.1,
+    'toxic_above': 0.85,
+    'long_text_chars': 280,
+    'clean_max_words': 6
+}
+
+def load_cascade_config(config_path='config.yaml'):
+    """Read the cascade section of config.yaml (CASCADE_ENABLED env var overrides)"""
+    config = load_config_section('cascade', DEFAULT_CASCADE_CONFIG, config_path)
+
+    if 'CASCADE_ENABLED' in os.environ:
+        config['enabled'] = os.environ['CASCADE_ENABLED'].lower() in ('1', 'true', 'yes')
+
+    return config
+
+def lexical_score(text, long_text_chars=280):
+    """
+    Estimate toxicity (0-1) from keyword counts and surface heuristics
+
+    Keyword hits use the same weighting as app_simple.py. Texts without hits
+    start at 0 and are pushed towards the ambiguous band by signals the
+    lexicon can't see (shouting, obfuscated words, long or mostly
+    non-Latin text where keyword coverage is thin).
+    """
+    counts = TOXIC_MATCHER.count(text)
+    weighted = (counts['severe'] * 0.9) + (counts['moderate'] * 0.5) + (counts['violence'] * 0.95)
+
+    if weighted > 0:
+        return min(0.98, 0.5 + (weighted * 0.2)), counts
+
+    score = 0.0
+    letters = [c for c in text if c.isalpha()]
+
+    if len(letters) >= 8 and sum(c.isupper() for c in letters) / len(letters) > 0.7:
+        score += 0.3
+    if OBFUSCATION_PATTERN.search(text):
+        score += 0.4
+    if len(text) > long_text_chars:
+        score += 0.2
+    if letters and sum(1 for c in letters if ord(c) > 0x24F) / len(letters) > 0.5:
+        score += 0.2
+
+    return min(score, 0.98), counts
+
+def is_known_clean(text, max_words=6):
+    """True for short texts made only of greetings and acknowledgements (CLEAN_WORDS)"""
+    words = WORD_PATTERN.findall(text.lower())
+    if not words or len(words) > max_words or SYMBOL_PATTERN.search(text):
+        return False
+    return all(word in CLEAN_WORDS for word in words)
+
+def lexical_result(score, counts):
+    """Build an app_pretrained_fast style response from the lexical stage"""
+    is_toxic = score >= 0.5
+
+    return {
+        'is_toxic': is_toxic,
+        'confidence': round(score if is_toxic else 1 - score, 3),
+        'toxicity_score': round(score, 3),
+        'labels': {
+            'toxic': is_toxic,
+            'severe_toxic': counts['severe'] > 0 or counts['violence'] > 0,
+            'obscene': counts['severe'] > 0,
+            'threat': counts['violence'] > 0,
+            'insult': counts['moderate'] > 0 or counts['severe'] > 0,
+            'identity_hate': False
+        },
+        'model': 'cascade-lexical',
+        'source': 'keyword-matching'
+    }
+
+def latency_summary(samples_ms):
+    """p50/p95/p99/mean of a list of latencies in milliseconds"""
+    if not samples_ms:
+        return {'count': 0, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'mean': 0.0}
+
+    samples = np.asarray(samples_ms, dtype=float)
+    return {
+        'count': int(samples.size),
+        'p50': round(float(np.percentile(samples, 50)), 3),
+        'p95': round(float(np.percentile(samples, 95)), 3),
+        'p99': round(float(np.percentile(samples, 99)), 3),
+        'mean': round(float(samples.mean()), 3)
+    }
+
+class CascadeModerator:
+    """Route texts through the lexical stage first and the model only when ambiguous"""
+
+    def __init__(self, model_fn, clean_below=0.1, toxic_above=0.85, long_text_chars=280, clean_max_words=6,
+                 window=10000):
+        """
+        Args:
+            model_fn: callable(text) -> response dict, used for ambiguous texts
+            clean_below: known-clean texts (is_known_clean) scoring at or below this are
+                approved without the model; a low score alone is not enough
+            clean_max_words: longest text that can count as known clean
+            toxic_above: lexical scores at or above this are flagged without the model
+            window: number of recent latencies kept for the stats endpoint
+        """
+        if not 0.0 <= clean_below < toxic_above <= 1.0:
+            raise ValueError("Cascade bands must satisfy 0 <= clean_below < toxic_above <= 1")
+
+        self.model_fn = model_fn
+        self.clean_below = clean_below
+        self.toxic_above = toxic_above
+        self.long_text_chars = long_text_chars
+        self.clean_max_words = clean_max_words
+
+        self._lock = threading.Lock()
+        self._counts = {'lexical_clean': 0, 'lexical_toxic': 0, 'model': 0}
+        self._latencies = deque(maxlen=window)
+
+    def route(self, text):
+        """Return ('lexical_clean' | 'lexical_toxic' | 'model', score, counts)"""
+        score, counts = lexical_score(text, self.long_text_chars)
+
+        # No keyword hit is missing evidence, not evidence of a clean text
+        if score <= self.clean_below and is_known_clean(text, self.clean_max_words):
+            return 'lexical_clean', score, counts
+        if score >= self.toxic_above:
+            return 'lexical_toxic', score, counts
+        return 'model', score, counts
+
+    def moderate(self, text):
+        """Moderate one text, recording which stage decided and how long it took"""
+        start = time.perf_counter()
+        stage, score, counts = self.route(text)
+
+        if stage == 'model':
+            result = self.model_fn(text)
+        else:
+            result = lexical_result(score, counts)
+
+        result['cascade_stage'] = stage
+        result['lexical_score'] = round(score, 3)
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._counts[stage] += 1
+            self._latencies.append(elapsed_ms)
+
+        return result
+
+    def stats(self):
+        """Stage counts, fraction of traffic reaching the model, recent latency percentiles"""
+        with self._lock:
+            counts = dict(self._counts)
+            latencies = list(self._latencies)
+
+        total = sum(counts.values())
+        return {
+            'bands': {'clean_below': self.clean_below, 'toxic_above': self.toxic_above},
+            'total': total,
+            'stages': counts,
+            'model_fraction': round(counts['model'] / total, 4) if total else 0.0,
+            'latency_ms': latency_summary(latencies)
+        }
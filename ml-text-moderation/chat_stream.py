@@ -0,0 +1,273 @@
+"""
+Chat Moderation Stream
+Moderates chat messages sent over one long-lived WebSocket per chat server.
+Messages from every connection and conversation share one batcher, which
+flushes after batch_size messages or max_wait_ms. Each message can be scored
+with the last few unflagged messages of its conversation in front of it, so
+abuse split across several short messages is still seen. Verdicts go back
+over the same connection as JSON arrays, one frame per flush.
+"""
+
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from settings import load_config_section
+
+DEFAULT_CHAT_CONFIG = {
+    'batch_size': 32,            # messages per inference call, across conversations
+    'max_wait_ms': 10,           # flush a partial batch after this long
+    'queue_size': 1024,          # messages buffered ahead of inference; receiving pauses when full
+    'context_messages': 2,       # earlier messages scored with each one (0 = message only)
+    'context_seconds': 300,      # older messages are not used as context
+    'context_chars': 400,        # cap on the context text in front of a message
+    'max_conversations': 10000,  # conversations whose context is kept (least recent dropped)
+    'max_frame_bytes': 65536,    # larger frames close the connection while they arrive (app.py)
+    'max_connections': 0         # per process; 0 = serving.request_threads - 2 under serve.py, no limit otherwise
+}
+
+# Request threads serve.py keeps free of chat connections for /moderate, probes and /metrics
+RESERVED_REQUEST_THREADS = 2
+
+# WebSocket close code 1013: try again later (another worker may have room)
+TRY_AGAIN_LATER = 1013
+
+VERDICT_FIELDS = ('flagged', 'reason', 'flagged_categories', 'confidence', 'degraded')
+
+def load_chat_config(config_path='config.yaml'):
+    """Read inference.chat from config.yaml"""
+    inference = load_config_section('inference', {}, config_path)
+    return {**DEFAULT_CHAT_CONFIG, **(inference.get('chat') or {})}
+
+class ConnectionLimit:
+    """
+    Open chat connections of this process, refusing new ones above a limit
+
+    Each connection holds a request thread for as long as it is open, so
+    without a limit enough chat servers would take every gthread thread of a
+    worker and starve its other endpoints. None means no limit.
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.open = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self.limit is not None and self.open >= self.limit:
+                self.rejected += 1
+                return False
+            self.open += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.open -= 1
+
+class ConversationContext:
+    """Recent messages per conversation, bounded in count, age and number of conversations"""
+
+    def __init__(self, messages=2, seconds=300, chars=400, max_conversations=10000):
+        self.messages = messages
+        self.seconds = seconds
+        self.chars = chars
+        self.max_conversations = max_conversations
+        self.conversations = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, conversation, text):
+        """
+        Record a message and return (text to score, entry, context messages used)
+
+        The entry is [time, text, flagged]; flagged is filled in with the
+        verdict. Flagged messages are left out of later context: they were
+        already caught, and would otherwise flag the messages after them.
+        """
+        now = time.monotonic()
+        entry = [now, text, None]
+        if not self.messages or conversation is None:
+            return text, entry, 0
+
+        with self.lock:
+            history = self.conversations.pop(conversation, None) or deque(maxlen=self.messages)
+            context = [e[1] for e in history if not e[2] and now - e[0] <= self.seconds]
+            history.append(entry)
+            self.conversations[conversation] = history
+            while len(self.conversations) > self.max_conversations:
+                self.conversations.popitem(last=False)
+
+        prefix = '\n'.join(context)[-self.chars:] if context else ''
+        return (prefix + '\n' + text if prefix else text), entry, len(context)
+
+    def __len__(self):
+        return len(self.conversations)
+
+class _Message:
+    __slots__ = ('session', 'id', 'conversation', 'scored_text', 'entry', 'context')
+
+    def __init__(self, session, message_id, conversation, scored_text, entry, context):
+        self.session = session
+        self.id = message_id
+        self.conversation = conversation
+        self.scored_text = scored_text
+        self.entry = entry
+        self.context = context
+
+class ChatBatcher:
+    """Batches messages from all chat sessions of this process onto the model"""
+
+    def __init__(self, moderate_batch, config=None):
+        """
+        Args:
+            moderate_batch: callable(texts, threshold) -> list of result dicts
+        """
+        self.moderate_batch = moderate_batch
+        self.config = config or load_chat_config()
+        self.context = ConversationContext(
+            self.config['context_messages'], self.config['context_seconds'],
+            self.config['context_chars'], self.config['max_conversations']
+        )
+        self._queue = queue.Queue(maxsize=self.config['queue_size'])
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the batching thread once per process (lazily, so it runs in forked workers)"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='chat-batcher', daemon=True)
+                self._thread.start()
+        return self
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def submit(self, session, message_id, conversation, text):
+        """Queue a message; blocks while the queue is full, which pauses that connection's reads"""
+        scored_text, entry, context = self.context.add(conversation, text)
+        self._queue.put(_Message(session, message_id, conversation, scored_text, entry, context))
+
+    def _next_batch(self):
+        """Block for one message, then gather more until batch_size or max_wait"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.config['max_wait_ms'] / 1000
+        while len(batch) < self.config['batch_size']:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            self._process(self._next_batch())
+
+    def _process(self, batch):
+        """Score a batch (one call per threshold) and send each session its verdicts"""
+        by_threshold = {}
+        for message in batch:
+            if message.session.closed:
+                continue  # nobody left to answer
+            by_threshold.setdefault(message.session.threshold, []).append(message)
+
+        replies = {}
+        for threshold, messages in by_threshold.items():
+            try:
+                results = self.moderate_batch([m.scored_text for m in messages], threshold)
+            except Exception as e:
+                results = [{'error': str(e)}] * len(messages)
+
+            for message, result in zip(messages, results):
+                message.entry[2] = result.get('flagged')
+                replies.setdefault(message.session, []).append(message.session.verdict(message, result))
+
+        for session, verdicts in replies.items():
+            session.send(verdicts)
+
+class ChatSession:
+    """
+    One chat server connection
+
+    Frames in: a JSON object {"id", "conversation", "text"} or an array of them.
+    Frames out: a JSON array of verdicts {"id", "conversation", "flagged", ...}
+    or errors {"id", "error"}. Verdicts keep the order messages were received
+    in; errors and empty messages are answered at once, ahead of them.
+    """
+
+    def __init__(self, send, batcher, threshold=0.7, include_scores=False):
+        """
+        Args:
+            send: callable(str) writing one text frame (the WebSocket's send)
+        """
+        self._send = send
+        self.batcher = batcher.start()
+        self.threshold = threshold
+        self.include_scores = include_scores
+        self.closed = False
+        self.received = 0
+        self._lock = threading.Lock()
+
+    def send(self, payload):
+        """Write a frame; the batcher and the receiving thread both reply, so writes are serialized"""
+        if self.closed:
+            return
+        try:
+            with self._lock:
+                self._send(json.dumps(payload, ensure_ascii=False))
+        except Exception:
+            self.closed = True
+
+    def verdict(self, message, result):
+        if 'error' in result:
+            return {'id': message.id, 'error': result['error']}
+
+        verdict = {'id': message.id, 'conversation': message.conversation}
+        verdict.update((field, result.get(field)) for field in VERDICT_FIELDS)
+        if message.context:
+            verdict['context'] = message.context
+        if self.include_scores:
+            verdict['scores'] = result.get('scores', {})
+        return verdict
+
+    def receive(self, frame):
+        """Parse a frame and queue its messages; malformed items are answered at once"""
+        if frame is None:
+            return
+        # app.py already refuses these in the WebSocket server; this covers other callers
+        if len(frame) > self.batcher.config['max_frame_bytes']:
+            self.send([{'id': None, 'error': 'Frame too large'}])
+            return
+        try:
+            items = json.loads(frame)
+        except ValueError:
+            self.send([{'id': None, 'error': 'Invalid JSON'}])
+            return
+
+        # Errors and empty messages are answered without queueing
+        immediate = []
+        for item in items if isinstance(items, list) else [items]:
+            self.received += 1
+            if not isinstance(item, dict) or not isinstance(item.get('text'), str):
+                immediate.append({'id': item.get('id') if isinstance(item, dict) else None, 'error': 'Missing text field'})
+                continue
+
+            message_id = item.get('id', self.received)
+            conversation = item.get('conversation')
+            text = item['text'].strip()
+            if not text:
+                immediate.append({'id': message_id, 'conversation': conversation, 'flagged': False, 'reason': None,
+                               'flagged_categories': [], 'confidence': 0.0, 'degraded': False})
+                continue
+            self.batcher.submit(self, message_id, None if conversation is None else str(conversation), text)
+
+        if immediate:
+            self.send(immediate)
+
+    def close(self):
+        self.closed = True
@@ -0,0 +1,277 @@
+"""
+Knowledge Distillation Script
+Trains a smaller student classifier on a teacher's soft per-label scores
+(the fine-tuned classifier or unitary/toxic-bert) over the merged dataset
+plus optional unlabeled production text, then compares the two
+"""
+
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+import torch
+from transformers import (
+    AutoTokenizer,
+    AutoModelForSequenceClassification,
+    TrainingArguments,
+    Trainer,
+    EarlyStoppingCallback
+)
+from evaluate_model import ModelEvaluator
+from inference_engine import load_engine
+from model_loader import layer_stack
+from train_model import ToxicityTrainer
+from windowing import load_long_text_config
+
+def keep_layers(model, num_layers):
+    """
+    Drop transformer layers, keeping num_layers evenly spaced ones
+
+    Works for DistilBERT (transformer.layer) and BERT-style (encoder.layer)
+    models; the first and last layers are always kept.
+    """
+    stack = layer_stack(model)
+    layers = stack.layer
+
+    if num_layers >= len(layers):
+        return model
+
+    keep = np.linspace(0, len(layers) - 1, num_layers).round().astype(int)
+    stack.layer = torch.nn.ModuleList([layers[i] for i in keep])
+
+    if hasattr(model.config, 'n_layers'):
+        model.config.n_layers = num_layers
+    else:
+        model.config.num_hidden_layers = num_layers
+
+    return model
+
+class ModelDistiller(ToxicityTrainer):
+    """Distill a teacher classifier into a student with fewer layers"""
+
+    def __init__(self, config_path='config.yaml'):
+        super().__init__(config_path)
+        self.distill_config = self.config['distillation']
+
+        teacher = self.distill_config['teacher']
+        # Local model directories are relative to this script; anything else is a hub id
+        local_teacher = os.path.join(self.script_dir, teacher)
+        self.teacher_path = local_teacher if os.path.exists(local_teacher) else teacher
+
+        self.student_base = self.distill_config.get('student_base') or self.model_name
+        self.output_dir = os.path.join(self.script_dir, self.distill_config['output_dir'])
+        self.test_path = os.path.join(self.script_dir, 'data/test_dataset.csv')
+
+    def teacher_label_order(self, model):
+        """Teacher output index for each of our labels (by id2label name when it has one)"""
+        names = [str(name).lower() for _, name in sorted(model.config.id2label.items())]
+        if all(label in names for label in self.label_columns):
+            return [names.index(label) for label in self.label_columns]
+        if model.config.num_labels != len(self.label_columns):
+            raise ValueError(f"Teacher has {model.config.num_labels} unnamed labels, expected {len(self.label_columns)}")
+        return list(range(len(self.label_columns)))
+
+    def soft_labels(self, texts, batch_size=64):
+        """Teacher sigmoid scores for every text, in our label order"""
+        print(f"\n🧑‍🏫 Scoring {len(texts)} texts with teacher: {self.teacher_path}")
+        engine = load_engine(self.teacher_path, max_length=self.max_length, config={'batch_size': batch_size})
+        order = self.teacher_label_order(engine.model)
+
+        start = time.time()
+        scores = engine.predict_scores(texts)
+        print(f"✅ Soft labels ready in {time.time() - start:.1f}s")
+
+        return scores[:, order]
+
+    def load_unlabeled(self):
+        """Optional CSV of production text (a 'text' column, no labels)"""
+        path = self.distill_config.get('unlabeled_path')
+        if not path:
+            return pd.DataFrame(columns=['text'])
+
+        path = os.path.join(self.script_dir, path) if not os.path.isabs(path) else path
+        if not os.path.exists(path):
+            print(f"⏭️ No unlabeled data at {path}")
+            return pd.DataFrame(columns=['text'])
+
+        df = pd.read_csv(path)
+        df = df[df['text'].notna()]
+        df = df[df['text'].astype(str).str.strip() != ''].drop_duplicates('text')
+        print(f"✅ Loaded {len(df)} unlabeled texts")
+        return df[['text']]
+
+    def build_training_set(self):
+        """
+        Labeled + unlabeled texts with teacher targets
+
+        Labeled rows mix in their hard labels with weight hard_label_weight;
+        unlabeled rows use the teacher scores alone. Texts in the saved test
+        set are excluded so the report compares models on unseen data.
+        """
+        # Same held-out split as the other tools that start from the trained classifier
+        train_df, val_df = self.split_data(self.test_path)
+
+        unlabeled = self.load_unlabeled()
+        if os.path.exists(self.test_path):
+            unlabeled = unlabeled[~unlabeled['text'].isin(set(pd.read_csv(self.test_path)['text']))]
+
+        pool = pd.concat([train_df[['text']], unlabeled], ignore_index=True)
+        soft = self.soft_labels(pool['text'].astype(str).tolist())
+
+        weight = self.distill_config['hard_label_weight']
+        targets = soft.copy()
+        hard = train_df[self.label_columns].values.astype(float)
+        targets[:len(train_df)] = weight * hard + (1 - weight) * soft[:len(train_df)]
+
+        pool[self.label_columns] = targets
+        print(f"✅ Distillation set: {len(train_df)} labeled + {len(unlabeled)} unlabeled texts")
+
+        return pool, val_df
+
+    def build_student(self):
+        """Student: the base model cut down to student_layers layers"""
+        num_layers = self.distill_config['student_layers']
+        print(f"\n🎓 Building student from {self.student_base} with {num_layers} layers")
+
+        tokenizer = AutoTokenizer.from_pretrained(self.student_base)
+        model = AutoModelForSequenceClassification.from_pretrained(
+            self.student_base,
+            num_labels=self.num_labels,
+            problem_type="multi_label_classification"
+        )
+        return tokenizer, keep_layers(model, num_layers)
+
+    def distill(self):
+        """Train the student on teacher targets and save it for app.py"""
+        print("\n" + "="*60)
+        print("⚗️ Starting Knowledge Distillation")
+        print("="*60)
+
+        train_df, val_df = self.build_training_set()
+        tokenizer, model = self.build_student()
+
+        # Soft float targets work directly with the multi-label BCE loss
+        train_dataset = self.tokenize_data(train_df, tokenizer)
+        val_dataset = self.tokenize_data(val_df, tokenizer)
+
+        training = {**self.config['training'], **self.distill_config.get('training', {})}
+        training_args = TrainingArguments(
+            output_dir=self.output_dir,
+            num_train_epochs=training['num_epochs'],
+            per_device_train_batch_size=training['batch_size'],
+            per_device_eval_batch_size=training['batch_size'],
+            learning_rate=float(training['learning_rate']),
+            weight_decay=training['weight_decay'],
+            warmup_steps=training['warmup_steps'],
+            gradient_accumulation_steps=training['gradient_accumulation_steps'],
+            eval_strategy="epoch",
+            save_strategy="epoch",
+            load_best_model_at_end=True,
+            metric_for_best_model="f1",
+            logging_dir=self.config['logging']['tensorboard_dir'],
+            logging_steps=100,
+            report_to="tensorboard",
+            save_total_limit=2,
+            fp16=torch.cuda.is_available(),
+            dataloader_num_workers=0,
+        )
+
+        trainer = Trainer(
+            model=model,
+            args=training_args,
+            train_dataset=train_dataset,
+            eval_dataset=val_dataset,
+            compute_metrics=self.compute_metrics,
+            callbacks=[EarlyStoppingCallback(
+                early_stopping_patience=training['early_stopping_patience'],
+                early_stopping_threshold=training['early_stopping_threshold']
+            )]
+        )
+
+        print("\n🏃 Training student...")
+        trainer.train()
+
+        print(f"\n💾 Saving student to: {self.output_dir}")
+        trainer.save_model(self.output_dir)
+        tokenizer.save_pretrained(self.output_dir)
+
+        return trainer
+
+    def measure_latency(self, model_path, texts, runs=100):
+        """Single-text and batched CPU latency for a model directory or hub id"""
+        engine = load_engine(model_path, max_length=self.max_length, long_text=load_long_text_config())
+        texts = (texts * (runs // max(len(texts), 1) + 1))[:runs]
+
+        engine.predict_scores(texts[:8])  # warm-up
+
+        single = []
+        for text in texts:
+            start = time.perf_counter()
+            engine.predict_scores([text])
+            single.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        engine.predict_scores(texts, batch_size=32)
+        batch_seconds = time.perf_counter() - start
+
+        return {
+            'params_m': sum(p.numel() for p in engine.model.parameters()) / 1e6,
+            'p50_ms': float(np.percentile(single, 50)),
+            'p95_ms': float(np.percentile(single, 95)),
+            'batch_texts_per_s': len(texts) / batch_seconds
+        }
+
+    def report(self, threshold=0.5):
+        """Compare teacher and student accuracy and latency on the test set"""
+        print("\n" + "="*60)
+        print("📋 Teacher vs Student")
+        print("="*60)
+
+        texts = pd.read_csv(self.test_path)['text'].astype(str).tolist()
+        rows = {}
+
+        for name, path in [('teacher', self.teacher_path), ('student', self.output_dir)]:
+            metrics, _ = ModelEvaluator(path).evaluate(
+                threshold=threshold,
+                test_path=self.test_path,
+                save_path=os.path.join(self.output_dir, f'evaluation_results_{name}.csv')
+            )
+            rows[name] = {
+                'macro_f1': float(np.nanmean([m['f1'] for m in metrics.values()])),
+                'macro_auc': float(np.nanmean([m['auc'] for m in metrics.values()])),
+                'per_label': metrics,
+                **self.measure_latency(path, texts)
+            }
+
+        print(f"\n{'':<10}{'params':>9}{'p50 ms':>9}{'p95 ms':>9}{'batch/s':>10}{'F1':>8}{'AUC':>8}")
+        for name, row in rows.items():
+            print(f"{name:<10}{row['params_m']:>8.1f}M{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}"
+                  f"{row['batch_texts_per_s']:>10.1f}{row['macro_f1']:>8.4f}{row['macro_auc']:>8.4f}")
+
+        teacher, student = rows['teacher'], rows['student']
+        print(f"\n⚡ Speed-up (p50): x{teacher['p50_ms'] / student['p50_ms']:.2f}")
+        print(f"🎯 Macro F1 change: {student['macro_f1'] - teacher['macro_f1']:+.4f}")
+
+        report_path = os.path.join(self.output_dir, 'distillation_report.json')
+        with open(report_path, 'w') as f:
+            json.dump({'teacher_path': str(self.teacher_path), 'threshold': threshold, **rows}, f, indent=2)
+        print(f"💾 Report saved to: {report_path}")
+
+        return rows
+
+def main():
+    """Main distillation function"""
+    try:
+        distiller = ModelDistiller()
+        distiller.distill()
+        distiller.report(threshold=distiller.distill_config['eval_threshold'])
+
+        print("\n✨ Distillation complete!")
+        print(f"   Serve it with: MODEL_PATH={distiller.distill_config['output_dir']} python app.py")
+    except Exception as e:
+        print(f"\n❌ Distillation failed: {str(e)}")
+        raise
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,466 @@
+"""
+Early-Exit Classifier
+Adds small classification heads after intermediate layers of the fine-tuned
+classifier. At inference a text (or long-text window) stops at the first exit
+that is confident on every label, and only the rest of the batch runs the
+next layer, so batches shrink as their members exit. The last exit is the
+classifier's own head.
+
+Usage: python early_exit.py                train heads, calibrate, report
+       python early_exit.py --report-only  calibrate and report an existing model
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+import torch
+from sklearn.metrics import f1_score
+from transformers import TrainingArguments, Trainer, EarlyStoppingCallback
+from transformers.modeling_outputs import SequenceClassifierOutput
+from inference_engine import InferenceEngine
+from model_loader import is_quantized_artifact, layer_stack, load_classifier
+from train_model import ToxicityTrainer
+
+# Written next to the backbone's config.json by EarlyExitClassifier.save
+EXIT_HEADS = 'exit_heads.pt'
+EXIT_CONFIG = 'early_exit.json'
+
+DEFAULT_EARLY_EXIT_CONFIG = {
+    'base': 'models/toxic-classifier',      # fine-tuned fp32 classifier to add exits to
+    'output_dir': 'models/toxic-classifier-early-exit',
+    'exit_layers': None,                    # 1-based layers with an exit head; null = all but the last
+    'freeze_backbone': True,                # train the heads only; the last exit stays the original model
+    'eval_threshold': 0.5,
+    'max_f1_drop': 0.01,                    # calibration: lowest confidence within this macro F1 drop
+    'confidence_grid': [0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.98],
+    'batch_size': 32,                       # texts per forward pass when measuring latency
+    'training': {}                          # overrides for the training section
+}
+
+class _StopForward(Exception):
+    pass
+
+def final_head_logits(model, hidden):
+    """The classifier's own head applied to the last layer's hidden states"""
+    if hasattr(model, 'pre_classifier'):
+        # DistilBERT: [CLS] -> pre_classifier -> ReLU -> dropout -> classifier
+        pooled = torch.relu(model.pre_classifier(hidden[:, 0]))
+        return model.classifier(model.dropout(pooled))
+    if hasattr(model.classifier, 'out_proj'):
+        # RoBERTa / XLM-R heads pool the sequence themselves
+        return model.classifier(hidden)
+    base = getattr(model, model.base_model_prefix)
+    pooled = base.pooler(hidden) if getattr(base, 'pooler', None) is not None else hidden[:, 0]
+    return model.classifier(model.dropout(pooled))
+
+def exit_confidence(probs):
+    """Per-row confidence: the least certain label's distance from 0.5, as max(p, 1 - p)"""
+    return torch.maximum(probs, 1 - probs).min(dim=-1).values
+
+class ExitHead(torch.nn.Module):
+    """[CLS] -> dense + tanh -> dropout -> per-label logits"""
+
+    def __init__(self, hidden_size, num_labels, dropout=0.1):
+        super().__init__()
+        self.dense = torch.nn.Linear(hidden_size, hidden_size)
+        self.dropout = torch.nn.Dropout(dropout)
+        self.classifier = torch.nn.Linear(hidden_size, num_labels)
+
+    def forward(self, hidden):
+        return self.classifier(self.dropout(torch.tanh(self.dense(hidden[:, 0]))))
+
+class EarlyExitClassifier(torch.nn.Module):
+    """
+    A sequence classifier plus exit heads
+
+    Behaves like the wrapped model for the inference engine: forward()
+    returns an output with .logits. With labels (training) it returns the
+    weighted loss over all exits and the logits of every exit, stacked as
+    (batch, exits, labels). Without labels, and with a confidence set, it
+    runs layer by layer and exits early.
+    """
+
+    def __init__(self, model, exit_layers=None, confidence=None):
+        super().__init__()
+        self.model = model
+        self.config = model.config
+        self.num_layers = len(layer_stack(model).layer)
+        self.exit_layers = sorted(exit_layers or range(1, self.num_layers))
+        if not all(1 <= layer < self.num_layers for layer in self.exit_layers):
+            raise ValueError(f"exit_layers must be between 1 and {self.num_layers - 1}")
+
+        dropout = getattr(self.config, 'hidden_dropout_prob', getattr(self.config, 'dropout', 0.1))
+        self.heads = torch.nn.ModuleDict({
+            str(layer): ExitHead(self.config.hidden_size, self.config.num_labels, dropout)
+            for layer in self.exit_layers
+        })
+        self.confidence = confidence
+        # Per-thread list that forward() appends exit layers to, when set (see backends.py)
+        self.recorder = threading.local()
+
+    def forward(self, input_ids=None, attention_mask=None, labels=None):
+        if labels is not None or self.training or self.confidence is None:
+            return self._forward_all_exits(input_ids, attention_mask, labels)
+
+        logits, exits = self.forward_early_exit(input_ids, attention_mask, self.confidence)
+        log = getattr(self.recorder, 'exits', None)
+        if log is not None:
+            log.extend(exits.tolist())
+        return SequenceClassifierOutput(logits=logits)
+
+    def _forward_all_exits(self, input_ids, attention_mask, labels=None):
+        outputs = self.model(input_ids=input_ids, attention_mask=attention_mask, output_hidden_states=True)
+        if labels is None:
+            return SequenceClassifierOutput(logits=outputs.logits)
+
+        # hidden_states[0] is the embedding output, hidden_states[n] layer n's
+        exit_logits = [self.heads[str(layer)](outputs.hidden_states[layer]) for layer in self.exit_layers]
+        exit_logits.append(outputs.logits)
+
+        # Deeper exits weigh more, so the early heads don't pull the backbone toward shallow features
+        depths = self.exit_layers + [self.num_layers]
+        loss_fn = torch.nn.BCEWithLogitsLoss()
+        loss = sum(depth * loss_fn(logits, labels.float()) for depth, logits in zip(depths, exit_logits)) / sum(depths)
+
+        return SequenceClassifierOutput(loss=loss, logits=torch.stack(exit_logits, dim=1))
+
+    def all_exit_logits(self, input_ids, attention_mask):
+        """(batch, exits, labels) logits of every exit, for calibration"""
+        outputs = self.model(input_ids=input_ids, attention_mask=attention_mask, output_hidden_states=True)
+        exit_logits = [self.heads[str(layer)](outputs.hidden_states[layer]) for layer in self.exit_layers]
+        return torch.stack(exit_logits + [outputs.logits], dim=1)
+
+    def _layer_inputs(self, input_ids, attention_mask):
+        """
+        The arguments the base model passes to its first layer
+
+        The embeddings and the attention mask format differ between
+        architectures and transformers versions, so run the base model up
+        to layer 0 and take whatever it built.
+        """
+        captured = {}
+
+        def capture(module, args, kwargs):
+            captured.update(args=args, kwargs=kwargs)
+            raise _StopForward
+
+        handle = layer_stack(self.model).layer[0].register_forward_pre_hook(capture, with_kwargs=True)
+        try:
+            getattr(self.model, self.model.base_model_prefix)(input_ids=input_ids, attention_mask=attention_mask)
+        except _StopForward:
+            pass
+        finally:
+            handle.remove()
+        return list(captured['args']), dict(captured['kwargs'])
+
+    def forward_early_exit(self, input_ids, attention_mask, confidence):
+        """
+        Run layer by layer; rows confident at an exit leave the batch
+
+        Returns:
+            (logits, exit layer per row)
+        """
+        args, kwargs = self._layer_inputs(input_ids, attention_mask)
+        hidden_key = None if args else next(key for key in ('hidden_states', 'x') if key in kwargs)
+
+        batch_size = input_ids.shape[0]
+        logits = torch.zeros(batch_size, self.config.num_labels, device=input_ids.device)
+        exits = torch.full((batch_size,), self.num_layers, dtype=torch.long)
+        active = torch.arange(batch_size, device=input_ids.device)
+
+        for number, layer in enumerate(layer_stack(self.model).layer, start=1):
+            output = layer(*args, **kwargs)
+            hidden = output[0] if isinstance(output, tuple) else output
+            if hidden_key:
+                kwargs[hidden_key] = hidden
+            else:
+                args[0] = hidden
+
+            if number == self.num_layers:
+                logits[active] = final_head_logits(self.model, hidden).float()
+                break
+            if str(number) not in self.heads:
+                continue
+
+            head_logits = self.heads[str(number)](hidden).float()
+            done = exit_confidence(torch.sigmoid(head_logits)) >= confidence
+            if not done.any():
+                continue
+
+            logits[active[done]] = head_logits[done]
+            exits[active[done].cpu()] = number
+            keep = ~done
+            if not keep.any():
+                break
+
+            # Shrink every per-row tensor argument (hidden states, mask) to the rows still running
+            rows = len(active)
+            args = [value[keep] if _per_row(value, rows) else value for value in args]
+            kwargs = {key: value[keep] if _per_row(value, rows) else value for key, value in kwargs.items()}
+            active = active[keep]
+
+        return logits, exits
+
+    def save(self, output_dir, tokenizer):
+        """Backbone and tokenizer as usual, heads and exit settings next to them"""
+        self.model.save_pretrained(output_dir)
+        tokenizer.save_pretrained(output_dir)
+        torch.save(self.heads.state_dict(), os.path.join(output_dir, EXIT_HEADS))
+        save_exit_config(output_dir, self.exit_layers, self.confidence)
+
+def _per_row(value, rows):
+    return isinstance(value, torch.Tensor) and value.dim() > 0 and value.shape[0] == rows
+
+def save_exit_config(model_path, exit_layers, confidence):
+    with open(os.path.join(model_path, EXIT_CONFIG), 'w') as f:
+        json.dump({'exit_layers': exit_layers, 'confidence': confidence}, f, indent=2)
+
+def is_early_exit_artifact(model_path):
+    return os.path.exists(os.path.join(model_path, EXIT_HEADS))
+
+def load_early_exit(model_path, confidence=None):
+    """
+    Load an early-exit model directory
+
+    Returns:
+        (tokenizer, model, device) like model_loader.load_classifier; the
+        calibrated confidence from early_exit.json is used unless given
+    """
+    tokenizer, model, device = load_classifier(model_path)
+    with open(os.path.join(model_path, EXIT_CONFIG)) as f:
+        exit_config = json.load(f)
+
+    classifier = EarlyExitClassifier(model, exit_config['exit_layers'],
+                                     confidence if confidence is not None else exit_config['confidence'])
+    classifier.heads.load_state_dict(torch.load(os.path.join(model_path, EXIT_HEADS), map_location='cpu'))
+    classifier.to(device)
+    classifier.eval()
+    return tokenizer, classifier, device
+
+def simulate_exits(exit_probs, confidence):
+    """
+    Scores and exit index per text if every exit's probabilities are known
+
+    Args:
+        exit_probs: (texts, exits, labels) array; the last exit always answers
+    """
+    confident = np.minimum.reduce(np.maximum(exit_probs, 1 - exit_probs), axis=2) >= confidence
+    confident[:, -1] = True
+    chosen = confident.argmax(axis=1)
+    return exit_probs[np.arange(len(exit_probs)), chosen], chosen
+
+class EarlyExitTrainer(ToxicityTrainer):
+    """Train exit heads on the fine-tuned classifier, calibrate the exit confidence, report"""
+
+    def __init__(self, config_path='config.yaml'):
+        super().__init__(config_path)
+        self.exit_config = {**DEFAULT_EARLY_EXIT_CONFIG, **(self.config.get('early_exit') or {})}
+
+        base = self.exit_config['base']
+        # Local model directories are relative to this script; anything else is a hub id
+        local_base = os.path.join(self.script_dir, base)
+        self.base_path = local_base if os.path.exists(local_base) else base
+        self.output_dir = os.path.join(self.script_dir, self.exit_config['output_dir'])
+        self.test_path = os.path.join(self.script_dir, 'data/test_dataset.csv')
+
+    def build_model(self):
+        """The base classifier wrapped with exit heads (backbone frozen by default)"""
+        if os.path.isdir(self.base_path) and is_quantized_artifact(self.base_path):
+            raise ValueError(f"{self.base_path} is an INT8 artifact; early exits are trained on the fp32 model")
+
+        print(f"\n🪜 Adding exit heads to: {self.base_path}")
+        tokenizer, model, _ = load_classifier(self.base_path)
+        classifier = EarlyExitClassifier(model, self.exit_config['exit_layers'])
+        if self.exit_config['freeze_backbone']:
+            for parameter in model.parameters():
+                parameter.requires_grad = False
+
+        print(f"   Exits after layers {classifier.exit_layers} of {classifier.num_layers} (+ final head)")
+        return tokenizer, classifier
+
+    def compute_exit_metrics(self, pred):
+        """compute_metrics per exit; 'f1' is the mean over exits (used to pick the best epoch)"""
+        metrics = {}
+        for index in range(pred.predictions.shape[1]):
+            exit_metrics = self.compute_metrics(SimpleNamespace(label_ids=pred.label_ids,
+                                                                predictions=pred.predictions[:, index]))
+            metrics[f'f1_exit_{index + 1}'] = exit_metrics['f1']
+        metrics['f1'] = float(np.mean(list(metrics.values())))
+        return metrics
+
+    def train(self):
+        """Train the exit heads and save the model for the early_exit backend"""
+        print("\n" + "="*60)
+        print("🏋️ Training Early-Exit Heads")
+        print("="*60)
+
+        train_df, val_df = self.split_data()
+        tokenizer, classifier = self.build_model()
+
+        training = {**self.config['training'], **(self.exit_config.get('training') or {})}
+        training_args = TrainingArguments(
+            output_dir=self.output_dir,
+            num_train_epochs=training['num_epochs'],
+            per_device_train_batch_size=training['batch_size'],
+            per_device_eval_batch_size=training['batch_size'],
+            learning_rate=float(training['learning_rate']),
+            weight_decay=training['weight_decay'],
+            warmup_steps=training['warmup_steps'],
+            gradient_accumulation_steps=training['gradient_accumulation_steps'],
+            eval_strategy="epoch",
+            save_strategy="epoch",
+            load_best_model_at_end=True,
+            metric_for_best_model="f1",
+            logging_dir=self.config['logging']['tensorboard_dir'],
+            logging_steps=100,
+            report_to="tensorboard",
+            save_total_limit=2,
+            fp16=torch.cuda.is_available(),
+            dataloader_num_workers=0,
+        )
+
+        trainer = Trainer(
+            model=classifier,
+            args=training_args,
+            train_dataset=self.tokenize_data(train_df, tokenizer),
+            eval_dataset=self.tokenize_data(val_df, tokenizer),
+            compute_metrics=self.compute_exit_metrics,
+            callbacks=[EarlyStoppingCallback(
+                early_stopping_patience=training['early_stopping_patience'],
+                early_stopping_threshold=training['early_stopping_threshold']
+            )]
+        )
+
+        print("\n🏃 Training exit heads...")
+        trainer.train()
+
+        print(f"\n💾 Saving early-exit model to: {self.output_dir}")
+        classifier.save(self.output_dir, tokenizer)
+
+        return classifier
+
+    def exit_probabilities(self, classifier, tokenizer, texts, device):
+        """(texts, exits, labels) sigmoid scores of every exit"""
+        probs = []
+        classifier.eval()
+        for start in range(0, len(texts), 64):
+            encodings = tokenizer(texts[start:start + 64], truncation=True, padding=True,
+                                  max_length=self.max_length, return_tensors='pt')
+            with torch.no_grad():
+                logits = classifier.all_exit_logits(encodings['input_ids'].to(device),
+                                                    encodings['attention_mask'].to(device))
+            probs.append(torch.sigmoid(logits.float()).cpu().numpy())
+        return np.concatenate(probs)
+
+    def macro_f1(self, labels, scores):
+        return float(f1_score(labels, scores >= self.exit_config['eval_threshold'], average='macro', zero_division=0))
+
+    def calibrate(self, classifier, tokenizer, device):
+        """
+        Lowest exit confidence whose validation macro F1 is within max_f1_drop of the full model
+
+        A lower confidence lets more texts leave early. Saved to
+        early_exit.json for serving; 1.0 means no confidence qualified and
+        every text runs all layers.
+        """
+        _, val_df = self.split_data()
+        labels = val_df[self.label_columns].values.astype(int)
+        probs = self.exit_probabilities(classifier, tokenizer, val_df['text'].astype(str).tolist(), device)
+        full_f1 = self.macro_f1(labels, probs[:, -1])
+
+        chosen = 1.0
+        for confidence in sorted(self.exit_config['confidence_grid']):
+            scores, _ = simulate_exits(probs, confidence)
+            if full_f1 - self.macro_f1(labels, scores) <= self.exit_config['max_f1_drop']:
+                chosen = confidence
+                break
+
+        print(f"\n🎚️ Exit confidence: {chosen} (validation macro F1 {full_f1:.4f} for the full model, "
+              f"max drop {self.exit_config['max_f1_drop']})")
+        classifier.confidence = chosen
+        save_exit_config(self.output_dir, classifier.exit_layers, chosen)
+        return chosen
+
+    def measure_latency(self, classifier, tokenizer, texts, device, confidence):
+        """Milliseconds per text in length-sorted batches; confidence None runs every layer"""
+        classifier.confidence = confidence
+        engine = InferenceEngine.from_model(classifier, tokenizer, device, self.max_length,
+                                            config={'batch_size': self.exit_config['batch_size']})
+
+        def run():
+            engine.predict_scores(texts)
+
+        run()  # warm-up
+        best = float('inf')
+        for _ in range(3):
+            start = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - start)
+        return best / len(texts) * 1000
+
+    def report(self):
+        """Average layers used, macro F1 and latency per confidence on the test set"""
+        tokenizer, classifier, device = load_early_exit(self.output_dir)
+        calibrated = self.calibrate(classifier, tokenizer, device)
+
+        print("\n" + "="*60)
+        print("📋 Early Exit on data/test_dataset.csv")
+        print("="*60)
+
+        test_df = pd.read_csv(self.test_path)
+        texts = test_df['text'].astype(str).tolist()
+        labels = test_df[self.label_columns].values.astype(int)
+        probs = self.exit_probabilities(classifier, tokenizer, texts, device)
+        depths = np.array(classifier.exit_layers + [classifier.num_layers])
+
+        full_ms = self.measure_latency(classifier, tokenizer, texts, device, None)
+        rows = [{'confidence': None, 'avg_layers': float(classifier.num_layers),
+                 'macro_f1': self.macro_f1(labels, probs[:, -1]), 'ms_per_text': full_ms}]
+        for confidence in sorted(set(self.exit_config['confidence_grid']) | {calibrated}):
+            scores, chosen = simulate_exits(probs, confidence)
+            rows.append({
+                'confidence': confidence,
+                'avg_layers': float(depths[chosen].mean()),
+                'macro_f1': self.macro_f1(labels, scores),
+                'ms_per_text': self.measure_latency(classifier, tokenizer, texts, device, confidence)
+            })
+
+        print(f"\n{'confidence':>11}{'avg layers':>12}{'macro F1':>10}{'ms/text':>9}{'saved':>8}")
+        for row in rows:
+            label = 'all layers' if row['confidence'] is None else f"{row['confidence']:g}"
+            marker = '  <- calibrated' if row['confidence'] == calibrated else ''
+            print(f"{label:>11}{row['avg_layers']:>12.2f}{row['macro_f1']:>10.4f}{row['ms_per_text']:>9.2f}"
+                  f"{1 - row['ms_per_text'] / full_ms:>8.0%}{marker}")
+
+        report_path = os.path.join(self.output_dir, 'early_exit_report.json')
+        with open(report_path, 'w') as f:
+            json.dump({'calibrated_confidence': calibrated, 'num_layers': classifier.num_layers,
+                       'exit_layers': classifier.exit_layers, 'rows': rows}, f, indent=2)
+        print(f"💾 Report saved to: {report_path}")
+
+        return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Train and evaluate early-exit heads')
+    parser.add_argument('--report-only', action='store_true', help='skip training, use the saved model')
+    args = parser.parse_args()
+
+    try:
+        trainer = EarlyExitTrainer()
+        if not args.report_only:
+            trainer.train()
+        trainer.report()
+
+        print("\n✨ Early exit ready!")
+        print(f"   Serve it with: MODEL_BACKEND=early_exit MODEL_PATH={trainer.exit_config['output_dir']} python app.py")
+    except Exception as e:
+        print(f"\n❌ Early-exit training failed: {str(e)}")
+        raise
+
+if __name__ == "__main__":
+    main()
@@ -4,10 +4,8 @@ Evaluates trained model on test set and generates detailed reports
 """
 
 import os
-import torch
 import pandas as pd
 import numpy as np
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
 from sklearn.metrics import (
     classification_report,
     confusion_matrix,
@@ -16,6 +14,8 @@ from sklearn.metrics import (
 )
 import matplotlib.pyplot as plt
 import seaborn as sns
+from inference_engine import load_engine
+from windowing import load_long_text_config
 
 class ModelEvaluator:
     """Evaluate trained toxic content classifier"""
@@ -25,15 +25,12 @@ class ModelEvaluator:
         self.label_columns = ['toxic', 'severe_toxic', 'obscene', 'threat', 'insult', 'identity_hate']
         
         print(f"📊 Loading model from: {model_path}")
-        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
-        self.model = AutoModelForSequenceClassification.from_pretrained(model_path)
-        self.model.eval()
+        # Handles both fp32 and INT8 quantized artifacts (GPU used for fp32 if available)
+        self.engine = load_engine(model_path, long_text=load_long_text_config())
+        self.tokenizer, self.model, self.device = self.engine.tokenizer, self.engine.model, self.engine.device
+        self.quantized = self.engine.quantized
         
-        # Use GPU if available
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.model.to(self.device)
-        
-        print(f"✅ Model loaded on {self.device}")
+        print(f"✅ Model loaded on {self.device}{' (int8)' if self.quantized else ''}")
     
     def load_test_data(self, test_path='data/test_dataset.csv'):
         """Load test dataset"""
@@ -47,45 +44,19 @@ class ModelEvaluator:
         
         return df
     
-    def predict(self, texts, batch_size=16):
-        """Make predictions on texts"""
-        all_predictions = []
-        
-        for i in range(0, len(texts), batch_size):
-            batch_texts = texts[i:i+batch_size]
-            
-            # Tokenize
-            encodings = self.tokenizer(
-                batch_texts,
-                truncation=True,
-                padding=True,
-                max_length=256,
-                return_tensors='pt'
-            )
-            
-            # Move to device
-            input_ids = encodings['input_ids'].to(self.device)
-            attention_mask = encodings['attention_mask'].to(self.device)
-            
-            # Predict
-            with torch.no_grad():
-                outputs = self.model(input_ids=input_ids, attention_mask=attention_mask)
-                logits = outputs.logits
-                
-                # Apply sigmoid for multi-label
-                predictions = torch.sigmoid(logits).cpu().numpy()
-                all_predictions.extend(predictions)
-        
-        return np.array(all_predictions)
+    def predict(self, texts, batch_size=None):
+        """Make predictions on texts (batch_size defaults to inference.engine.batch_size)"""
+        # Same tokenization, batching and long-text windows as the service
+        return self.engine.predict_scores(list(texts), batch_size=batch_size)
     
-    def evaluate(self, threshold=0.5):
+    def evaluate(self, threshold=0.5, test_path='data/test_dataset.csv', save_path='evaluation_results.csv'):
         """Evaluate model on test set"""
         print("\n" + "="*60)
         print("🧪 Starting Model Evaluation")
         print("="*60)
         
         # Load test data
-        df = self.load_test_data()
+        df = self.load_test_data(test_path)
         texts = df['text'].tolist()
         true_labels = df[self.label_columns].values
         
@@ -115,12 +86,14 @@ class ModelEvaluator:
             except:
                 auc = 0.0
             
+            # Labels with no positives in either y_true or y_pred have no '1' row
+            positive = report.get('1', {'precision': 0.0, 'recall': 0.0, 'f1-score': 0.0, 'support': 0})
             results[label] = {
-                'precision': report['1']['precision'],
-                'recall': report['1']['recall'],
-                'f1': report['1']['f1-score'],
+                'precision': positive['precision'],
+                'recall': positive['recall'],
+                'f1': positive['f1-score'],
                 'auc': auc,
-                'support': report['1']['support']
+                'support': positive['support']
             }
             
             print(f"\n{label.upper()}")
@@ -151,8 +124,8 @@ class ModelEvaluator:
         
         # Save results
         results_df = pd.DataFrame(results).T
-        results_df.to_csv('evaluation_results.csv')
-        print(f"\n💾 Results saved to: evaluation_results.csv")
+        results_df.to_csv(save_path)
+        print(f"\n💾 Results saved to: {save_path}")
         
         # Sample predictions
         print("\n" + "="*60)
@@ -0,0 +1,253 @@
+"""
+Batch Inference Engine
+The one scoring path shared by app.py's backends, evaluate_model.py,
+bulk_moderate.py and the training/compression scripts. Texts are tokenized
+once without padding (long ones split into overlapping windows), the
+windows are sorted into length buckets, every batch is padded only to its
+own longest window and run without autograd on PyTorch (fp32, reduced
+precision or INT8) or onnxruntime, and the logits become per-label sigmoid
+scores. Speed-ups made here apply to serving, evaluation and bulk jobs alike.
+"""
+
+import os
+import time
+import numpy as np
+from settings import load_config_section
+from windowing import aggregate_windows
+
+# torch/transformers are imported where needed, so importing this module
+# (e.g. for sigmoid in train_model.py) stays cheap
+
+DEFAULT_ENGINE_CONFIG = {
+    'batch_size': 64,           # windows per forward pass
+    'bucket_by_length': True,   # sort windows by token count so each batch pads little
+    'pad_to_multiple_of': 0,    # round padded lengths up (8 suits GPU tensor cores); 0 = longest window
+    'inference_mode': True,     # torch.inference_mode; false uses torch.no_grad
+    'threads': 0                # torch threads on the calling thread; 0 = leave as set (serve.py, OMP_NUM_THREADS)
+}
+
+# pytorch runs the directory as found: fp32, an INT8 artifact or memory-budget weights
+ENGINE_BACKENDS = ('pytorch', 'quantized', 'onnx')
+
+ONNX_WEIGHTS = 'model.onnx'
+
+# onnxruntime is optional - only the onnx backend needs it
+try:
+    import onnxruntime
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+def load_engine_config(config_path='config.yaml'):
+    """Read inference.engine from config.yaml"""
+    inference = load_config_section('inference', {}, config_path)
+    return {**DEFAULT_ENGINE_CONFIG, **(inference.get('engine') or {})}
+
+def sigmoid(logits):
+    """Per-label probabilities from multi-label logits (float32, no overflow warnings)"""
+    logits = np.asarray(logits, dtype=np.float32)
+    return np.exp(-np.logaddexp(0, -logits)).astype(np.float32)
+
+class TorchRunner:
+    """Forward passes of a PyTorch classifier, without autograd"""
+
+    tensor_type = 'pt'
+
+    def __init__(self, model, device, inference_mode=True, threads=0):
+        self.model = model
+        self.device = device
+        self.inference_mode = inference_mode
+        self.threads = threads
+
+    def __call__(self, input_ids, attention_mask):
+        import torch
+
+        # The thread count is per calling thread (OpenMP), so it is checked on every call
+        if self.threads and torch.get_num_threads() != self.threads:
+            torch.set_num_threads(self.threads)
+        with torch.inference_mode() if self.inference_mode else torch.no_grad():
+            outputs = self.model(input_ids=input_ids.to(self.device), attention_mask=attention_mask.to(self.device))
+        return outputs.logits.float().cpu().numpy()
+
+    def info(self):
+        parameter = next(self.model.parameters(), None)
+        return {'device': str(self.device),
+                'dtype': str(parameter.dtype).replace('torch.', '') if parameter is not None else None}
+
+class ONNXRunner:
+    """Forward passes of model.onnx with onnxruntime on CPU"""
+
+    tensor_type = 'np'
+
+    def __init__(self, model_path, threads=0):
+        if not ONNX_AVAILABLE:
+            raise RuntimeError("onnxruntime not installed - pip install onnxruntime")
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = threads or 0
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_path, ONNX_WEIGHTS),
+            sess_options=session_options,
+            providers=['CPUExecutionProvider']
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def __call__(self, input_ids, attention_mask):
+        feed = {'input_ids': input_ids.astype(np.int64), 'attention_mask': attention_mask.astype(np.int64)}
+        return self.session.run(None, {name: value for name, value in feed.items() if name in self.input_names})[0]
+
+    def info(self):
+        return {'device': 'cpu', 'dtype': 'float32'}
+
+class InferenceEngine:
+    """
+    Scores texts with one loaded classifier
+
+    long_text is the inference.long_text config (windowing.py); None or
+    enabled: false truncates texts to max_length instead.
+    """
+
+    def __init__(self, runner, tokenizer, num_labels, max_length=256, long_text=None, config=None,
+                 backend='pytorch', quantized=False, model=None, model_config=None):
+        self.runner = runner
+        self.tokenizer = tokenizer
+        self.num_labels = num_labels
+        self.max_length = min(max_length, tokenizer.model_max_length)
+        self.long_text = long_text if long_text and long_text.get('enabled') else None
+        self.config = {**DEFAULT_ENGINE_CONFIG, **(config or {})}
+        self.backend = backend
+        self.quantized = quantized
+        self.model = model
+        self.model_config = model_config if model_config is not None else getattr(model, 'config', None)
+
+    @classmethod
+    def from_model(cls, model, tokenizer, device, max_length=256, long_text=None, config=None, threads=None, **kwargs):
+        """Engine around an already loaded PyTorch classifier (fp32, INT8, early-exit, pruned...)"""
+        config = {**load_engine_config(), **(config or {})}
+        runner = TorchRunner(model, device, config['inference_mode'], threads or config['threads'])
+        return cls(runner, tokenizer, model.config.num_labels, max_length, long_text, config, model=model, **kwargs)
+
+    @property
+    def device(self):
+        return getattr(self.runner, 'device', None)
+
+    def encode(self, texts):
+        """(windows, text index of each window) as unpadded token id lists"""
+        encodings = self.tokenizer(
+            texts,
+            truncation=True,
+            max_length=self.max_length,
+            stride=self.long_text['stride'] if self.long_text else 0,
+            return_overflowing_tokens=bool(self.long_text),
+            padding=False
+        )
+        sample_map = encodings['overflow_to_sample_mapping'] if self.long_text else list(range(len(texts)))
+        return encodings['input_ids'], sample_map
+
+    def pad(self, windows):
+        multiple = self.config['pad_to_multiple_of'] or None
+        if multiple and -(-max(len(window) for window in windows) // multiple) * multiple > self.max_length:
+            multiple = None
+        return self.tokenizer.pad({'input_ids': windows}, pad_to_multiple_of=multiple,
+                                  return_tensors=self.runner.tensor_type)
+
+    def predict_scores(self, texts, stats=None, batch_size=None):
+        """
+        (len(texts), num_labels) sigmoid scores, in the model's label order
+
+        If a stats dict is passed it is filled with tokenize/forward/aggregate
+        seconds and the (windows, padded length) shape of every forward pass.
+        """
+        started = time.perf_counter()
+        windows, sample_map = self.encode(texts)
+        batch_size = batch_size or self.config['batch_size']
+        order = sorted(range(len(windows)), key=lambda i: len(windows[i])) if self.config['bucket_by_length'] \
+            else list(range(len(windows)))
+        logits = np.zeros((len(windows), self.num_labels), dtype=np.float32)
+        tokenize_seconds, forward_seconds, shapes = time.perf_counter() - started, 0.0, []
+
+        for start in range(0, len(order), batch_size):
+            batch_ids = order[start:start + batch_size]
+            pad_start = time.perf_counter()
+            batch = self.pad([windows[i] for i in batch_ids])
+            forward_start = time.perf_counter()
+            tokenize_seconds += forward_start - pad_start
+
+            logits[batch_ids] = self.runner(batch['input_ids'], batch['attention_mask'])
+            forward_seconds += time.perf_counter() - forward_start
+            shapes.append(tuple(batch['input_ids'].shape))
+
+        aggregate_start = time.perf_counter()
+        # One window per text (the common case) needs no per-text aggregation
+        if len(windows) == len(texts):
+            scores = sigmoid(logits)
+        else:
+            scores = aggregate_windows(logits, sample_map, len(texts), self.long_text['aggregation'])
+
+        if stats is not None:
+            stats.update(
+                tokenize_seconds=tokenize_seconds,
+                forward_seconds=forward_seconds,
+                aggregate_seconds=time.perf_counter() - aggregate_start,
+                batch_shapes=shapes
+            )
+
+        return scores
+
+    def warm_up(self, lengths=(8, 32, 128, 256), batch_sizes=(1, 8)):
+        """
+        Run dummy batches across sequence lengths and batch sizes
+
+        The first forward pass at each shape pays for allocator growth and kernel
+        selection; doing it here keeps that cost off the first real requests.
+        """
+        for length in lengths:
+            # Each repeated word is at least one token, so truncation gives exactly `length`
+            window = self.tokenizer(' '.join(['warmup'] * length), truncation=True,
+                                    max_length=min(length, self.max_length))['input_ids']
+            for batch_size in batch_sizes:
+                batch = self.pad([window] * batch_size)
+                self.runner(batch['input_ids'], batch['attention_mask'])
+
+    def info(self):
+        return {'engine': self.backend, 'quantized': self.quantized, **self.runner.info(),
+                'batch_size': self.config['batch_size'], 'bucket_by_length': self.config['bucket_by_length'],
+                'inference_mode': self.config['inference_mode'], 'threads': getattr(self.runner, 'threads', None) or None,
+                'long_text': bool(self.long_text)}
+
+def load_engine(model_path, backend='pytorch', max_length=256, long_text=None, config=None,
+                memory_budget=False, threads=None):
+    """
+    Load a model directory behind an InferenceEngine
+
+    Args:
+        backend: 'pytorch' runs the directory as found (fp32, INT8 artifact,
+            memory-budget weights; GPU for fp32 when available), 'quantized'
+            applies dynamic INT8 on CPU unless it already is, 'onnx' runs
+            model.onnx (python backends.py export-onnx)
+        config: overrides of inference.engine
+        threads: overrides inference.engine.threads (the ensemble backend splits the CPU this way)
+    """
+    if backend not in ENGINE_BACKENDS:
+        raise ValueError(f"Unknown engine backend: {backend} (choose from {', '.join(ENGINE_BACKENDS)})")
+
+    if backend == 'onnx':
+        from transformers import AutoConfig, AutoTokenizer
+
+        config = {**load_engine_config(), **(config or {})}
+        model_config = AutoConfig.from_pretrained(model_path)
+        runner = ONNXRunner(model_path, threads or config['threads'])
+        return InferenceEngine(runner, AutoTokenizer.from_pretrained(model_path), model_config.num_labels,
+                               max_length, long_text, config, backend=backend, model_config=model_config)
+
+    import torch
+    from model_loader import is_quantized_artifact, load_classifier, quantize_dynamic_int8
+
+    tokenizer, model, device = load_classifier(model_path, memory_budget)
+    quantized = is_quantized_artifact(model_path)
+    if backend == 'quantized' and not quantized:
+        device = torch.device('cpu')
+        model = quantize_dynamic_int8(model.to(device))
+        quantized = True
+
+    return InferenceEngine.from_model(model, tokenizer, device, max_length, long_text, config, threads,
+                                      backend=backend, quantized=quantized)
@@ -0,0 +1,460 @@
+"""
+Asynchronous Moderation Jobs
+Durable job queue in a local SQLite file (WAL mode, no broker). Clients
+submit texts and get a job id at once; worker threads lease pending texts
+across all jobs in large batches, score them and store the results. Results
+can be polled or pushed to a callback URL.
+
+Every state change is one transaction, so a restart never loses a submitted
+job. A text leased by a worker that died is leased again once its lease
+expires. A result is stored only by the worker still holding the lease, so
+no text is counted twice.
+"""
+
+import ipaddress
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+import requests
+from settings import load_config_section
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOBS_CONFIG = {
+    'enabled': True,
+    'db_path': 'moderation_jobs.db',
+    'workers': 1,                 # worker threads per server process
+    'batch_size': 128,            # texts leased (and scored) at once, across jobs
+    'lease_seconds': 120,         # a batch not finished by then is leased again
+    'max_attempts': 3,            # a text failing this often gets an error result
+    'poll_interval_ms': 200,      # idle wait between lease attempts
+    'max_texts': 10000,           # per job
+    'callback_timeout': 10,
+    'callback_max_attempts': 6,   # retried with exponential backoff
+    'callback_backoff_seconds': 5,
+    'callback_allowed_hosts': [], # host names (and their subdomains); empty = any public address
+    'callback_allow_private': False,  # allow loopback/private/link-local callback addresses
+    'retention_hours': 72         # finished jobs are deleted after this long
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,               -- queued | running | done
+    threshold REAL NOT NULL,
+    callback_url TEXT,
+    total INTEGER NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    flagged INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    finished_at REAL,
+    callback_state TEXT,                -- pending | delivered | failed (NULL without callback)
+    callback_attempts INTEGER NOT NULL DEFAULT 0,
+    callback_next_at REAL,
+    callback_error TEXT
+);
+CREATE TABLE IF NOT EXISTS items (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,  -- FIFO order across jobs
+    job_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    item_id TEXT,                           -- client id, JSON encoded
+    text TEXT NOT NULL,
+    lease_id TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT                             -- JSON once scored
+);
+CREATE INDEX IF NOT EXISTS items_open ON items(seq) WHERE result IS NULL;
+CREATE INDEX IF NOT EXISTS items_job ON items(job_id, position);
+CREATE INDEX IF NOT EXISTS jobs_callbacks ON jobs(callback_next_at) WHERE callback_state = 'pending';
+"""
+
+def load_jobs_config(config_path='config.yaml'):
+    """Read the jobs section of config.yaml; db_path is relative to this directory"""
+    config = load_config_section('jobs', DEFAULT_JOBS_CONFIG, config_path)
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    if not os.path.isabs(config['db_path']):
+        config['db_path'] = os.path.join(script_dir, config['db_path'])
+    return config
+
+def validate_threshold(threshold):
+    """The threshold as a float in [0, 1]; ValueError otherwise"""
+    if isinstance(threshold, bool) or not isinstance(threshold, (int, float)) or not 0 <= threshold <= 1:
+        raise ValueError('threshold must be a number between 0 and 1')
+    return float(threshold)
+
+def check_callback_url(url, allowed_hosts=(), allow_private=False):
+    """
+    Refuse callback URLs the server must not POST to; ValueError otherwise
+
+    Only http(s) URLs qualify. With allowed_hosts, the host must be one of
+    them or a subdomain; otherwise every address it resolves to must be
+    public (no loopback, private, link-local or reserved ranges), so a job
+    can't make the server call internal services. Checked at submission and
+    again before every delivery, since DNS answers can change.
+    """
+    parts = urlsplit(str(url))
+    host = (parts.hostname or '').lower().rstrip('.')
+    if parts.scheme not in ('http', 'https') or not host:
+        raise ValueError('callback_url must be an http(s) URL')
+
+    if allowed_hosts:
+        if not any(host == allowed or host.endswith('.' + allowed) for allowed in (h.lower() for h in allowed_hosts)):
+            raise ValueError(f'callback_url host {host} is not allowed')
+        return url
+    if allow_private:
+        return url
+
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, parts.port or 443, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError):
+        raise ValueError(f'callback_url host {host} does not resolve')
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split('%')[0])
+        if not ip.is_global or ip.is_multicast:
+            raise ValueError(f'callback_url host {host} resolves to a non-public address')
+    return url
+
+class JobQueue:
+    """SQLite-backed jobs and their texts; safe to share between threads and processes"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = sqlite3.connect(db_path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        conn.close()
+
+    def _connection(self):
+        # One connection per thread (and per process after a fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def submit(self, items, threshold=0.7, callback_url=None):
+        """Store a job of (item_id, text) pairs; returns its id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, status, threshold, callback_url, total, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, 'queued', threshold, callback_url, len(items), now)
+            )
+            conn.executemany(
+                'INSERT INTO items (job_id, position, item_id, text) VALUES (?, ?, ?, ?)',
+                [(job_id, position, json.dumps(item_id), text) for position, (item_id, text) in enumerate(items)]
+            )
+        return job_id
+
+    def lease(self, batch_size, lease_seconds):
+        """
+        Claim up to batch_size unscored texts (oldest first, any job)
+
+        Returns (lease_id, [(seq, text, threshold), ...]); texts whose lease
+        expired are claimed again.
+        """
+        lease_id = uuid.uuid4().hex
+        now = time.time()
+        with self._transaction() as conn:
+            rows = conn.execute(
+                'SELECT items.seq, items.text, jobs.threshold, items.job_id FROM items '
+                'JOIN jobs ON jobs.id = items.job_id '
+                'WHERE items.result IS NULL AND (items.lease_until IS NULL OR items.lease_until < ?) '
+                'ORDER BY items.seq LIMIT ?',
+                (now, batch_size)
+            ).fetchall()
+            if not rows:
+                return None, []
+
+            conn.executemany(
+                'UPDATE items SET lease_id = ?, lease_until = ?, attempts = attempts + 1 WHERE seq = ?',
+                [(lease_id, now + lease_seconds, row['seq']) for row in rows]
+            )
+            conn.executemany(
+                "UPDATE jobs SET status = 'running' WHERE id = ? AND status = 'queued'",
+                [(job_id,) for job_id in {row['job_id'] for row in rows}]
+            )
+        return lease_id, [(row['seq'], row['text'], row['threshold']) for row in rows]
+
+    def complete(self, lease_id, results):
+        """
+        Store results ({seq: result dict}) for texts still held by lease_id
+
+        Texts whose lease was lost (expired and claimed by another worker)
+        are skipped, so each text is counted exactly once. Returns the ids
+        of jobs this finished.
+        """
+        with self._transaction() as conn:
+            return self._store(conn, lease_id, results)
+
+    def release(self, lease_id, error, max_attempts):
+        """
+        Give a failed batch back to the queue
+
+        Texts that have now failed max_attempts times get an error result
+        instead, so one bad text can't block its job forever.
+        """
+        with self._transaction() as conn:
+            exhausted = conn.execute(
+                'SELECT seq FROM items WHERE lease_id = ? AND result IS NULL AND attempts >= ?',
+                (lease_id, max_attempts)
+            ).fetchall()
+            finished = self._store(conn, lease_id, {row['seq']: {'error': error} for row in exhausted})
+            conn.execute('UPDATE items SET lease_id = NULL, lease_until = NULL WHERE lease_id = ? AND result IS NULL',
+                         (lease_id,))
+        return finished
+
+    def _store(self, conn, lease_id, results):
+        now = time.time()
+        counts = {}
+        for seq, result in results.items():
+            row = conn.execute(
+                'SELECT job_id FROM items WHERE seq = ? AND lease_id = ? AND result IS NULL',
+                (seq, lease_id)
+            ).fetchone()
+            if row is None:
+                continue
+            conn.execute(
+                'UPDATE items SET result = ?, lease_id = NULL, lease_until = NULL WHERE seq = ?',
+                (json.dumps(result), seq)
+            )
+            done, flagged = counts.get(row['job_id'], (0, 0))
+            counts[row['job_id']] = (done + 1, flagged + (1 if result.get('flagged') else 0))
+
+        finished = []
+        for job_id, (done, flagged) in counts.items():
+            conn.execute('UPDATE jobs SET completed = completed + ?, flagged = flagged + ? WHERE id = ?',
+                         (done, flagged, job_id))
+            job = conn.execute('SELECT total, completed, callback_url FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if job['completed'] >= job['total']:
+                conn.execute(
+                    "UPDATE jobs SET status = 'done', finished_at = ?, callback_state = ?, callback_next_at = ? "
+                    "WHERE id = ?",
+                    (now, 'pending' if job['callback_url'] else None, now, job_id)
+                )
+                finished.append(job_id)
+        return finished
+
+    def get(self, job_id, include_results=True):
+        """Job status dict (with per-text results in submission order), or None"""
+        conn = self._connection()
+        job = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if job is None:
+            return None
+
+        status = {
+            'job_id': job['id'],
+            'status': job['status'],
+            'total': job['total'],
+            'completed': job['completed'],
+            'flagged_count': job['flagged'],
+            'threshold': job['threshold'],
+            'created_at': job['created_at'],
+            'finished_at': job['finished_at']
+        }
+        if job['callback_url']:
+            status['callback'] = {
+                'state': job['callback_state'] or 'waiting',
+                'attempts': job['callback_attempts'],
+                'error': job['callback_error']
+            }
+        if include_results and job['status'] == 'done':
+            rows = conn.execute('SELECT item_id, result FROM items WHERE job_id = ? ORDER BY position', (job_id,))
+            status['results'] = [{'id': json.loads(row['item_id']), **json.loads(row['result'])} for row in rows]
+        return status
+
+    def claim_callbacks(self, lease_seconds, limit=10):
+        """
+        Claim finished jobs whose callback is due now
+
+        Every worker process runs a delivery thread. Claimed callbacks are
+        pushed back by lease_seconds in the same transaction, so the others
+        skip them; one whose delivery never gets recorded (its process died)
+        is due again after that.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT id, callback_url, callback_attempts FROM jobs "
+                "WHERE callback_state = 'pending' AND callback_next_at <= ? ORDER BY callback_next_at LIMIT ?",
+                (now, limit)
+            ).fetchall()
+            conn.executemany('UPDATE jobs SET callback_next_at = ? WHERE id = ?',
+                             [(now + lease_seconds, row['id']) for row in rows])
+        return [dict(row) for row in rows]
+
+    def record_callback(self, job_id, error, max_attempts, backoff_seconds):
+        """Mark a callback delivered, or schedule its retry (failed after max_attempts)"""
+        with self._transaction() as conn:
+            attempts = conn.execute('SELECT callback_attempts FROM jobs WHERE id = ?', (job_id,)).fetchone()[0] + 1
+            if error is None:
+                state, next_at = 'delivered', None
+            elif attempts >= max_attempts:
+                state, next_at = 'failed', None
+            else:
+                state, next_at = 'pending', time.time() + backoff_seconds * 2 ** (attempts - 1)
+            conn.execute(
+                'UPDATE jobs SET callback_state = ?, callback_attempts = ?, callback_next_at = ?, callback_error = ? '
+                'WHERE id = ?',
+                (state, attempts, next_at, error, job_id)
+            )
+        return state
+
+    def purge(self, older_than_seconds):
+        """Delete finished jobs (and their texts) older than the retention period"""
+        cutoff = time.time() - older_than_seconds
+        with self._transaction() as conn:
+            old = "SELECT id FROM jobs WHERE status = 'done' AND finished_at < ? AND " \
+                  "(callback_state IS NULL OR callback_state != 'pending')"
+            conn.execute(f'DELETE FROM items WHERE job_id IN ({old})', (cutoff,))
+            return conn.execute(f'DELETE FROM jobs WHERE id IN ({old})', (cutoff,)).rowcount
+
+    def depth(self):
+        """Texts not scored yet, across all jobs"""
+        return self._connection().execute('SELECT COUNT(*) FROM items WHERE result IS NULL').fetchone()[0]
+
+    def stats(self):
+        rows = self._connection().execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        return {'jobs': {row[0]: row[1] for row in rows}, 'pending_texts': self.depth()}
+
+class JobWorkers:
+    """Worker threads draining a JobQueue, plus one thread delivering callbacks"""
+
+    def __init__(self, job_queue, moderate_batch, ready, config):
+        """
+        Args:
+            moderate_batch: callable(texts, threshold) -> list of result dicts
+            ready: callable() -> True once moderate_batch serves model predictions
+        """
+        self.queue = job_queue
+        self.moderate_batch = moderate_batch
+        self.ready = ready
+        self.config = config
+        self._stop = threading.Event()
+        self.threads = []
+
+    def start(self):
+        for i in range(self.config['workers']):
+            self.threads.append(threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True))
+        self.threads.append(threading.Thread(target=self._deliver, name='job-callbacks', daemon=True))
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _work(self):
+        idle = self.config['poll_interval_ms'] / 1000
+        while not self._stop.is_set():
+            try:
+                busy = self._work_once()
+            except Exception as e:
+                # e.g. "database is locked": keep the thread alive and try again shortly
+                logger.error(f"❌ Job worker error: {str(e)}")
+                busy = False
+            if not busy:
+                self._stop.wait(idle)
+
+    def _work_once(self):
+        """Lease, score and store one batch; False when there was nothing to do"""
+        # No deadline on async jobs: wait for the model rather than use the lexical fallback
+        if not self.ready():
+            return False
+        lease_id, batch = self.queue.lease(self.config['batch_size'], self.config['lease_seconds'])
+        if not batch:
+            return False
+
+        try:
+            results = self._score(batch)
+        except Exception as e:
+            logger.error(f"❌ Job batch failed ({len(batch)} texts), retrying one by one: {str(e)}")
+            self._score_one_by_one(lease_id, batch)
+            return True
+        self.queue.complete(lease_id, results)
+        return True
+
+    def _score_one_by_one(self, lease_id, batch):
+        """Keep the good texts of a failed batch; only the failing ones go back to the queue"""
+        results, error = {}, None
+        for item in batch:
+            try:
+                results.update(self._score([item]))
+            except Exception as e:
+                error = str(e)
+        self.queue.complete(lease_id, results)
+        if error is not None:
+            self.queue.release(lease_id, error, self.config['max_attempts'])
+
+    def _score(self, batch):
+        """Score a leased batch; one moderate_batch call per distinct threshold"""
+        results = {}
+        by_threshold = {}
+        for seq, text, threshold in batch:
+            by_threshold.setdefault(threshold, []).append((seq, text))
+        for threshold, items in by_threshold.items():
+            scored = self.moderate_batch([text for _, text in items], threshold)
+            results.update((seq, result) for (seq, _), result in zip(items, scored))
+        return results
+
+    def _deliver(self):
+        """POST finished jobs to their callback URLs (at least once, with backoff)"""
+        last_purge = 0.0
+        while not self._stop.is_set():
+            try:
+                if time.time() - last_purge > 3600:
+                    last_purge = time.time()
+                    purged = self.queue.purge(self.config['retention_hours'] * 3600)
+                    if purged:
+                        logger.info(f"🧹 Purged {purged} finished jobs")
+                delivered = self._deliver_due()
+            except Exception as e:
+                logger.error(f"❌ Callback delivery error: {str(e)}")
+                delivered = 0
+            if not delivered:
+                self._stop.wait(1.0)
+
+    def _deliver_due(self, limit=10):
+        """Deliver the callbacks this process claimed; returns how many it tried"""
+        # Long enough for every claimed callback to time out once before anyone retries them
+        due = self.queue.claim_callbacks(self.config['callback_timeout'] * limit + 60, limit)
+        for job in due:
+            error = None
+            try:
+                check_callback_url(job['callback_url'], self.config['callback_allowed_hosts'],
+                                   self.config['callback_allow_private'])
+                # Redirects are not followed: they could point at an internal host
+                response = requests.post(job['callback_url'], json=self.queue.get(job['id']),
+                                         timeout=self.config['callback_timeout'], allow_redirects=False)
+                if response.status_code >= 300:
+                    error = f'HTTP {response.status_code}'
+            except (requests.RequestException, ValueError) as e:
+                error = str(e)
+
+            state = self.queue.record_callback(job['id'], error, self.config['callback_max_attempts'],
+                                               self.config['callback_backoff_seconds'])
+            if state == 'failed':
+                logger.error(f"❌ Callback for job {job['id']} failed for good: {error}")
+        return len(due)
@@ -0,0 +1,150 @@
+"""
+Language Routing
+Sends each text to the smallest backend registered for its language. The
+script is checked first with a few regex counts (Arabic, Devanagari, Latin);
+langdetect only runs for the texts the script alone can't place. Mixed-script,
+unknown and unrouted text stays on the main multilingual model.
+"""
+
+import logging
+import os
+import re
+from settings import load_config_section
+
+logger = logging.getLogger(__name__)
+
+# langdetect is optional - without it Latin-script text is left to the main model
+try:
+    from langdetect import DetectorFactory, LangDetectException, detect_langs
+    DetectorFactory.seed = 0  # deterministic answers
+    LANGDETECT_AVAILABLE = True
+except ImportError:
+    LANGDETECT_AVAILABLE = False
+
+DEFAULT_ROUTING_CONFIG = {
+    'enabled': False,       # or ROUTING_ENABLED=1
+    'script_share': 0.8,    # share of letters in one script for single-script text
+    'min_confidence': 0.8,  # langdetect probability needed to route
+    'min_chars': 20,        # shorter Latin-script text is not run through langdetect
+    'routes': {}            # language -> {backend, model_path}
+}
+
+SCRIPTS = {
+    'arabic': re.compile('[\u0600-\u06ff\u0750-\u077f\u08a0-\u08ff\ufb50-\ufdff\ufe70-\ufeff]'),
+    'devanagari': re.compile('[\u0900-\u097f]'),
+    'latin': re.compile('[A-Za-z\u00c0-\u024f]'),
+}
+
+# Letters Urdu uses and Arabic doesn't (retroflexes, noon ghunna, do-chashmi he, gol he, bari ye)
+URDU_LETTERS = re.compile('[\u0679\u0688\u0691\u06ba\u06be\u06c1\u06d2\u06d3]')
+# Arabic forms Urdu and Persian write differently (ta marbuta, yeh, kaf, alef maksura)
+ARABIC_LETTERS = re.compile('[\u0629\u064a\u0643\u0649]')
+# Persian-style kaf and yeh, and the letters Persian and Urdu add
+URDU_PERSIAN_LETTERS = re.compile('[\u06a9\u06cc\u06af\u067e\u0686\u0698]')
+
+def load_routing_config(config_path='config.yaml'):
+    """Read the routing section of config.yaml (ROUTING_ENABLED=1 turns it on)"""
+    config = {**DEFAULT_ROUTING_CONFIG, **load_config_section('routing', {}, config_path)}
+    if os.environ.get('ROUTING_ENABLED'):
+        config['enabled'] = os.environ['ROUTING_ENABLED'] not in ('0', 'false', 'False')
+    config['routes'] = config.get('routes') or {}
+    return config
+
+def detect_script(text, script_share=0.8):
+    """Dominant script of the letters in text, 'mixed', or 'unknown' when there are none"""
+    counts = {script: len(pattern.findall(text)) for script, pattern in SCRIPTS.items()}
+    letters = sum(1 for c in text if c.isalpha())
+    if not letters:
+        return 'unknown'
+
+    script, count = max(counts.items(), key=lambda item: item[1])
+    if count / letters >= script_share:
+        return script
+    return 'mixed' if count else 'unknown'
+
+def detect_statistical(text, candidates, min_confidence):
+    """langdetect's answer if it is one of candidates and confident enough, else None"""
+    if not LANGDETECT_AVAILABLE:
+        return None
+    try:
+        best = detect_langs(text)[0]
+    except LangDetectException:
+        return None
+    return best.lang if best.lang in candidates and best.prob >= min_confidence else None
+
+class LanguageRouter:
+    """Detects languages and holds the per-language backends"""
+
+    def __init__(self, config=None):
+        self.config = config or load_routing_config()
+        self.backends = {}
+
+    def load(self, build_backend):
+        """
+        Load one backend per configured route
+
+        A route whose backend fails to load is dropped (its language goes to
+        the main model) rather than stopping the server.
+        """
+        for language, route in self.config['routes'].items():
+            route = route or {}
+            kind = route.get('backend', 'lexical')
+            try:
+                backend = build_backend(kind, route.get('model_path'), route.get('version') or f"{language}:{kind}")
+                if backend.needs_model and not (backend.model_path and os.path.exists(backend.model_path)):
+                    raise FileNotFoundError(f"Model not found at: {backend.model_path}")
+                backend.load()
+                self.backends[language] = backend
+                logger.info(f"🌐 Routing {language} to {backend.version}")
+            except Exception as e:
+                logger.warning(f"⚠️ Route for {language} disabled, using the main model: {str(e)}")
+
+    def warm_up(self):
+        for backend in self.backends.values():
+            backend.warm_up()
+        # langdetect loads its language profiles on first use
+        detect_statistical('warm up the language detector', ('en',), 0.0)
+
+    def detect(self, text):
+        """Language code, 'mixed' or 'unknown' - cheapest check first"""
+        script = detect_script(text, self.config['script_share'])
+        if script in ('mixed', 'unknown'):
+            return script
+        if script == 'devanagari':
+            return 'hi'
+
+        if script == 'arabic':
+            if URDU_LETTERS.search(text):
+                return 'ur'
+            if ARABIC_LETTERS.search(text) and not URDU_PERSIAN_LETTERS.search(text):
+                return 'ar'
+            candidates = [language for language in ('ar', 'ur') if language in self.backends]
+        elif len(text) < self.config['min_chars']:
+            # Short Latin text (and Roman Urdu/Hindi) is too ambiguous to route
+            return 'unknown'
+        else:
+            candidates = [language for language in self.backends if language not in ('ar', 'ur', 'hi')]
+
+        # langdetect is only worth its cost when it can pick a routed language
+        if not candidates:
+            return 'unknown'
+        return detect_statistical(text, candidates, self.config['min_confidence']) or 'unknown'
+
+    def split(self, texts):
+        """
+        Group text indices by route
+
+        Returns (groups, languages): groups maps a routed language, or None
+        for the main model, to indices; languages is the detected language
+        of each text.
+        """
+        languages = [self.detect(text) for text in texts]
+        groups = {}
+        for i, language in enumerate(languages):
+            groups.setdefault(language if language in self.backends else None, []).append(i)
+        return groups, languages
+
+    def unload(self):
+        for backend in self.backends.values():
+            backend.unload()
+        self.backends = {}
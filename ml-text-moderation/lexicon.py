@@ -0,0 +1,283 @@
+"""
+Shared Lexicon Engine
+Compiles toxic keyword lists once into an Aho-Corasick automaton and counts
+whole-word matches per category in a single pass over the text
+"""
+
+import unicodedata
+from collections import deque
+from typing import Dict, Iterator, List, Tuple
+
+# Use the C implementation when available, fall back to pure Python otherwise
+try:
+    import ahocorasick
+    AHOCORASICK_C = True
+except ImportError:
+    AHOCORASICK_C = False
+
+# Comprehensive toxic keywords (multilingual + Roman Urdu)
+TOXIC_KEYWORDS = {
+    'severe': [
+        # English severe
+        'fuck', 'fucking', 'fucked', 'fucker', 'motherfucker', 'fck', 'fuk',
+        'shit', 'shit', 'bullshit', 'shitty', 'shithead',
+        'bitch', 'bitches', 'son of a bitch', 'soab',
+        'asshole', 'ass', 'arse', 'bastard', 'cunt', 'cock', 'dick', 'dickhead',
+        'whore', 'slut', 'hoe', 'pussy', 'prick', 'wanker', 'twat',
+        # Roman Urdu severe (Family insults)
+        'kutta', 'kutte', 'kuttay', 'kutti', 'kuttiya',
+        'kamina', 'kameena', 'kamini', 'kaminay', 'kaminee',
+        'harami', 'haraamzada', 'haramzada', 'haramzadi', 'haraamzadi', 'haramkhor',
+        'bhenchod', 'behanchod', 'bhnchod', 'bc',
+        'madarchod', 'madarcho', 'mc',
+        'behnchod', 'sisterfucker',
+        'chutiya', 'chutiye', 'chutiya', 'choot', 'chooza',
+        'kanjri', 'kanjjar', 'kanjar', 'randi', 'randwa', 'randey',
+        'lund', 'lun', 'lunnd', 'lawda', 'loda',
+        'gand', 'gaand', 'gaandu', 'gando',
+        'bhosdike', 'bhosdi', 'bsdk',
+        # Roman Urdu severe (Character attacks)
+        'badtameez', 'badtamiz', 'badmash', 'badmaash',
+        'ghatiya', 'ghateya', 'ghatia', 'zaleel', 'zalil', 'lanati', 'lanat',
+        'shaitan', 'shaitaan', 'saala', 'sala', 'kutti', 'kuttiya',
+        'dalla', 'dalal', 'pimpo', 'pimp',
+        # Urdu Script
+        'بیوقوف', 'احمق', 'حرامی', 'کمینہ', 'کتا', 'گدھا', 'گھٹیا', 'چوتیا', 'بدتمیز',
+        # Arabic
+        'أحمق', 'كلب', 'حمار', 'قذر', 'لعنة',
+        # Hindi
+        'बेवकूफ', 'कुत्ता', 'गधा', 'हरामी', 'भेनचोद', 'मादरचोद'
+    ],
+    'moderate': [
+        # English moderate
+        'stupid', 'stupidity', 'idiot', 'idiotic', 'moron', 'moronic', 
+        'dumb', 'dumbass', 'dummy', 'loser', 'looser',
+        'ugly', 'hate', 'hateful', 'pathetic', 'useless', 'worthless',
+        'jerk', 'retard', 'retarded', 'creep', 'creepy', 'freak',
+        'scum', 'trash', 'garbage', 'rubbish', 'crap', 'crappy',
+        'suck', 'sucks', 'sucking', 'disgusting', 'gross',
+        # Roman Urdu moderate
+        'pagal', 'paagal', 'paglay', 'diwana', 'deewana', 'majnoon',
+        'bewakoof', 'bevkoof', 'bewakoofi', 'bewkoof', 'bewakoofon',
+        'jahil', 'jahaal', 'jaahil', 'jahaalat',
+        'nalayak', 'nalayiq', 'nikamma', 'nikamay', 'kaamchor',
+        'fazool', 'fuzool', 'bekar', 'bekaar', 'vehla', 'vella',
+        'bakwas', 'bakwaas', 'faltu', 'faaltu',
+        'ganda', 'gandi', 'ganday', 'gandagi', 'mela',
+        'ullu', 'ulloo', 'ullu ka patha', 'ullu da patha',
+        'tharki', 'tharku', 'haiwaan', 'haiwan', 'janwar',
+        'badbu', 'badboo', 'badsurat', 'kharaab', 'kharab',
+        'badmaash', 'badmash', 'chor', 'chore', 'jhootha', 'jhoota', 'liar',
+        'manhoos', 'manhos', 'napak', 'napaak', 'paleed',
+        'neech', 'nich', 'zalim', 'zaalim',
+        # Urdu Script
+        'پاگل', 'غلیظ', 'بیکار', 'جاہل', 'نالائق', 'فضول', 'بدبو', 'بدصورت',
+        # Arabic
+        'غبي', 'سيء', 'قبيح', 'قذر',
+        # Hindi
+        'मूर्ख', 'बुरा', 'भद्दा', 'गंदा', 'पागल'
+    ],
+    'violence': [
+        # English violence
+        'kill', 'killing', 'killed', 'killer', 'murder', 'murderer', 'murdering',
+        'rape', 'raped', 'rapist', 'die', 'death', 'dead', 'dying',
+        'suicide', 'suicidal', 'bomb', 'bombing', 'bomber', 'explosion', 'explode',
+        'weapon', 'gun', 'shoot', 'shooting', 'shot', 'knife', 'stab', 'stabbing',
+        'attack', 'attacking', 'assault', 'terrorist', 'terrorism', 'terror',
+        'hurt', 'harm', 'damage', 'destroy', 'beat', 'beating', 'torture',
+        # Roman Urdu violence
+        'maar', 'mardunga', 'maardunga', 'mardala', 'mardalo', 'mardoon', 'marjao', 'marjaoo',
+        'qatal', 'katal', 'katl', 'katal kar', 'katal karo',
+        'maut', 'mot', 'maula', 'marna', 'marr',
+        'dhoka', 'dhokha', 'dhokabaaz', 'dagha', 'daghaa',
+        'bomb', 'bum', 'bomm', 'dhamaka', 'dhamaaka', 'blast',
+        'bandook', 'gun', 'goli', 'goly', 'chaku', 'chaqoo', 'chaqu',
+        'hamla', 'hamlaa', 'waar', 'vaar', 'attack',
+        'khudkushi', 'khud kushi', 'suicide', 'aatmhatya',
+        'jaan', 'jan', 'zindagi', 'khoon', 'blood',
+        'lash', 'laash', 'murda', 'morda', 'dead body',
+        # Urdu Script
+        'مار', 'قتل', 'موت', 'خودکشی', 'بم', 'دھماکہ', 'ہتھیار', 'حملہ', 'خون', 'لاش',
+        # Arabic
+        'قنبلة', 'سلاح', 'موت', 'انتحار', 'قتل', 'دم',
+        # Hindi
+        'मार', 'हत्या', 'बम', 'हथियार', 'खून', 'मौत'
+    ]
+}
+
+# Zero-width (non-)joiners appear inside Urdu/Persian and Devanagari words
+_JOINERS = {'\u200c', '\u200d'}
+
+def is_word_char(ch: str) -> bool:
+    """
+    True if the character continues a word
+
+    Letters/digits cover Latin and Arabic-script text; combining marks cover
+    Devanagari matras/virama and Arabic diacritics, which are not alphanumeric
+    but still belong to the surrounding word.
+    """
+    if ch.isalnum() or ch == '_' or ch in _JOINERS:
+        return True
+    return unicodedata.category(ch).startswith('M')
+
+# Arabic writes conjunctions, prepositions, the article, the future prefix and
+# object/possessive pronouns as part of the word: سأقتلك = س + أ + قتل + ك.
+# An Arabic-script keyword still matches with exactly these around it.
+ARABIC_PROCLITICS = frozenset(
+    conjunction + particle + prefix
+    for conjunction in ('', 'و', 'ف')
+    for particle in ('', 'ب', 'ل', 'ك', 'س')
+    for prefix in ('', 'ال', 'أ', 'ي', 'ت', 'ن')
+) - {''} | {'لل', 'ولل', 'فلل'}
+ARABIC_ENCLITICS = frozenset({'ي', 'ني', 'نا', 'ك', 'كم', 'كما', 'كن', 'ه', 'ها', 'هم', 'هما', 'هن'})
+
+def is_arabic_script(word: str) -> bool:
+    """True if every letter of word is from the Arabic block (Arabic, Urdu, Persian)"""
+    return all('\u0600' <= ch <= '\u06ff' for ch in word if ch.isalpha())
+
+class KeywordMatcher:
+    """Aho-Corasick keyword matcher with word-boundary checks"""
+
+    def __init__(self, lexicon: Dict[str, List[str]]):
+        self.categories = list(lexicon.keys())
+
+        # One entry per distinct keyword; a keyword may belong to several categories
+        self.keywords: List[str] = []
+        self.keyword_categories: List[Tuple[str, ...]] = []
+        index = {}
+        categories_by_keyword = []
+        for category, words in lexicon.items():
+            for word in words:
+                word = word.lower().strip()
+                if not word:
+                    continue
+                if word not in index:
+                    index[word] = len(self.keywords)
+                    self.keywords.append(word)
+                    categories_by_keyword.append([])
+                if category not in categories_by_keyword[index[word]]:
+                    categories_by_keyword[index[word]].append(category)
+        self.keyword_categories = [tuple(c) for c in categories_by_keyword]
+
+        # Only keyword edges that are word characters need a boundary check
+        self._check_start = [is_word_char(w[0]) for w in self.keywords]
+        self._check_end = [is_word_char(w[-1]) for w in self.keywords]
+        self._lengths = [len(w) for w in self.keywords]
+        self._arabic = [is_arabic_script(w) for w in self.keywords]
+
+        if AHOCORASICK_C:
+            self._automaton = ahocorasick.Automaton()
+            for keyword_id, word in enumerate(self.keywords):
+                self._automaton.add_word(word, keyword_id)
+            self._automaton.make_automaton()
+        else:
+            self._build()
+
+    def _build(self):
+        """Build goto/fail/output tables for the pure Python automaton"""
+        goto = [{}]
+        output = [[]]
+
+        for keyword_id, word in enumerate(self.keywords):
+            node = 0
+            for ch in word:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    output.append([])
+                node = nxt
+            output[node].append(keyword_id)
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in goto[node].items():
+                queue.append(child)
+                state = fail[node]
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(ch, 0)
+                output[child] = output[child] + output[fail[child]]
+
+        self._goto = goto
+        self._fail = fail
+        self._output = output
+
+    def _iter_raw(self, text: str) -> Iterator[Tuple[int, int]]:
+        """Yield (end_index, keyword_id) for every occurrence, ignoring boundaries"""
+        if AHOCORASICK_C:
+            yield from self._automaton.iter(text)
+            return
+
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        for i, ch in enumerate(text):
+            edges = goto[node]
+            if ch in edges:
+                node = edges[ch]
+            else:
+                while node and ch not in goto[node]:
+                    node = fail[node]
+                node = goto[node].get(ch, 0)
+            if output[node]:
+                for keyword_id in output[node]:
+                    yield i, keyword_id
+
+    def _iter_ids(self, text: str) -> Iterator[Tuple[int, int, int]]:
+        """Yield (start, end, keyword_id) for every whole-word occurrence"""
+        text = text.lower()
+        length = len(text)
+        lengths, check_start, check_end = self._lengths, self._check_start, self._check_end
+
+        for end_index, keyword_id in self._iter_raw(text):
+            start = end_index - lengths[keyword_id] + 1
+            end = end_index + 1
+            if check_start[keyword_id] and start > 0 and is_word_char(text[start - 1]):
+                if not (self._arabic[keyword_id] and self._attached(text, start, -1) in ARABIC_PROCLITICS):
+                    continue
+            if check_end[keyword_id] and end < length and is_word_char(text[end]):
+                if not (self._arabic[keyword_id] and self._attached(text, end, 1) in ARABIC_ENCLITICS):
+                    continue
+            yield start, end, keyword_id
+
+    @staticmethod
+    def _attached(text: str, index: int, step: int) -> str:
+        """Word characters joined to a match before (step -1, ending at index) or after it (step 1)"""
+        position = index - 1 if step < 0 else index
+        while 0 <= position < len(text) and is_word_char(text[position]):
+            position += step
+        return text[position + 1:index] if step < 0 else text[index:position]
+
+    def find(self, text: str) -> List[str]:
+        """Distinct keywords present in text, in order of first occurrence"""
+        seen = {}
+        for _, _, keyword_id in self._iter_ids(text):
+            seen.setdefault(self.keywords[keyword_id], None)
+        return list(seen)
+
+    def count(self, text: str) -> Dict[str, int]:
+        """
+        Count distinct matched keywords per category in one pass
+
+        A keyword repeated in the text counts once, matching the old
+        `sum(1 for word in words if word in text)` scoring scale.
+        """
+        counts = {category: 0 for category in self.categories}
+        if not text:
+            return counts
+
+        seen = set()
+        for _, _, keyword_id in self._iter_ids(text):
+            if keyword_id in seen:
+                continue
+            seen.add(keyword_id)
+            for category in self.keyword_categories[keyword_id]:
+                counts[category] += 1
+
+        return counts
+
+# Compiled once at import; shared by the lexical moderators
+TOXIC_MATCHER = KeywordMatcher(TOXIC_KEYWORDS)
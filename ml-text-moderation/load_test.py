@@ -0,0 +1,125 @@
+"""
+Serving Load Test
+Starts serve.py with 1, 2, 4... workers and measures requests per second
+against /moderate at a fixed client concurrency
+
+Usage: python load_test.py [--workers 1 2 4] [--concurrency 16] [--duration 20]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+import numpy as np
+import requests
+
+TEXTS = [
+    "Hello, this is a nice post!",
+    "You are a fucking idiot and should die",
+    "Beautiful sunset today! #nature",
+    "tujhe maar dunga",
+    "یہ بہت اچھا ہے",
+    "I will kill you",
+    "Great post, thanks for sharing! Looking forward to the next one, this was really helpful.",
+]
+
+def wait_until_ready(base_url, timeout=300):
+    """Poll /ready until every probe answers 200"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{base_url}/ready", timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+def run_load(base_url, concurrency, duration):
+    """Closed-loop load: each client thread sends its next request as soon as one returns"""
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    stop_at = time.time() + duration
+
+    def client(client_id):
+        session = requests.Session()
+        i = client_id
+        while time.time() < stop_at:
+            start = time.perf_counter()
+            try:
+                response = session.post(f"{base_url}/moderate", json={"text": TEXTS[i % len(TEXTS)]}, timeout=30)
+                ok = response.status_code == 200
+            except requests.RequestException:
+                ok = False
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+            i += concurrency
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(concurrency)]
+    started = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.time() - started
+
+    samples = np.asarray(latencies) if latencies else np.zeros(1)
+    return {
+        'rps': len(latencies) / wall,
+        'p50': float(np.percentile(samples, 50)),
+        'p99': float(np.percentile(samples, 99)),
+        'errors': errors[0]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure RPS scaling with gunicorn workers')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=int, default=20)
+    parser.add_argument('--port', type=int, default=5101)
+    args = parser.parse_args()
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    base_url = f"http://127.0.0.1:{args.port}"
+    rows = []
+
+    for workers in args.workers:
+        print(f"\n▶️  {workers} worker(s)...")
+        server = subprocess.Popen(
+            [sys.executable, 'serve.py', '--workers', str(workers), '--port', str(args.port)],
+            cwd=script_dir,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        try:
+            if not wait_until_ready(base_url):
+                print("   ❌ Server never became ready")
+                continue
+            run_load(base_url, args.concurrency, 3)  # warm-up
+            result = run_load(base_url, args.concurrency, args.duration)
+            result['workers'] = workers
+            rows.append(result)
+            print(f"   {result['rps']:.1f} req/s  p50={result['p50']:.1f} ms  p99={result['p99']:.1f} ms  errors={result['errors']}")
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    if not rows:
+        return
+
+    print("\n" + "="*60)
+    print(f"📈 RPS vs workers (concurrency {args.concurrency}, {args.duration}s each)")
+    print("="*60)
+    base = rows[0]['rps']
+    for row in rows:
+        print(f"{row['workers']:>3} workers  {row['rps']:8.1f} req/s  x{row['rps'] / base:.2f}  "
+              f"p50={row['p50']:7.1f} ms  p99={row['p99']:7.1f} ms  errors={row['errors']}")
+
+if __name__ == "__main__":
+    main()
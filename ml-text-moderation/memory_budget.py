@@ -0,0 +1,211 @@
+"""
+Memory-Budget Serving
+Loads the classifier from reduced-precision weights (bfloat16 by default),
+memory-mapped from disk, for as many CPU workers per node as possible. The
+mapped pages are shared by every worker reading the same file. The weights
+are only converted when the scores they give stay within a tolerance of the
+fp32 model on the test set; otherwise fp32 weights are written. After
+loading, gradients are dropped and freed heap memory is returned to the OS.
+
+Usage: python memory_budget.py prepare [models/toxic-classifier]  check tolerance, write weights
+       python memory_budget.py report [models/toxic-classifier]   load as app.py would, print memory
+"""
+
+import argparse
+import ctypes
+import gc
+import json
+import os
+import time
+import numpy as np
+from metrics import process_memory
+from settings import load_config_section
+
+# torch/transformers are imported where needed, so app.py can read the config
+# and report memory before the model (and torch) is loaded
+
+DEFAULT_MEMORY_BUDGET_CONFIG = {
+    'enabled': False,         # or MEMORY_BUDGET=1
+    'dtype': 'bfloat16',      # bfloat16 | float16 | float32
+    'max_score_diff': 0.02,   # largest per-label score change tolerated vs fp32
+    'max_flip_rate': 0.005,   # share of label decisions allowed to flip at eval_threshold
+    'eval_threshold': 0.5,
+    'target_rss_mb': 1024     # per worker; a warning is logged above it
+}
+
+# Written into the model directory by `prepare`
+BUDGET_FILE = 'memory_budget.json'
+
+DTYPES = ('float32', 'bfloat16', 'float16')
+
+def load_memory_budget_config(config_path='config.yaml'):
+    """Read the memory_budget section of config.yaml (MEMORY_BUDGET=1 turns it on)"""
+    config = load_config_section('memory_budget', DEFAULT_MEMORY_BUDGET_CONFIG, config_path)
+    if os.environ.get('MEMORY_BUDGET'):
+        config['enabled'] = os.environ['MEMORY_BUDGET'] not in ('0', 'false', 'False')
+    return config
+
+def weights_file(dtype):
+    return f'weights.{dtype}.pt'
+
+def has_budget_weights(model_path):
+    return os.path.exists(os.path.join(model_path, BUDGET_FILE))
+
+def release_memory():
+    """Collect garbage and hand freed heap pages back to the OS (glibc only)"""
+    gc.collect()
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+def strip_for_inference(model):
+    """Drop what only training needs (gradients, autograd tracking) and free the memory"""
+    model.eval()
+    for parameter in model.parameters():
+        parameter.requires_grad_(False)
+        parameter.grad = None
+    release_memory()
+    return model
+
+def load_budget_model(model_path):
+    """
+    Build the classifier around the memory-mapped weights written by `prepare`
+
+    The weights are mapped copy-on-write and only read, so their pages stay
+    backed by the file and are shared by every process that maps it.
+    """
+    import torch
+    from transformers import AutoConfig, AutoModelForSequenceClassification
+    from model_loader import restore_pruned_shape
+
+    with open(os.path.join(model_path, BUDGET_FILE)) as f:
+        budget = json.load(f)
+    dtype = getattr(torch, budget['dtype'])
+
+    config = AutoConfig.from_pretrained(model_path)
+    model = restore_pruned_shape(AutoModelForSequenceClassification.from_config(config, dtype=dtype), model_path)
+    state_dict = torch.load(os.path.join(model_path, weights_file(budget['dtype'])),
+                            map_location='cpu', mmap=True, weights_only=True)
+    # assign=True keeps the mapped tensors instead of copying them into the fresh ones
+    model.load_state_dict(state_dict, assign=True)
+    return strip_for_inference(model)
+
+def probe_texts(script_dir, limit=500):
+    """Texts to compare precisions on: the test set, topped up from the training data"""
+    import pandas as pd
+
+    texts = []
+    for name in ('data/test_dataset.csv', 'data/merged_dataset.csv'):
+        path = os.path.join(script_dir, name)
+        if os.path.exists(path):
+            texts += pd.read_csv(path)['text'].astype(str).tolist()
+    return list(dict.fromkeys(texts))[:limit] or ['warm up']
+
+def score(model, tokenizer, texts, max_length=256, batch_size=32):
+    """(scores, ms per text) on CPU"""
+    import torch
+    from inference_engine import InferenceEngine
+
+    engine = InferenceEngine.from_model(model, tokenizer, torch.device('cpu'), max_length,
+                                        config={'batch_size': batch_size})
+    start = time.perf_counter()
+    scores = engine.predict_scores(texts)
+    return scores, (time.perf_counter() - start) / len(texts) * 1000
+
+def prepare(model_path, config):
+    """Check the configured precision against fp32 and write the weights app.py will map"""
+    import torch
+    from transformers import AutoModelForSequenceClassification
+    from model_loader import load_classifier, restore_pruned_shape
+
+    if config['dtype'] not in DTYPES:
+        raise ValueError(f"memory_budget.dtype must be one of: {', '.join(DTYPES)}")
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    texts = probe_texts(script_dir)
+
+    print(f"\n🧮 Comparing {config['dtype']} with fp32 on {len(texts)} texts: {model_path}")
+    tokenizer, model, _ = load_classifier(model_path)
+    model.to('cpu')
+    reference, fp32_ms = score(model, tokenizer, texts)
+
+    requested = config['dtype']
+    reduced_state = {name: tensor.to(getattr(torch, requested)) if tensor.is_floating_point() else tensor
+                     for name, tensor in model.state_dict().items()}
+    reduced = AutoModelForSequenceClassification.from_config(model.config, dtype=getattr(torch, requested))
+    reduced = restore_pruned_shape(reduced, model_path)
+    reduced.load_state_dict(reduced_state, assign=True)
+    reduced.eval()
+    scores, reduced_ms = score(reduced, tokenizer, texts)
+
+    threshold = config['eval_threshold']
+    max_diff = float(np.abs(scores - reference).max())
+    flip_rate = float(((scores >= threshold) != (reference >= threshold)).mean())
+    tolerated = max_diff <= config['max_score_diff'] and flip_rate <= config['max_flip_rate']
+    dtype = requested if tolerated else 'float32'
+
+    print(f"   max score diff {max_diff:.4f} (limit {config['max_score_diff']}), "
+          f"flipped decisions {flip_rate:.2%} (limit {config['max_flip_rate']:.2%})")
+    print(f"   {fp32_ms:.2f} ms/text fp32, {reduced_ms:.2f} ms/text {requested}")
+    if not tolerated:
+        print(f"⚠️ The model doesn't tolerate {requested}; writing fp32 weights (still memory-mapped)")
+
+    state = reduced_state if tolerated else model.state_dict()
+    path = os.path.join(model_path, weights_file(dtype))
+    torch.save({name: tensor.contiguous() for name, tensor in state.items()}, path)
+
+    report = {
+        'dtype': dtype,
+        'requested_dtype': requested,
+        'max_score_diff': max_diff,
+        'flip_rate': flip_rate,
+        'fp32_ms_per_text': fp32_ms,
+        'ms_per_text': reduced_ms if tolerated else fp32_ms,
+        'weights_mb': round(os.path.getsize(path) / (1024 * 1024), 1),
+        'probe_texts': len(texts)
+    }
+    with open(os.path.join(model_path, BUDGET_FILE), 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 {report['weights_mb']} MB of {dtype} weights saved to: {path}")
+    return report
+
+def report_memory(model_path, config):
+    """Load the model the way app.py does in memory-budget mode and print this process's memory"""
+    from model_loader import load_classifier
+
+    before = process_memory()
+    tokenizer, model, device = load_classifier(model_path, memory_budget=True)
+    loaded = process_memory()
+    score(model, tokenizer, ['warm up the memory report'] * 8)
+    after = process_memory()
+
+    if before is None:
+        print("⚠️ Memory reporting needs Linux (/proc/self/smaps_rollup)")
+        return None
+
+    print(f"\n{'':>22}{'rss':>9}{'shared':>9}{'private':>9}{'pss':>9}")
+    for label, memory in (('before load', before), ('after load', loaded), ('after inference', after)):
+        print(f"{label:>22}{memory['rss_mb']:>9.1f}{memory['shared_mb']:>9.1f}"
+              f"{memory['private_mb']:>9.1f}{memory['pss_mb']:>9.1f}")
+
+    target = config['target_rss_mb']
+    status = '✅ within' if after['rss_mb'] <= target else '⚠️ over'
+    print(f"\n{status} target of {target} MB RSS per worker "
+          f"({next(model.parameters()).dtype}, {'memory-mapped' if has_budget_weights(model_path) else 'not prepared'})")
+    return after
+
+def main():
+    parser = argparse.ArgumentParser(description='Prepare and check memory-budget serving')
+    parser.add_argument('command', choices=['prepare', 'report'])
+    parser.add_argument('model_path', nargs='?', default='models/toxic-classifier')
+    args = parser.parse_args()
+
+    config = load_memory_budget_config()
+    if args.command == 'prepare':
+        prepare(args.model_path, config)
+        print(f"\n✨ Serve it with: MEMORY_BUDGET=1 MODEL_PATH={args.model_path} python serve.py")
+    else:
+        report_memory(args.model_path, config)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Service Metrics
+Minimal counters, gauges and histograms rendered in the Prometheus text
+exposition format. Recording is a lock plus a bisect, cheap enough to leave
+on for every request; nothing is computed until /metrics is scraped.
+
+Under gunicorn (serve.py) every worker also writes its samples to a shared
+directory, and a scrape answered by any worker merges them all: counters
+and histograms are summed, gauges get a worker label.
+"""
+
+import bisect
+import glob
+import json
+import os
+import random
+import threading
+import time
+
+# Seconds; covers sub-millisecond parsing up to multi-second long-post batches
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+LENGTH_BUCKETS = (8, 16, 32, 64, 128, 256, 512)
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def process_memory():
+    """
+    This process's memory in MB from /proc/self/smaps_rollup, or None off Linux
+
+    rss counts every resident page, shared the pages also mapped by another
+    process (forked workers, or the same memory-mapped weights file), pss
+    splits shared pages evenly between the processes mapping them.
+    """
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            kb = {}
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                    kb[parts[0][:-1]] = int(parts[1])
+    except OSError:
+        return None
+
+    def mb(*fields):
+        return round(sum(kb.get(field, 0) for field in fields) / 1024, 1)
+
+    return {
+        'rss_mb': mb('Rss'),
+        'pss_mb': mb('Pss'),
+        'shared_mb': mb('Shared_Clean', 'Shared_Dirty'),
+        'private_mb': mb('Private_Clean', 'Private_Dirty'),
+        'anonymous_mb': mb('Anonymous')
+    }
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    """Monotonic count, optionally read from a callable at scrape time"""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, fn=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.values = {}
+        self.fn = fn
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        values = self.fn() if self.fn else dict(self.values)
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [(self.name, key, value) for key, value in sorted(values.items())]
+
+class Gauge(Counter):
+    """Value that goes up and down, optionally read from a callable at scrape time"""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram with sum and count"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self.lock:
+            snapshot = {key: (list(counts), total, count) for key, (counts, total, count) in self.series.items()}
+
+        samples = []
+        for key, (counts, total, count) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", key, cumulative, ('le', _format_value(float(bound)))))
+            samples.append((f"{self.name}_sum", key, total))
+            samples.append((f"{self.name}_count", key, count))
+        return samples
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class Registry:
+    """Holds metrics and renders them for a Prometheus scrape"""
+
+    def __init__(self):
+        self.metrics = []
+        self.multiprocess_dir = None
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def enable_multiprocess(self, directory, interval=1.0):
+        """
+        Share this process's samples with the other workers through directory
+
+        Call in each worker after fork. A background thread rewrites the
+        worker's file every interval seconds (and every scrape writes it
+        first), so a merged scrape is at most that old for other workers.
+        """
+        self.multiprocess_dir = directory
+
+        def write_periodically():
+            while True:
+                try:
+                    self.write_snapshot()
+                except OSError:
+                    pass
+                time.sleep(interval)
+
+        threading.Thread(target=write_periodically, name='metrics-writer', daemon=True).start()
+
+    def snapshot(self):
+        """{metric name: [[sample name, label values, value, extra label], ...]} of this process"""
+        return {metric.name: [[sample[0], list(sample[1]), sample[2], sample[3] if len(sample) > 3 else None]
+                              for sample in metric.samples()]
+                for metric in self.metrics}
+
+    def write_snapshot(self):
+        path = os.path.join(self.multiprocess_dir, f'{os.getpid()}.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'pid': os.getpid(), 'metrics': self.snapshot()}, f)
+        os.replace(path + '.tmp', path)
+
+    def render(self):
+        if self.multiprocess_dir:
+            return self.render_merged()
+
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.header())
+            for sample in metric.samples():
+                name, key, value = sample[:3]
+                extra = sample[3] if len(sample) > 3 else None
+                lines.append(f"{name}{_format_labels(metric.labelnames, key, extra)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def render_merged(self):
+        """
+        All workers' samples: counters and histograms summed, gauges per worker
+
+        Counters of workers that exited stay in the sum, so totals never go
+        down when gunicorn replaces a worker; their gauges are dropped.
+        """
+        self.write_snapshot()
+        snapshots = []
+        for path in glob.glob(os.path.join(self.multiprocess_dir, '*.json')):
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.header())
+            merged = {}
+            for snapshot in snapshots:
+                gauge = metric.kind == 'gauge'
+                if gauge and not _pid_alive(snapshot['pid']):
+                    continue
+                for name, key, value, extra in snapshot['metrics'].get(metric.name, []):
+                    key = tuple(key) + ((str(snapshot['pid']),) if gauge else ())
+                    extra = tuple(extra) if extra else None
+                    merged[(name, key, extra)] = merged.get((name, key, extra), 0) + value
+
+            labelnames = metric.labelnames + (('worker',) if metric.kind == 'gauge' else ())
+            for (name, key, extra), value in sorted(merged.items(), key=lambda item: item[0][1]):
+                lines.append(f"{name}{_format_labels(labelnames, key, extra)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+# Content type Prometheus expects for the text format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def sampled(rate):
+    """True for roughly `rate` of calls - for per-request log lines"""
+    return rate >= 1 or random.random() < rate
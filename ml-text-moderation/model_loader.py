@@ -0,0 +1,169 @@
+"""
+Model Loading Helpers
+Loads either the fp32 classifier or its dynamic INT8 quantized artifact,
+including models whose attention heads were pruned by prune_model.py
+"""
+
+import json
+import os
+import torch
+from transformers import AutoConfig, AutoTokenizer, AutoModelForSequenceClassification
+
+# File written next to config.json/tokenizer files by quantize_model.py
+QUANTIZED_WEIGHTS = 'quantized_model.pt'
+
+# Written by prune_model.py: attention heads kept in each layer
+PRUNING_FILE = 'pruning.json'
+
+def is_quantized_artifact(model_path):
+    """Check whether a model directory holds an INT8 quantized artifact"""
+    return os.path.exists(os.path.join(model_path, QUANTIZED_WEIGHTS))
+
+def is_pruned_artifact(model_path):
+    """Check whether a model directory holds a model with pruned attention heads"""
+    return os.path.exists(os.path.join(model_path, PRUNING_FILE))
+
+def quantize_dynamic_int8(model):
+    """Apply dynamic INT8 quantization to every nn.Linear layer"""
+    return torch.quantization.quantize_dynamic(
+        model,
+        {torch.nn.Linear},
+        dtype=torch.qint8
+    )
+
+def layer_stack(model):
+    """
+    The module holding a classifier's transformer layers (its .layer list)
+
+    DistilBERT keeps them in transformer.layer, BERT-style models in
+    encoder.layer.
+    """
+    base = getattr(model, model.base_model_prefix)
+    return base.transformer if hasattr(base, 'transformer') else base.encoder
+
+def attention_projections(layer):
+    """(attention module, query, key, value, output) linears of a DistilBERT or BERT-style layer"""
+    if hasattr(layer.attention, 'q_lin'):
+        attention = layer.attention
+        return attention, attention.q_lin, attention.k_lin, attention.v_lin, attention.out_lin
+    attention = layer.attention.self
+    return attention, attention.query, attention.key, attention.value, layer.attention.output.dense
+
+def head_size(model):
+    return model.config.hidden_size // model.config.num_attention_heads
+
+def heads_per_layer(model):
+    """Attention heads left in each transformer layer"""
+    return [attention_projections(layer)[1].out_features // head_size(model) for layer in layer_stack(model).layer]
+
+def prune_heads(model, layer_index, heads):
+    """
+    Remove attention heads (indices among the layer's current heads) in place
+
+    The query/key/value outputs and the output projection's inputs of those
+    heads are cut out. The attention reshapes by head size, so the smaller
+    layer runs as is.
+    """
+    size = head_size(model)
+    attention, query, key, value, output = attention_projections(layer_stack(model).layer[layer_index])
+    current = query.out_features // size
+    kept = [h for h in range(current) if h not in set(heads)]
+    if not kept:
+        raise ValueError(f"Can't remove every head of layer {layer_index}; remove the layer instead")
+    index = torch.cat([torch.arange(h * size, (h + 1) * size) for h in kept]).to(query.weight.device)
+
+    def narrow(linear, dim):
+        weight = linear.weight.index_select(dim, index).detach().clone()
+        bias = linear.bias if dim == 1 or linear.bias is None else linear.bias.index_select(0, index)
+        narrowed = torch.nn.Linear(weight.shape[1], weight.shape[0], bias=linear.bias is not None,
+                                   device=weight.device, dtype=weight.dtype)
+        with torch.no_grad():
+            narrowed.weight.copy_(weight)
+            if bias is not None:
+                narrowed.bias.copy_(bias)
+        return narrowed
+
+    names = ('q_lin', 'k_lin', 'v_lin') if hasattr(attention, 'q_lin') else ('query', 'key', 'value')
+    for name in names:
+        setattr(attention, name, narrow(getattr(attention, name), 0))
+    if hasattr(attention, 'out_lin'):
+        attention.out_lin = narrow(output, 1)
+    else:
+        layer_stack(model).layer[layer_index].attention.output.dense = narrow(output, 1)
+
+    # Older transformers releases reshape by these instead of the head size
+    for field, value in (('n_heads', len(kept)), ('num_attention_heads', len(kept)),
+                         ('dim', len(kept) * size), ('all_head_size', len(kept) * size)):
+        if hasattr(attention, field):
+            setattr(attention, field, value)
+    return model
+
+def restore_pruned_shape(model, model_path):
+    """Shrink a model built from config.json to the head counts in pruning.json, before loading weights"""
+    if not is_pruned_artifact(model_path):
+        return model
+    with open(os.path.join(model_path, PRUNING_FILE)) as f:
+        kept = json.load(f)['heads']
+    for index, (current, count) in enumerate(zip(heads_per_layer(model), kept)):
+        if count < current:
+            prune_heads(model, index, range(count, current))
+    return model
+
+def load_pretrained(model_path):
+    """from_pretrained for fp32 model directories, pruned ones included"""
+    if is_pruned_artifact(model_path):
+        from safetensors.torch import load_file
+
+        config = AutoConfig.from_pretrained(model_path)
+        model = restore_pruned_shape(AutoModelForSequenceClassification.from_config(config), model_path)
+        model.load_state_dict(load_file(os.path.join(model_path, 'model.safetensors')))
+        return model
+
+    # safetensors weights are memory-mapped instead of unpickled into fresh buffers
+    return AutoModelForSequenceClassification.from_pretrained(
+        model_path,
+        use_safetensors=os.path.exists(os.path.join(model_path, 'model.safetensors')) or None,
+        low_cpu_mem_usage=True
+    )
+
+def load_classifier(model_path, memory_budget=False):
+    """
+    Load tokenizer and model from a fp32 or INT8 model directory
+
+    With memory_budget, the reduced-precision weights written by
+    memory_budget.py are memory-mapped instead (fp32 if there are none), on
+    CPU and stripped of training-only state.
+
+    Returns:
+        (tokenizer, model, device) - quantized and memory-budget models always run on CPU
+    """
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+
+    if is_quantized_artifact(model_path):
+        # Rebuild the architecture, quantize it the same way, then load the packed weights
+        config = AutoConfig.from_pretrained(model_path)
+        model = AutoModelForSequenceClassification.from_config(config)
+        model = quantize_dynamic_int8(restore_pruned_shape(model, model_path))
+        state_dict = torch.load(
+            os.path.join(model_path, QUANTIZED_WEIGHTS),
+            map_location='cpu',
+            weights_only=False
+        )
+        model.load_state_dict(state_dict)
+        device = torch.device('cpu')
+    elif memory_budget:
+        from memory_budget import has_budget_weights, load_budget_model, strip_for_inference
+
+        if has_budget_weights(model_path):
+            model = load_budget_model(model_path)
+        else:
+            model = strip_for_inference(load_pretrained(model_path))
+        device = torch.device('cpu')
+    else:
+        model = load_pretrained(model_path)
+        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+    model.to(device)
+    model.eval()
+
+    return tokenizer, model, device
@@ -0,0 +1,337 @@
+"""
+Structured Pruning Script
+Scores the fine-tuned classifier's attention heads and whole transformer
+layers by importance on the validation split, removes the least important
+ones step by step with a short fine-tune after each step, and reports CPU
+latency against per-label F1 on the test set. Every step is saved as a
+servable model directory; export the one to serve.
+
+Usage: python prune_model.py                prune, fine-tune and report
+       python prune_model.py --export 3     copy step 3 to pruning.export_dir
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn.functional as F
+from sklearn.metrics import f1_score
+from transformers import TrainingArguments, Trainer
+from inference_engine import InferenceEngine
+from model_loader import (
+    PRUNING_FILE, attention_projections, head_size, heads_per_layer,
+    is_quantized_artifact, layer_stack, load_classifier, prune_heads
+)
+from train_model import ToxicityTrainer
+
+DEFAULT_PRUNING_CONFIG = {
+    'base': 'models/toxic-classifier',
+    'steps': ['heads', 'heads', 'layer', 'heads', 'heads', 'layer'],
+    'heads_per_step': 4,
+    'min_heads_per_layer': 1,
+    'output_dir': 'models/toxic-classifier-pruning',
+    'export_dir': 'models/toxic-classifier-pruned',
+    'eval_threshold': 0.5,
+    'batch_size': 32,
+    'training': {'num_epochs': 1, 'learning_rate': 3e-5, 'warmup_steps': 0}
+}
+
+REPORT_FILE = 'pruning_report.json'
+
+def remove_layer(model, index):
+    """Drop one transformer layer (index among the current layers)"""
+    stack = layer_stack(model)
+    stack.layer = torch.nn.ModuleList([layer for i, layer in enumerate(stack.layer) if i != index])
+
+    if hasattr(model.config, 'n_layers'):
+        model.config.n_layers = len(stack.layer)
+    else:
+        model.config.num_hidden_layers = len(stack.layer)
+    return model
+
+def pareto_front(rows):
+    """Mark rows no other row beats on both latency and macro F1"""
+    for row in rows:
+        row['pareto'] = not any(
+            other['ms_per_text'] <= row['ms_per_text'] and other['macro_f1'] >= row['macro_f1']
+            and (other['ms_per_text'] < row['ms_per_text'] or other['macro_f1'] > row['macro_f1'])
+            for other in rows
+        )
+    return rows
+
+class ModelPruner(ToxicityTrainer):
+    """Prune heads and layers of the fine-tuned classifier, fine-tuning after each step"""
+
+    def __init__(self, config_path='config.yaml'):
+        super().__init__(config_path)
+        self.prune_config = {**DEFAULT_PRUNING_CONFIG, **(self.config.get('pruning') or {})}
+
+        resolve = lambda path: path if os.path.isabs(path) else os.path.join(self.script_dir, path)
+        self.base_path = resolve(self.prune_config['base'])
+        self.output_dir = resolve(self.prune_config['output_dir'])
+        self.export_dir = resolve(self.prune_config['export_dir'])
+        self.test_path = os.path.join(self.script_dir, 'data/test_dataset.csv')
+
+    def step_dir(self, step):
+        return os.path.join(self.output_dir, 'steps', f'step-{step}')
+
+    def batches(self, df, tokenizer, device, batch_size=32):
+        """(input_ids, attention_mask, labels) tensors for a labeled dataframe"""
+        texts = df['text'].astype(str).tolist()
+        labels = torch.tensor(df[self.label_columns].values, dtype=torch.float32)
+        for start in range(0, len(texts), batch_size):
+            encodings = tokenizer(texts[start:start + batch_size], truncation=True, padding=True,
+                                  max_length=self.max_length, return_tensors='pt')
+            yield (encodings['input_ids'].to(device), encodings['attention_mask'].to(device),
+                   labels[start:start + batch_size].to(device))
+
+    def validation_loss(self, model, batches):
+        model.eval()
+        losses = []
+        with torch.no_grad():
+            for input_ids, attention_mask, labels in batches:
+                logits = model(input_ids=input_ids, attention_mask=attention_mask).logits
+                losses.append(F.binary_cross_entropy_with_logits(logits.float(), labels).item())
+        return float(np.mean(losses))
+
+    def head_importance(self, model, batches):
+        """
+        Importance of every head, per layer: |dLoss/dGate| over the validation split
+
+        Each head's output is scaled by a gate of 1 before the output
+        projection. The gradient with respect to the gate estimates how much
+        the loss changes without the head (Michel et al., 2019). Scores are
+        normalized per layer so that layers can be compared.
+        """
+        model.eval()
+        size = head_size(model)
+        gates, hooks = [], []
+        for layer in layer_stack(model).layer:
+            output = attention_projections(layer)[4]
+            gate = torch.ones(output.in_features // size, device=output.weight.device, requires_grad=True)
+            hooks.append(output.register_forward_pre_hook(
+                lambda module, args, gate=gate: (args[0] * gate.repeat_interleave(size),)
+            ))
+            gates.append(gate)
+
+        importance = [torch.zeros_like(gate) for gate in gates]
+        try:
+            for input_ids, attention_mask, labels in batches:
+                logits = model(input_ids=input_ids, attention_mask=attention_mask).logits
+                loss = F.binary_cross_entropy_with_logits(logits.float(), labels)
+                for total, grad in zip(importance, torch.autograd.grad(loss, gates)):
+                    total += grad.abs()
+        finally:
+            for hook in hooks:
+                hook.remove()
+
+        return [(total / (total.norm() + 1e-12)).cpu().numpy() for total in importance]
+
+    def layer_importance(self, model, batches):
+        """Validation loss increase when each layer is skipped"""
+        stack = layer_stack(model)
+        layers = stack.layer
+        base = self.validation_loss(model, batches)
+
+        scores = []
+        try:
+            for index in range(len(layers)):
+                stack.layer = torch.nn.ModuleList([layer for i, layer in enumerate(layers) if i != index])
+                scores.append(self.validation_loss(model, batches) - base)
+        finally:
+            stack.layer = layers
+        return np.array(scores)
+
+    def prune_heads_step(self, model, batches):
+        """Remove the heads_per_step least important heads; returns {layer index: heads removed}"""
+        importance = self.head_importance(model, batches)
+        minimum = self.prune_config['min_heads_per_layer']
+
+        candidates = sorted((score, layer, head) for layer, scores in enumerate(importance)
+                            for head, score in enumerate(scores))
+        left = [len(scores) for scores in importance]
+        chosen = {}
+        for _, layer, head in candidates:
+            if sum(len(heads) for heads in chosen.values()) >= self.prune_config['heads_per_step']:
+                break
+            if left[layer] > minimum:
+                chosen.setdefault(layer, []).append(head)
+                left[layer] -= 1
+
+        for layer, heads in chosen.items():
+            prune_heads(model, layer, heads)
+        return chosen
+
+    def fine_tune(self, model, tokenizer, train_df):
+        """A short fine-tune (pruning.training) so the remaining weights make up for what was removed"""
+        training = {**self.config['training'], **(self.prune_config.get('training') or {})}
+        training_args = TrainingArguments(
+            output_dir=os.path.join(self.output_dir, 'checkpoints'),
+            num_train_epochs=training['num_epochs'],
+            per_device_train_batch_size=training['batch_size'],
+            learning_rate=float(training['learning_rate']),
+            weight_decay=training['weight_decay'],
+            warmup_steps=training['warmup_steps'],
+            gradient_accumulation_steps=training['gradient_accumulation_steps'],
+            eval_strategy="no",
+            save_strategy="no",
+            logging_dir=self.config['logging']['tensorboard_dir'],
+            logging_steps=100,
+            report_to="tensorboard",
+            fp16=torch.cuda.is_available(),
+            dataloader_num_workers=0,
+        )
+
+        for parameter in model.parameters():
+            parameter.requires_grad = True
+        Trainer(model=model, args=training_args, train_dataset=self.tokenize_data(train_df, tokenizer)).train()
+        model.eval()
+        return model
+
+    def measure_latency(self, model, tokenizer, texts):
+        """CPU milliseconds per text in length-sorted batches (best of 3)"""
+        device = next(model.parameters()).device
+        model.to('cpu')
+        engine = InferenceEngine.from_model(model, tokenizer, torch.device('cpu'), self.max_length,
+                                            config={'batch_size': self.prune_config['batch_size']})
+
+        def run():
+            engine.predict_scores(texts)
+
+        run()  # warm-up
+        best = float('inf')
+        for _ in range(3):
+            start = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - start)
+        model.to(device)
+        return best / len(texts) * 1000
+
+    def record(self, step, removed, model, tokenizer, test_df):
+        """Save the step as a servable model directory and measure it on the test set"""
+        path = self.step_dir(step)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        model.save_pretrained(path)
+        tokenizer.save_pretrained(path)
+        heads = heads_per_layer(model)
+        with open(os.path.join(path, PRUNING_FILE), 'w') as f:
+            json.dump({'heads': heads, 'base': self.base_path, 'step': step}, f, indent=2)
+
+        model.eval()
+        engine = InferenceEngine.from_model(model, tokenizer, next(model.parameters()).device, self.max_length,
+                                            config={'batch_size': self.prune_config['batch_size']})
+        probs = engine.predict_scores(test_df['text'].astype(str).tolist())
+        labels = test_df[self.label_columns].values.astype(int)
+        predictions = probs >= self.prune_config['eval_threshold']
+        per_label = {label: float(f1_score(labels[:, i], predictions[:, i], zero_division=0))
+                     for i, label in enumerate(self.label_columns)}
+
+        return {
+            'step': step,
+            'removed': removed,
+            'layers': len(heads),
+            'heads': int(sum(heads)),
+            'params_m': sum(p.numel() for p in model.parameters()) / 1e6,
+            'ms_per_text': self.measure_latency(model, tokenizer, test_df['text'].astype(str).tolist()),
+            'macro_f1': float(np.mean(list(per_label.values()))),
+            'f1': per_label,
+            'path': path
+        }
+
+    def prune(self):
+        """Run the configured steps; returns one row per step (step 0 is the unpruned model)"""
+        print("\n" + "="*60)
+        print("✂️ Structured Pruning")
+        print("="*60)
+
+        if is_quantized_artifact(self.base_path):
+            raise ValueError(f"{self.base_path} is an INT8 artifact; prune the fp32 model, then quantize")
+
+        train_df, val_df = self.split_data()
+        test_df = pd.read_csv(self.test_path)
+        tokenizer, model, device = load_classifier(self.base_path)
+        # Original layer numbers, for the report
+        layer_ids = list(range(len(layer_stack(model).layer)))
+
+        rows = [self.record(0, 'nothing', model, tokenizer, test_df)]
+        for step, kind in enumerate(self.prune_config['steps'], 1):
+            val_batches = list(self.batches(val_df, tokenizer, device))
+            if kind == 'heads':
+                chosen = self.prune_heads_step(model, val_batches)
+                if not chosen:
+                    print(f"⏭️ Step {step}: every layer is down to min_heads_per_layer")
+                    continue
+                removed = ', '.join(f"layer {layer_ids[layer] + 1}: {len(heads)} head{'s' if len(heads) > 1 else ''}"
+                                    for layer, heads in sorted(chosen.items()))
+            elif kind == 'layer':
+                if len(layer_ids) == 1:
+                    print(f"⏭️ Step {step}: only one layer left")
+                    continue
+                index = int(np.argmin(self.layer_importance(model, val_batches)))
+                remove_layer(model, index)
+                removed = f"layer {layer_ids.pop(index) + 1}"
+            else:
+                raise ValueError(f"Unknown pruning step: {kind} (use 'heads' or 'layer')")
+
+            print(f"\n🔪 Step {step}: removed {removed}; fine-tuning...")
+            self.fine_tune(model, tokenizer, train_df)
+            rows.append(self.record(step, removed, model, tokenizer, test_df))
+
+        return self.report(pareto_front(rows))
+
+    def report(self, rows):
+        """Print and save the latency / per-label F1 table"""
+        labels = [label[:8] for label in self.label_columns]
+        print(f"\n{'step':>4}{'layers':>7}{'heads':>6}{'params':>9}{'ms/text':>9}{'macro F1':>10}"
+              + ''.join(f"{label:>10}" for label in labels) + "  removed")
+        for row in rows:
+            print(f"{row['step']:>4}{row['layers']:>7}{row['heads']:>6}{row['params_m']:>8.1f}M"
+                  f"{row['ms_per_text']:>9.2f}{row['macro_f1']:>10.4f}"
+                  + ''.join(f"{row['f1'][label]:>10.4f}" for label in self.label_columns)
+                  + f"  {row['removed']}{'  *' if row['pareto'] else ''}")
+        print("\n* on the Pareto front (no other step is both faster and more accurate)")
+
+        report_path = os.path.join(self.output_dir, REPORT_FILE)
+        with open(report_path, 'w') as f:
+            json.dump({'base': self.base_path, 'threshold': self.prune_config['eval_threshold'], 'rows': rows},
+                      f, indent=2)
+        print(f"💾 Report saved to: {report_path}")
+        return rows
+
+    def export(self, step):
+        """Copy a step's model directory to export_dir"""
+        path = self.step_dir(step)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No saved step {step} in {os.path.dirname(path)} - run the pruning first")
+        if os.path.exists(self.export_dir):
+            shutil.rmtree(self.export_dir)
+        shutil.copytree(path, self.export_dir)
+        print(f"\n🚀 Exported step {step} to: {self.export_dir}")
+
+def main():
+    """Main pruning function"""
+    parser = argparse.ArgumentParser(description='Prune attention heads and layers of the classifier')
+    parser.add_argument('--export', type=int, metavar='STEP', help='Copy a step from the report to pruning.export_dir')
+    args = parser.parse_args()
+
+    try:
+        pruner = ModelPruner()
+        if args.export is not None:
+            pruner.export(args.export)
+            print(f"   Serve it with: MODEL_PATH={pruner.prune_config['export_dir']} python app.py")
+            return
+
+        pruner.prune()
+        print("\n✨ Pruning complete!")
+        print("   Export a step with: python prune_model.py --export <step>")
+    except Exception as e:
+        print(f"\n❌ Pruning failed: {str(e)}")
+        raise
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+@echo off
+echo ========================================
+echo Quantizing ML Model (INT8)
+echo ========================================
+echo.
+
+REM Activate virtual environment
+call venv\Scripts\activate.bat
+
+REM Quantize, evaluate and promote if accuracy holds
+python quantize_model.py
+
+if %errorlevel% neq 0 (
+    echo.
+    echo Quantized model was NOT promoted - see accuracy gate above
+    pause
+    exit /b 1
+)
+
+echo.
+echo Quantized model saved to: models/toxic-classifier-int8
+echo Serve it with: set MODEL_PATH=models/toxic-classifier-int8 ^&^& python app.py
+echo.
+
+pause
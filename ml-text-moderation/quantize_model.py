@@ -0,0 +1,148 @@
+"""
+Model Quantization Script
+Applies dynamic INT8 quantization to the trained classifier and only promotes
+the quantized artifact if it stays within the configured accuracy margin
+"""
+
+import math
+import os
+import shutil
+import sys
+import torch
+import yaml
+from transformers import AutoTokenizer
+from evaluate_model import ModelEvaluator
+from model_loader import (
+    PRUNING_FILE, QUANTIZED_WEIGHTS, is_pruned_artifact,
+    load_pretrained, quantize_dynamic_int8
+)
+
+class ModelQuantizer:
+    """Quantize the fp32 classifier and gate promotion on evaluation metrics"""
+
+    def __init__(self, config_path='config.yaml', model_path='models/toxic-classifier'):
+        self.script_dir = os.path.dirname(os.path.abspath(__file__))
+        config_path = os.path.join(self.script_dir, config_path) if not os.path.isabs(config_path) else config_path
+
+        with open(config_path, 'r') as f:
+            self.config = yaml.safe_load(f)['quantization']
+
+        self.model_path = os.path.join(self.script_dir, model_path) if not os.path.isabs(model_path) else model_path
+        output_dir = self.config['output_dir']
+        self.output_dir = os.path.join(self.script_dir, output_dir) if not os.path.isabs(output_dir) else output_dir
+        self.candidate_dir = self.output_dir + '.candidate'
+        self.test_path = os.path.join(self.script_dir, 'data/test_dataset.csv')
+
+    def quantize(self):
+        """Quantize linear layers and save as a candidate artifact"""
+        print(f"\n⚙️ Quantizing model: {self.model_path}")
+
+        if not os.path.exists(self.model_path):
+            raise FileNotFoundError(f"Model not found: {self.model_path}")
+
+        tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+        model = load_pretrained(self.model_path)
+        model.eval()
+
+        quantized = quantize_dynamic_int8(model)
+
+        if os.path.exists(self.candidate_dir):
+            shutil.rmtree(self.candidate_dir)
+        os.makedirs(self.candidate_dir)
+
+        # Config + tokenizer let model_loader rebuild the architecture before loading weights
+        model.config.save_pretrained(self.candidate_dir)
+        tokenizer.save_pretrained(self.candidate_dir)
+        if is_pruned_artifact(self.model_path):
+            shutil.copy(os.path.join(self.model_path, PRUNING_FILE), self.candidate_dir)
+        torch.save(quantized.state_dict(), os.path.join(self.candidate_dir, QUANTIZED_WEIGHTS))
+
+        fp32_size = sum(p.numel() * p.element_size() for p in model.parameters()) / 1e6
+        int8_size = os.path.getsize(os.path.join(self.candidate_dir, QUANTIZED_WEIGHTS)) / 1e6
+        print(f"✅ Candidate saved to: {self.candidate_dir}")
+        print(f"   fp32 weights: {fp32_size:.1f} MB -> int8 artifact: {int8_size:.1f} MB")
+
+    def check_accuracy(self):
+        """
+        Evaluate fp32 and int8 models on the test set
+
+        Returns:
+            (passed, failures) - failures lists every label/metric over the margin,
+            and every one that is NaN for either model (it can't be compared)
+        """
+        threshold = self.config['eval_threshold']
+        margins = {
+            'f1': self.config['max_f1_drop'],
+            'auc': self.config['max_auc_drop']
+        }
+
+        baseline, _ = ModelEvaluator(self.model_path).evaluate(
+            threshold=threshold,
+            test_path=self.test_path,
+            save_path=os.path.join(self.script_dir, 'evaluation_results_fp32.csv')
+        )
+        candidate, _ = ModelEvaluator(self.candidate_dir).evaluate(
+            threshold=threshold,
+            test_path=self.test_path,
+            save_path=os.path.join(self.script_dir, 'evaluation_results_int8.csv')
+        )
+
+        print("\n" + "="*60)
+        print("🚦 Quantization Accuracy Gate")
+        print("="*60)
+
+        failures = []
+        for label in baseline:
+            for metric, margin in margins.items():
+                drop = baseline[label][metric] - candidate[label][metric]
+                # NaN compares False against any margin, so it must fail explicitly
+                failed = math.isnan(drop) or drop > margin
+                print(f"{'❌' if failed else '✅'} {label:<14} {metric:<4} fp32={baseline[label][metric]:.4f} "
+                      f"int8={candidate[label][metric]:.4f} drop={drop:+.4f} (max {margin})"
+                      f"{' - NaN, cannot compare' if math.isnan(drop) else ''}")
+                if failed:
+                    failures.append((label, metric, drop))
+
+        return len(failures) == 0, failures
+
+    def promote(self):
+        """Replace the served int8 artifact with the candidate"""
+        if os.path.exists(self.output_dir):
+            shutil.rmtree(self.output_dir)
+        os.rename(self.candidate_dir, self.output_dir)
+        print(f"\n🚀 Promoted int8 model to: {self.output_dir}")
+
+    def run(self):
+        """Quantize, evaluate, and promote if the gate passes"""
+        self.quantize()
+        passed, failures = self.check_accuracy()
+
+        if not passed:
+            shutil.rmtree(self.candidate_dir)
+            unchecked = sum(1 for _, _, drop in failures if math.isnan(drop))
+            print(f"\n⛔ Not promoting: {len(failures) - unchecked} metric(s) dropped more than the allowed margin"
+                  f"{f', {unchecked} NaN' if unchecked else ''}")
+            print(f"   Served artifact left unchanged: {self.output_dir}")
+            return False
+
+        self.promote()
+        return True
+
+def main():
+    """Main quantization function"""
+    try:
+        quantizer = ModelQuantizer()
+        promoted = quantizer.run()
+
+        if promoted:
+            print("\n✨ Quantization successful!")
+            print(f"   Serve it with: MODEL_PATH={quantizer.config['output_dir']} python app.py")
+        else:
+            sys.exit(1)
+
+    except Exception as e:
+        print(f"\n❌ Quantization failed: {str(e)}")
+        raise
+
+if __name__ == "__main__":
+    main()
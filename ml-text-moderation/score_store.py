@@ -0,0 +1,293 @@
+"""
+Persistent Score Store
+Second-level score cache in a local SQLite file (WAL mode), behind the
+in-process SimHash cache. Keys are a hash of the model version and the exact
+text, so every worker process, and every restart, reuses scores already
+computed by any of them. Readers don't block each other or the writer. The
+file is kept under max_mb by evicting the least recently used entries, and
+the most-hit entries can be loaded into memory when a model starts.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+from settings import load_config_section
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCORE_STORE_CONFIG = {
+    'enabled': True,
+    'db_path': 'moderation_scores.db',
+    'max_mb': 512,            # file size kept by evicting least recently used entries
+    'evict_fraction': 0.1,    # share of entries removed per round, until under max_mb
+    'check_every': 1000,      # writes between size checks
+    'hot_size': 20000,        # entries kept in memory in front of SQLite (LRU)
+    'warm_on_start': True,    # load the most-hit entries of a model into memory when it loads
+    'touch_every_seconds': 5  # hit counts and recency are written back this often
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    key BLOB PRIMARY KEY,      -- blake2b of version and text
+    version TEXT NOT NULL,
+    scores BLOB NOT NULL,      -- float32 per label
+    hits INTEGER NOT NULL DEFAULT 0,
+    last_used REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS scores_last_used ON scores(last_used);
+CREATE INDEX IF NOT EXISTS scores_hot ON scores(version, hits);
+"""
+
+def load_score_store_config(config_path='config.yaml'):
+    """Read inference.score_store from config.yaml; db_path is relative to this directory"""
+    inference = load_config_section('inference', {}, config_path)
+    config = {**DEFAULT_SCORE_STORE_CONFIG, **(inference.get('score_store') or {})}
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    if not os.path.isabs(config['db_path']):
+        config['db_path'] = os.path.join(script_dir, config['db_path'])
+    return config
+
+def model_stamp(model_path):
+    """
+    Short hash of the names, sizes and modification times of a model's files
+
+    Retraining into the same directory changes the stamp, so scores from the
+    previous weights are never served under the same version name.
+    """
+    if not model_path or not os.path.isdir(model_path):
+        return 'none'
+    digest = hashlib.blake2b(digest_size=6)
+    for name in sorted(os.listdir(model_path)):
+        path = os.path.join(model_path, name)
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()
+
+def text_key(version, text):
+    return hashlib.blake2b(f"{version}\0{text}".encode('utf-8'), digest_size=16).digest()
+
+class ScoreStore:
+    """Scores by (model version, text) in SQLite, with an in-memory LRU of hot entries"""
+
+    def __init__(self, db_path, max_mb=512, evict_fraction=0.1, check_every=1000, hot_size=20000,
+                 touch_every_seconds=5):
+        self.db_path = db_path
+        self.max_bytes = max_mb * 1024 * 1024
+        self.evict_fraction = evict_fraction
+        self.check_every = check_every
+        self.hot_size = hot_size
+        self.touch_every_seconds = touch_every_seconds
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._hot = OrderedDict()
+        self._touched = {}
+        self._last_touch = time.monotonic()
+        self._writes = 0
+        self._versions = weakref.WeakKeyDictionary()
+        self.counts = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'errors': 0}
+
+        conn = sqlite3.connect(db_path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        conn.close()
+
+    def _connection(self):
+        # One connection per thread (and per process after a fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=1, isolation_level=None)
+            # A lost write only costs a recomputation, so don't fsync every commit
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def version_for(self, backend):
+        """Store version of a loaded backend: its version name plus a stamp of its model files"""
+        version = self._versions.get(backend)
+        if version is None:
+            # An ensemble stamps the models of all its members
+            paths = getattr(backend, 'model_paths', None) or [backend.model_path]
+            version = self._versions[backend] = f"{backend.version}@{'+'.join(model_stamp(path) for path in paths)}"
+        return version
+
+    def get_many(self, version, texts):
+        """Stored score rows (or None) for each text; a failing database counts as misses"""
+        keys = [text_key(version, text) for text in texts]
+        rows = [None] * len(keys)
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                row = self._hot.get(key)
+                if row is not None:
+                    self._hot.move_to_end(key)
+                    rows[i] = row
+        missing = [i for i, row in enumerate(rows) if row is None]
+
+        if missing:
+            try:
+                found = {}
+                conn = self._connection()
+                # SQLite limits bound parameters per statement
+                for start in range(0, len(missing), 500):
+                    chunk = [keys[i] for i in missing[start:start + 500]]
+                    found.update(conn.execute(
+                        f"SELECT key, scores FROM scores WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                    ).fetchall())
+            except sqlite3.Error as e:
+                with self._lock:
+                    self.counts['errors'] += 1
+                logger.warning(f"⚠️ Score store read failed: {str(e)}")
+                found = {}
+
+            with self._lock:
+                for i in missing:
+                    blob = found.get(keys[i])
+                    if blob is not None:
+                        rows[i] = np.frombuffer(blob, dtype=np.float32)
+                        self._remember(keys[i], rows[i])
+
+        with self._lock:
+            hits = [key for key, row in zip(keys, rows) if row is not None]
+            for key in hits:
+                self._touched[key] = self._touched.get(key, 0) + 1
+            self.counts['memory_hits'] += len(keys) - len(missing)
+            self.counts['disk_hits'] += len(hits) - (len(keys) - len(missing))
+            self.counts['misses'] += len(keys) - len(hits)
+
+        self._flush_touched()
+        return rows
+
+    def put_many(self, version, texts, rows):
+        """Store freshly computed score rows"""
+        now = time.time()
+        entries = []
+        with self._lock:
+            for text, row in zip(texts, rows):
+                key = text_key(version, text)
+                row = np.asarray(row, dtype=np.float32)
+                self._remember(key, row)
+                entries.append((key, version, row.tobytes(), now))
+            self._writes += len(entries)
+            check = self._writes >= self.check_every
+            if check:
+                self._writes = 0
+
+        try:
+            with self._transaction() as conn:
+                conn.executemany(
+                    'INSERT INTO scores (key, version, scores, last_used) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT(key) DO UPDATE SET scores = excluded.scores, last_used = excluded.last_used',
+                    entries
+                )
+            if check:
+                self.evict()
+        except sqlite3.Error as e:
+            with self._lock:
+                self.counts['errors'] += 1
+            logger.warning(f"⚠️ Score store write failed: {str(e)}")
+
+    def _remember(self, key, row):
+        # Caller holds self._lock
+        self._hot[key] = row
+        self._hot.move_to_end(key)
+        while len(self._hot) > self.hot_size:
+            self._hot.popitem(last=False)
+
+    def _flush_touched(self, force=False):
+        """Write back hit counts and recency, batched so reads rarely take the write lock"""
+        with self._lock:
+            if not self._touched or (not force and time.monotonic() - self._last_touch < self.touch_every_seconds):
+                return
+            touched, self._touched = self._touched, {}
+            self._last_touch = time.monotonic()
+
+        now = time.time()
+        try:
+            with self._transaction() as conn:
+                conn.executemany('UPDATE scores SET hits = hits + ?, last_used = ? WHERE key = ?',
+                                 [(count, now, key) for key, count in touched.items()])
+        except sqlite3.Error as e:
+            with self._lock:
+                self.counts['errors'] += 1
+            logger.warning(f"⚠️ Score store touch failed: {str(e)}")
+
+    def size_bytes(self, conn=None):
+        """Bytes used by live pages (freed pages are reused before the file grows)"""
+        conn = conn or self._connection()
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        used = conn.execute('PRAGMA page_count').fetchone()[0] - conn.execute('PRAGMA freelist_count').fetchone()[0]
+        return used * page_size
+
+    def evict(self):
+        """
+        Drop the least recently used entries until the store is under max_mb;
+        returns rows removed
+
+        Each round deletes evict_fraction of the remaining entries, so a store
+        far over its limit (max_mb lowered, or bursts between checks) still
+        shrinks below it in one call.
+        """
+        removed = 0
+        with self._transaction() as conn:
+            while self.size_bytes(conn) > self.max_bytes:
+                count = conn.execute('SELECT COUNT(*) FROM scores').fetchone()[0]
+                if not count:
+                    break
+                limit = max(1, int(count * self.evict_fraction))
+                removed += conn.execute(
+                    'DELETE FROM scores WHERE key IN (SELECT key FROM scores ORDER BY last_used LIMIT ?)', (limit,)
+                ).rowcount
+        if not removed:
+            return 0
+        logger.info(f"🧹 Score store over {self.max_bytes // (1024 * 1024)} MB, evicted {removed} entries")
+        return removed
+
+    def warm(self, version, limit=None):
+        """Load the most-hit entries of a version into memory; returns how many"""
+        limit = min(limit or self.hot_size, self.hot_size)
+        try:
+            rows = self._connection().execute(
+                'SELECT key, scores FROM scores WHERE version = ? ORDER BY hits DESC LIMIT ?', (version, limit)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Score store warm-up failed: {str(e)}")
+            return 0
+
+        with self._lock:
+            # Least hit first, so the hottest end up most recently used
+            for key, blob in reversed(rows):
+                self._remember(key, np.frombuffer(blob, dtype=np.float32))
+        return len(rows)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counts['memory_hits'] + self.counts['disk_hits'] + self.counts['misses']
+            stats = {**self.counts, 'memory_entries': len(self._hot),
+                     'hit_rate': (lookups - self.counts['misses']) / lookups if lookups else 0.0}
+        try:
+            conn = self._connection()
+            stats['entries'] = conn.execute('SELECT COUNT(*) FROM scores').fetchone()[0]
+            stats['size_mb'] = round(self.size_bytes(conn) / (1024 * 1024), 2)
+        except sqlite3.Error:
+            pass
+        return stats
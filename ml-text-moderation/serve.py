@@ -0,0 +1,170 @@
+"""
+Production Server
+Runs app.py under gunicorn with several workers. The model is loaded once in
+the master before fork so workers share the weights copy-on-write, and CPU
+cores are split explicitly between workers and torch intra-op threads.
+
+Linux/Docker only (gunicorn does not run on Windows).
+
+Usage: python serve.py [--workers N] [--torch-threads N] [--port 5001] [--no-preload]
+"""
+
+import argparse
+import atexit
+import gc
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from settings import load_config_section
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SERVING_CONFIG = {
+    'host': '0.0.0.0',
+    'port': 5001,
+    'workers': 0,             # 0 = auto (one worker per 2 cores)
+    'torch_threads': 0,       # 0 = cores // workers
+    'request_threads': 4,     # gthread threads per worker: probes answer during inference, 2 stay free of chats
+    'preload': True,
+    'timeout': 60,
+    'metrics_dir': ''         # shared by the workers for a merged /metrics; '' = fresh temp dir per start
+}
+
+def load_serving_config(config_path='config.yaml'):
+    """Read the serving section of config.yaml"""
+    return load_config_section('serving', DEFAULT_SERVING_CONFIG, config_path)
+
+def available_cores():
+    """Cores this process may run on (respects taskset/cgroup affinity)"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def plan_cpu_split(workers=0, torch_threads=0, cores=None):
+    """
+    Decide worker count and torch threads per worker
+
+    Returns:
+        (workers, torch_threads, cores) with workers * torch_threads <= cores
+        unless both were set explicitly
+    """
+    cores = cores or available_cores()
+
+    if workers <= 0:
+        workers = max(1, cores // 2)
+    if torch_threads <= 0:
+        torch_threads = max(1, cores // workers)
+
+    return workers, torch_threads, cores
+
+def main():
+    config = load_serving_config()
+
+    parser = argparse.ArgumentParser(description='Run the moderation API with gunicorn')
+    parser.add_argument('--host', default=config['host'])
+    parser.add_argument('--port', type=int, default=config['port'])
+    parser.add_argument('--workers', type=int, default=config['workers'])
+    parser.add_argument('--torch-threads', type=int, default=config['torch_threads'])
+    parser.add_argument('--request-threads', type=int, default=config['request_threads'])
+    parser.add_argument('--timeout', type=int, default=config['timeout'])
+    parser.add_argument('--no-preload', dest='preload', action='store_false', default=config['preload'],
+                        help='load the model in each worker instead of once before fork')
+    args = parser.parse_args()
+
+    workers, torch_threads, cores = plan_cpu_split(args.workers, args.torch_threads)
+
+    # OpenMP/MKL size their pools when torch is imported, so set these first
+    os.environ['OMP_NUM_THREADS'] = str(torch_threads)
+    os.environ['MKL_NUM_THREADS'] = str(torch_threads)
+
+    import torch
+    from gunicorn.app.base import BaseApplication
+    import app as service
+    from chat_stream import RESERVED_REQUEST_THREADS
+    from metrics import REGISTRY
+
+    # Every worker writes its metrics here, so /metrics on any worker covers all of them
+    metrics_dir = config['metrics_dir']
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+        for name in os.listdir(metrics_dir):
+            if name.endswith('.json'):
+                os.remove(os.path.join(metrics_dir, name))
+    else:
+        metrics_dir = tempfile.mkdtemp(prefix='moderation-metrics-', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+        # Workers inherit atexit handlers on fork; only the master may remove the directory
+        master_pid = os.getpid()
+        atexit.register(lambda: os.getpid() == master_pid and shutil.rmtree(metrics_dir, ignore_errors=True))
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logger.info("="*60)
+    logger.info("🚀 Starting ML Moderation Service (gunicorn)")
+    logger.info("="*60)
+    logger.info(f"CPU cores: {cores} -> {workers} workers x {torch_threads} torch threads")
+    logger.info(f"Preload before fork: {args.preload}")
+
+    # Each chat WebSocket holds a request thread for its lifetime; keep some free for everything else
+    chat_limit = service.chat_connections.limit
+    if chat_limit is None or chat_limit > args.request_threads - RESERVED_REQUEST_THREADS:
+        chat_limit = max(0, args.request_threads - RESERVED_REQUEST_THREADS)
+        service.chat_connections.limit = chat_limit
+    if service.SOCK_AVAILABLE:
+        logger.info(f"Chat connections per worker: {chat_limit} of {args.request_threads} request threads")
+        if not chat_limit:
+            logger.warning(f"⚠️ /moderate-chat refuses every connection - raise --request-threads above {RESERVED_REQUEST_THREADS}")
+
+    if args.preload:
+        # Load only - warm-up inference here would start OpenMP threads that don't survive fork
+        if not service.load_model(warm_up=False):
+            logger.error("❌ Model failed to load; workers will report not ready")
+        # Keep the loaded objects out of the cyclic GC so collections don't dirty shared pages
+        gc.freeze()
+
+    def post_fork(server, worker):
+        torch.set_num_threads(torch_threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass
+
+    def post_worker_init(worker):
+        REGISTRY.enable_multiprocess(metrics_dir)
+        # Load/warm up in the background so /live and /ready answer meanwhile
+        if not args.preload:
+            service.start_background_load()
+        elif service.backend_slot.active is not None:
+            threading.Thread(target=service.warm_up_model, daemon=True).start()
+        service.start_job_workers()
+
+    class ModerationServer(BaseApplication):
+        """Embed gunicorn so hooks can close over the CPU plan"""
+
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+    options = {
+        'bind': f"{args.host}:{args.port}",
+        'workers': workers,
+        'worker_class': 'gthread',
+        'threads': args.request_threads,
+        'timeout': args.timeout,
+        'preload_app': True,
+        'post_fork': post_fork,
+        'post_worker_init': post_worker_init
+    }
+
+    ModerationServer(service.app, options).run()
+
+if __name__ == '__main__':
+    main()
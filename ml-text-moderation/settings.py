@@ -0,0 +1,19 @@
+"""
+Configuration Helpers
+Reads one section of config.yaml, falling back to defaults for missing keys
+"""
+
+import os
+import yaml
+
+def load_config_section(section, defaults, config_path='config.yaml'):
+    """Return defaults updated with config.yaml[section] (path relative to this directory)"""
+    config = dict(defaults)
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    config_path = os.path.join(script_dir, config_path) if not os.path.isabs(config_path) else config_path
+    if os.path.exists(config_path):
+        with open(config_path, 'r') as f:
+            config.update((yaml.safe_load(f) or {}).get(section) or {})
+
+    return config
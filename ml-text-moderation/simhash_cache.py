@@ -0,0 +1,167 @@
+"""
+Near-Duplicate Score Cache
+Fingerprints normalized text with a 64-bit SimHash and reuses stored model
+scores for recent texts within a small Hamming distance, so spam waves that
+only vary punctuation, casing or emojis skip the model.
+"""
+
+import hashlib
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+from settings import load_config_section
+
+DEFAULT_SIMHASH_CONFIG = {
+    'enabled': True,
+    'max_distance': 3,     # Hamming distance (of 64 bits) still treated as the same text
+    'max_size': 10000,     # fingerprints kept (least recently used evicted)
+    'min_chars': 20        # shorter normalized texts only reuse exact fingerprints
+}
+
+BITS = 64
+SHINGLE = 3
+REPEATS = re.compile(r'(.)\1+')
+SPACES = re.compile(r'\s+')
+
+def load_simhash_config(config_path='config.yaml'):
+    """Read inference.simhash_cache from config.yaml"""
+    inference = load_config_section('inference', {}, config_path)
+    return {**DEFAULT_SIMHASH_CONFIG, **(inference.get('simhash_cache') or {})}
+
+def normalize_text(text):
+    """
+    Casefold and keep only letters, marks, digits and single spaces
+
+    Punctuation, symbols and emojis are dropped and repeated characters
+    collapsed ("sooooo!!!" -> "so"), the usual noise added to evade
+    exact-match filters. Only used for fingerprints, never shown.
+    """
+    text = unicodedata.normalize('NFKC', text).casefold()
+    kept = ''.join(
+        ch if unicodedata.category(ch)[0] in 'LMN' else ' '
+        for ch in text
+    )
+    kept = REPEATS.sub(r'\1', kept)
+    return SPACES.sub(' ', kept).strip()
+
+def simhash(normalized, bits=BITS):
+    """64-bit SimHash over character shingles of already-normalized text"""
+    padded = f" {normalized} "
+    shingles = [padded[i:i + SHINGLE] for i in range(max(1, len(padded) - SHINGLE + 1))]
+
+    digests = b''.join(hashlib.blake2b(s.encode('utf-8'), digest_size=bits // 8).digest() for s in shingles)
+    # Each bit is set when most shingle hashes have it set
+    votes = np.unpackbits(np.frombuffer(digests, dtype=np.uint8)).reshape(len(shingles), bits).sum(axis=0)
+    return int.from_bytes(np.packbits(votes * 2 > len(shingles)).tobytes(), 'big')
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+class MultiIndexTable:
+    """
+    Find fingerprints within max_distance bits without scanning them all
+
+    The fingerprint is split into max_distance + 1 blocks; by pigeonhole any
+    fingerprint within max_distance bits agrees exactly on at least one
+    block, so only entries sharing a block value are compared.
+    """
+
+    def __init__(self, max_distance=3, bits=BITS):
+        self.max_distance = max_distance
+        blocks = max_distance + 1
+        edges = [round(i * bits / blocks) for i in range(blocks + 1)]
+        self.blocks = [(edges[i], edges[i + 1] - edges[i]) for i in range(blocks)]
+        self.tables = [{} for _ in self.blocks]
+
+    def _keys(self, fingerprint):
+        return [(fingerprint >> shift) & ((1 << width) - 1) for shift, width in self.blocks]
+
+    def add(self, fingerprint):
+        for table, key in zip(self.tables, self._keys(fingerprint)):
+            table.setdefault(key, set()).add(fingerprint)
+
+    def remove(self, fingerprint):
+        for table, key in zip(self.tables, self._keys(fingerprint)):
+            bucket = table.get(key)
+            if bucket is not None:
+                bucket.discard(fingerprint)
+                if not bucket:
+                    del table[key]
+
+    def nearest(self, fingerprint, max_distance=None):
+        """(fingerprint, distance) of the closest entry within max_distance, or None"""
+        max_distance = self.max_distance if max_distance is None else max_distance
+        best = None
+        for table, key in zip(self.tables, self._keys(fingerprint)):
+            for candidate in table.get(key, ()):
+                distance = hamming(fingerprint, candidate)
+                if distance <= max_distance and (best is None or distance < best[1]):
+                    best = (candidate, distance)
+                    if distance == 0:
+                        return best
+        return best
+
+class SimHashCache:
+    """LRU map of text fingerprints to per-label scores with near-duplicate lookup"""
+
+    def __init__(self, max_distance=3, max_size=10000, min_chars=20):
+        self.max_distance = max_distance
+        self.max_size = max_size
+        self.min_chars = min_chars
+
+        self.entries = OrderedDict()
+        self.index = MultiIndexTable(max_distance)
+        self.lock = threading.Lock()
+        self.counts = {'exact_hits': 0, 'near_hits': 0, 'misses': 0}
+
+    def fingerprint(self, text):
+        """(fingerprint, allowed distance) for a text"""
+        normalized = normalize_text(text)
+        allowed = self.max_distance if len(normalized) >= self.min_chars else 0
+        return simhash(normalized), allowed
+
+    def get(self, text):
+        """Stored scores for this text or a near duplicate, else None"""
+        fingerprint, allowed = self.fingerprint(text)
+
+        with self.lock:
+            match = self.index.nearest(fingerprint, allowed)
+            if match is None:
+                self.counts['misses'] += 1
+                return None
+
+            self.entries.move_to_end(match[0])
+            self.counts['exact_hits' if match[1] == 0 else 'near_hits'] += 1
+            return self.entries[match[0]]
+
+    def put(self, text, scores):
+        fingerprint, _ = self.fingerprint(text)
+
+        with self.lock:
+            if fingerprint not in self.entries:
+                self.index.add(fingerprint)
+            self.entries[fingerprint] = scores
+            self.entries.move_to_end(fingerprint)
+
+            while len(self.entries) > self.max_size:
+                evicted, _ = self.entries.popitem(last=False)
+                self.index.remove(evicted)
+
+    def clear(self):
+        """Drop everything (e.g. after loading a different model)"""
+        with self.lock:
+            self.entries.clear()
+            self.index = MultiIndexTable(self.max_distance)
+
+    def stats(self):
+        with self.lock:
+            lookups = sum(self.counts.values())
+            hits = self.counts['exact_hits'] + self.counts['near_hits']
+            return {
+                **self.counts,
+                'size': len(self.entries),
+                'max_distance': self.max_distance,
+                'hit_rate': hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,179 @@
+"""
+Streaming NDJSON Moderation
+Reads newline-delimited JSON texts incrementally, feeds them through batched
+inference and yields results as they are ready. A bounded queue between the
+reader and the batcher keeps memory flat however large the input is: when
+inference or the client falls behind, reading the request body pauses.
+Clients must therefore read results while they upload: one that sends the
+whole body before reading anything stalls once the queue and the socket
+buffers are full.
+"""
+
+import json
+import queue
+import threading
+import time
+import weakref
+from settings import load_config_section
+
+DEFAULT_STREAM_CONFIG = {
+    'batch_size': 32,          # texts per inference call
+    'max_wait_ms': 50,         # flush a partial batch after this long
+    'queue_size': 256,         # parsed texts buffered ahead of inference
+    'max_line_bytes': 1048576  # longer lines are rejected, not buffered
+}
+
+_END = object()
+
+# Streams currently being served, for the queue-depth metric
+ACTIVE_STREAMS = weakref.WeakSet()
+
+def load_stream_config(config_path='config.yaml'):
+    """Read inference.stream from config.yaml"""
+    inference = load_config_section('inference', {}, config_path)
+    return {**DEFAULT_STREAM_CONFIG, **(inference.get('stream') or {})}
+
+def queued_items():
+    """Parsed texts waiting for inference across all active streams"""
+    return sum(stream._queue.qsize() for stream in list(ACTIVE_STREAMS))
+
+def parse_line(line, line_number):
+    """
+    Return (line number, id, text, error) for one NDJSON input line
+
+    id is the client's own id, or None: line numbers are reported separately
+    so they can never be mistaken for a client id.
+    """
+    try:
+        item = json.loads(line)
+    except ValueError:
+        return line_number, None, None, 'Invalid JSON'
+
+    if isinstance(item, str):
+        return line_number, None, item, None
+    item_id = item.get('id') if isinstance(item, dict) else None
+    if not isinstance(item, dict) or not isinstance(item.get('text'), str):
+        return line_number, item_id, None, 'Missing text field'
+    return line_number, item_id, item['text'], None
+
+class NDJSONModerationStream:
+    """Iterate over NDJSON result lines for an NDJSON input stream"""
+
+    def __init__(self, stream, moderate_batch, threshold=0.7, config=None):
+        """
+        Args:
+            stream: binary file-like request body (readline)
+            moderate_batch: callable(texts, threshold) -> list of result dicts
+        """
+        self.stream = stream
+        self.moderate_batch = moderate_batch
+        self.threshold = threshold
+        self.config = config or load_stream_config()
+
+        self._queue = queue.Queue(maxsize=self.config['queue_size'])
+        self._stop = threading.Event()
+        self.total = 0
+        self.flagged = 0
+
+    def _put(self, item):
+        """Blocking put that gives up once the consumer has gone away"""
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read(self):
+        """Reader thread: parse lines into the bounded queue"""
+        limit = self.config['max_line_bytes']
+        line_number = 0
+        try:
+            while not self._stop.is_set():
+                line = self.stream.readline(limit + 1)
+                if not line:
+                    break
+                line_number += 1
+
+                if len(line) > limit and not line.endswith(b'\n'):
+                    # Skip the rest of an oversized line without holding it in memory
+                    while line and not line.endswith(b'\n'):
+                        line = self.stream.readline(limit)
+                    item = (line_number, None, None, 'Line too long')
+                else:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    item = parse_line(line, line_number)
+
+                if not self._put(item):
+                    return
+        except Exception as e:
+            self._put((line_number + 1, None, None, f'Read error: {e}'))
+        finally:
+            self._put(_END)
+
+    def _next_batch(self):
+        """Block for one item, then gather more until batch_size or max_wait"""
+        first = self._queue.get()
+        if first is _END:
+            return [], True
+
+        batch = [first]
+        deadline = time.monotonic() + self.config['max_wait_ms'] / 1000
+        while len(batch) < self.config['batch_size']:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _END:
+                return batch, True
+            batch.append(item)
+
+        return batch, False
+
+    def _process(self, batch):
+        """Moderate the valid texts of a batch, keeping input order"""
+        texts = [text for _, _, text, error in batch if error is None]
+        results = []
+
+        if texts:
+            try:
+                results = self.moderate_batch(texts, self.threshold)
+            except Exception as e:
+                results = [{'error': str(e)}] * len(texts)
+
+        results = iter(results)
+        for line_number, item_id, _, error in batch:
+            output = {'line': line_number, 'id': item_id}
+            if error is not None:
+                output['error'] = error
+            else:
+                result = next(results)
+                output.update(result)
+                if 'error' not in result:
+                    self.total += 1
+                    self.flagged += 1 if result.get('flagged') else 0
+            yield json.dumps(output, ensure_ascii=False) + '\n'
+
+    def __iter__(self):
+        reader = threading.Thread(target=self._read, daemon=True)
+        reader.start()
+        ACTIVE_STREAMS.add(self)
+
+        try:
+            done = False
+            while not done:
+                batch, done = self._next_batch()
+                if batch:
+                    yield from self._process(batch)
+
+            yield json.dumps({'done': True, 'total': self.total, 'flagged_count': self.flagged}) + '\n'
+        finally:
+            # Client disconnected or stream finished: let the reader exit
+            self._stop.set()
+            ACTIVE_STREAMS.discard(self)
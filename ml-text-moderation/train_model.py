@@ -20,6 +20,7 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, precision_recall_fscore_support, roc_auc_score
 import yaml
 from augmentation import TextAugmenter, augment_dataset
+from inference_engine import sigmoid
 
 class ToxicityTrainer:
     """Train toxic content classification model"""
@@ -108,6 +109,20 @@ class ToxicityTrainer:
         
         return train_df, val_df, test_df
     
+    def split_data(self, test_path='data/test_dataset.csv'):
+        """
+        Train/validation split of the merged dataset, without the saved test texts
+        
+        For tools that start from the trained classifier: the test set
+        written by train() stays held out for their reports.
+        """
+        test_path = os.path.join(self.script_dir, test_path) if not os.path.isabs(test_path) else test_path
+        df = self.load_data()
+        if os.path.exists(test_path):
+            df = df[~df['text'].isin(set(pd.read_csv(test_path)['text']))]
+        train_df, val_df, _ = self.prepare_datasets(df)
+        return train_df, val_df
+    
     def tokenize_data(self, df, tokenizer):
         """Tokenize text data"""
         print(f"\n🔤 Tokenizing {len(df)} samples...")
@@ -141,8 +156,8 @@ class ToxicityTrainer:
         labels = pred.label_ids
         preds = pred.predictions
         
-        # Apply sigmoid for multi-label classification
-        preds_sigmoid = 1 / (1 + np.exp(-preds))
+        # Apply sigmoid for multi-label classification (the same function serving uses)
+        preds_sigmoid = sigmoid(preds)
         preds_binary = (preds_sigmoid > 0.5).astype(int)
         
         # Calculate metrics
@@ -0,0 +1,360 @@
+"""
+Vocabulary Trimming
+Shrinks the classifier's vocabulary, and the embedding matrix that makes up
+most of a multilingual model's weights, to the tokens a representative corpus
+actually uses. Special tokens and single-character tokens are always kept, so
+words the corpus never had still split into characters instead of [UNK].
+Corpus texts tokenize exactly as before (only unused tokens are removed), and
+the trimmed model is only promoted if its test set metrics don't drop.
+
+Usage: python trim_vocab.py [--corpus data/merged_dataset.csv data/unlabeled_posts.csv] [--report-only]
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+import numpy as np
+import pandas as pd
+import torch
+from transformers import AutoTokenizer
+from evaluate_model import ModelEvaluator
+from metrics import process_memory
+from model_loader import PRUNING_FILE, is_pruned_artifact, load_pretrained
+from settings import load_config_section
+
+DEFAULT_VOCAB_TRIMMING_CONFIG = {
+    'base': 'models/toxic-classifier',
+    'corpus': ['data/merged_dataset.csv', 'data/unlabeled_posts.csv'],
+    'min_count': 1,             # keep tokens the corpus uses at least this often
+    'keep_characters': True,    # keep every single-character token and its ## form
+    'output_dir': 'models/toxic-classifier-trimmed',
+    'eval_threshold': 0.5,
+    'max_f1_drop': 0.0,
+    'max_auc_drop': 0.0
+}
+
+REPORT_FILE = 'vocab_trimming_report.json'
+
+def remap_post_processor(processor, mapping):
+    """Rewrite the special token ids a tokenizers post-processor adds (CLS/SEP and the like)"""
+    if not processor:
+        return processor
+    kind = processor.get('type')
+    if kind == 'TemplateProcessing':
+        for token in processor['special_tokens'].values():
+            token['ids'] = [mapping[i] for i in token['ids']]
+    elif kind in ('BertProcessing', 'RobertaProcessing'):
+        for field in ('sep', 'cls'):
+            processor[field] = [processor[field][0], mapping[processor[field][1]]]
+    elif kind == 'Sequence':
+        for child in processor['processors']:
+            remap_post_processor(child, mapping)
+    return processor
+
+def trim_tokenizer_json(tokenizer_json, keep):
+    """
+    tokenizer.json with only the `keep` ids (sorted), renumbered from 0
+
+    WordPiece (BERT/DistilBERT) and Unigram (XLM-R style) vocabularies can be
+    trimmed this way: a text whose tokens are all kept segments the same.
+    """
+    mapping = {int(old): new for new, old in enumerate(keep)}
+    model = tokenizer_json['model']
+
+    if model['type'] == 'WordPiece':
+        by_id = {i: token for token, i in model['vocab'].items()}
+        model['vocab'] = {by_id[old]: new for old, new in mapping.items()}
+    elif model['type'] == 'Unigram':
+        model['vocab'] = [model['vocab'][old] for old in keep]
+        if model.get('unk_id') is not None:
+            model['unk_id'] = mapping[model['unk_id']]
+    else:
+        raise ValueError(f"Can't trim a {model['type']} tokenizer (WordPiece and Unigram only)")
+
+    for token in tokenizer_json.get('added_tokens') or []:
+        token['id'] = mapping[token['id']]
+    remap_post_processor(tokenizer_json.get('post_processor'), mapping)
+    return tokenizer_json, mapping
+
+def trim_embeddings(model, keep, mapping):
+    """Replace the input embeddings with the rows of the kept tokens"""
+    old = model.get_input_embeddings()
+    pad_id = mapping.get(old.padding_idx) if old.padding_idx is not None else None
+
+    new = torch.nn.Embedding(len(keep), old.embedding_dim, padding_idx=pad_id)
+    with torch.no_grad():
+        new.weight.copy_(old.weight[torch.as_tensor(keep)])
+    model.set_input_embeddings(new)
+
+    model.config.vocab_size = len(keep)
+    for field in ('pad_token_id', 'bos_token_id', 'eos_token_id', 'sep_token_id', 'cls_token_id'):
+        if getattr(model.config, field, None) is not None:
+            setattr(model.config, field, mapping[getattr(model.config, field)])
+    return model
+
+def directory_mb(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)
+               if os.path.isfile(os.path.join(path, name))) / (1024 * 1024)
+
+def _load_footprint(model_path):
+    # Runs in a fresh process, so the memory measured is this model's alone
+    from model_loader import load_classifier
+
+    before = process_memory()
+    start = time.perf_counter()
+    load_classifier(model_path)
+    seconds = time.perf_counter() - start
+    after = process_memory()
+    return seconds, (after['rss_mb'] - before['rss_mb']) if before else None
+
+def load_footprint(model_path, runs=3):
+    """(seconds, MB of RSS) to load a model, the fastest of a few fresh processes"""
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for _ in range(runs):
+        with context.Pool(1) as pool:
+            results.append(pool.apply(_load_footprint, (model_path,)))
+    return min(results, key=lambda result: result[0])
+
+class VocabTrimmer:
+    """Trim a classifier's vocabulary to a corpus and gate promotion on evaluation metrics"""
+
+    def __init__(self, config_path='config.yaml', corpus=None):
+        self.script_dir = os.path.dirname(os.path.abspath(__file__))
+        self.config = load_config_section('vocab_trimming', DEFAULT_VOCAB_TRIMMING_CONFIG,
+                                          os.path.join(self.script_dir, config_path))
+
+        resolve = lambda path: path if os.path.isabs(path) else os.path.join(self.script_dir, path)
+        self.model_path = resolve(self.config['base'])
+        self.output_dir = resolve(self.config['output_dir'])
+        self.candidate_dir = self.output_dir + '.candidate'
+        self.corpus_paths = [resolve(path) for path in (corpus or self.config['corpus'])]
+        self.test_path = os.path.join(self.script_dir, 'data/test_dataset.csv')
+
+    def load_corpus(self):
+        """Texts of every corpus CSV that exists (a 'text' column)"""
+        texts = []
+        for path in self.corpus_paths:
+            if not os.path.exists(path):
+                print(f"⏭️ No corpus at {path}")
+                continue
+            df = pd.read_csv(path)
+            texts += df['text'].dropna().astype(str).tolist()
+            print(f"✅ Loaded {len(df)} texts from {path}")
+
+        texts = list(dict.fromkeys(text for text in texts if text.strip()))
+        if not texts:
+            raise ValueError("The corpus is empty - point vocab_trimming.corpus at representative text")
+        return texts
+
+    def token_counts(self, tokenizer, texts, chunk=1000):
+        """How often each token id occurs in the texts (untruncated, as long posts are windowed)"""
+        counts = np.zeros(len(tokenizer), dtype=np.int64)
+        for i in range(0, len(texts), chunk):
+            encodings = tokenizer(texts[i:i + chunk], add_special_tokens=False, truncation=False)
+            for ids in encodings['input_ids']:
+                np.add.at(counts, ids, 1)
+        return counts
+
+    def tokens_to_keep(self, tokenizer, counts):
+        """Sorted ids: used often enough, special or added, or (optionally) a single character"""
+        keep = set(np.flatnonzero(counts >= self.config['min_count']).tolist())
+        keep.update(tokenizer.all_special_ids)
+        keep.update(tokenizer.get_added_vocab().values())
+
+        if self.config['keep_characters']:
+            for token, i in tokenizer.get_vocab().items():
+                # WordPiece continuation (##x) and SentencePiece word start (▁x) forms included
+                if len(token.removeprefix('##').removeprefix('▁')) == 1:
+                    keep.add(i)
+        return sorted(keep)
+
+    def trim(self):
+        """Count tokens on the corpus, trim tokenizer and embeddings, save as a candidate"""
+        print(f"\n✂️ Trimming vocabulary of: {self.model_path}")
+
+        if not os.path.exists(self.model_path):
+            raise FileNotFoundError(f"Model not found: {self.model_path}")
+
+        tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+        if not tokenizer.is_fast:
+            raise ValueError("Trimming needs a fast tokenizer (tokenizer.json)")
+        model = load_pretrained(self.model_path)
+
+        texts = self.load_corpus()
+        counts = self.token_counts(tokenizer, texts)
+        keep = self.tokens_to_keep(tokenizer, counts)
+        print(f"📚 {len(texts)} corpus texts use {int((counts > 0).sum())} of {len(tokenizer)} tokens; "
+              f"keeping {len(keep)}")
+
+        tokenizer_json, mapping = trim_tokenizer_json(json.loads(tokenizer.backend_tokenizer.to_str()), keep)
+        params_before = sum(p.numel() for p in model.parameters())
+        trim_embeddings(model, keep, mapping)
+
+        if os.path.exists(self.candidate_dir):
+            shutil.rmtree(self.candidate_dir)
+        os.makedirs(self.candidate_dir)
+
+        model.save_pretrained(self.candidate_dir)
+        tokenizer.save_pretrained(self.candidate_dir)
+        if is_pruned_artifact(self.model_path):
+            shutil.copy(os.path.join(self.model_path, PRUNING_FILE), self.candidate_dir)
+        with open(os.path.join(self.candidate_dir, 'tokenizer.json'), 'w', encoding='utf-8') as f:
+            json.dump(tokenizer_json, f, ensure_ascii=False)
+        # A slow-tokenizer vocab.txt would otherwise still list the full vocabulary
+        vocab_txt = os.path.join(self.candidate_dir, 'vocab.txt')
+        if os.path.exists(vocab_txt):
+            tokens = dict((i, token) for token, i in tokenizer.get_vocab().items())
+            with open(vocab_txt, 'w', encoding='utf-8') as f:
+                f.writelines(tokens[i] + '\n' for i in keep)
+
+        self.check_tokenization(tokenizer, mapping, texts)
+
+        params_after = sum(p.numel() for p in model.parameters())
+        print(f"✅ Candidate saved to: {self.candidate_dir}")
+        print(f"   parameters: {params_before / 1e6:.1f}M -> {params_after / 1e6:.1f}M")
+        return {'corpus_texts': len(texts), 'vocab_before': len(tokenizer), 'vocab_after': len(keep),
+                'params_before_m': params_before / 1e6, 'params_after_m': params_after / 1e6}
+
+    def check_tokenization(self, tokenizer, mapping, texts, sample=2000):
+        """The trimmed tokenizer must give corpus texts the same tokens, renumbered"""
+        trimmed = AutoTokenizer.from_pretrained(self.candidate_dir)
+        sample = texts[:sample]
+        for text, old, new in zip(sample, tokenizer(sample)['input_ids'], trimmed(sample)['input_ids']):
+            if [mapping[i] for i in old] != new:
+                raise RuntimeError(f"Trimmed tokenizer splits a corpus text differently: {text[:80]!r}")
+
+    def test_coverage(self):
+        """Share of test texts the trimmed tokenizer splits exactly like the original"""
+        texts = pd.read_csv(self.test_path)['text'].astype(str).tolist()
+        original = AutoTokenizer.from_pretrained(self.model_path)
+        trimmed = AutoTokenizer.from_pretrained(self.candidate_dir)
+        kept = trimmed.convert_ids_to_tokens
+        same = sum(original.convert_ids_to_tokens(old) == kept(new)
+                   for old, new in zip(original(texts)['input_ids'], trimmed(texts)['input_ids']))
+        return same / len(texts) if texts else 1.0
+
+    def check_accuracy(self):
+        """
+        Evaluate the original and trimmed models on the test set
+
+        Returns:
+            (passed, failures, metrics) - failures lists every label/metric over the margin,
+            and every one that is NaN for either model (it can't be compared)
+        """
+        threshold = self.config['eval_threshold']
+        margins = {
+            'f1': self.config['max_f1_drop'],
+            'auc': self.config['max_auc_drop']
+        }
+
+        baseline, _ = ModelEvaluator(self.model_path).evaluate(
+            threshold=threshold,
+            test_path=self.test_path,
+            save_path=os.path.join(self.script_dir, 'evaluation_results_full_vocab.csv')
+        )
+        candidate, _ = ModelEvaluator(self.candidate_dir).evaluate(
+            threshold=threshold,
+            test_path=self.test_path,
+            save_path=os.path.join(self.script_dir, 'evaluation_results_trimmed.csv')
+        )
+
+        print("\n" + "="*60)
+        print("🚦 Vocabulary Trimming Accuracy Gate")
+        print("="*60)
+
+        failures = []
+        for label in baseline:
+            for metric, margin in margins.items():
+                drop = baseline[label][metric] - candidate[label][metric]
+                # Allow float noise; with identical tokens the scores are identical.
+                # NaN compares False against any margin, so it must fail explicitly
+                failed = math.isnan(drop) or drop > margin + 1e-9
+                print(f"{'❌' if failed else '✅'} {label:<14} {metric:<4} full={baseline[label][metric]:.4f} "
+                      f"trimmed={candidate[label][metric]:.4f} drop={drop:+.4f} (max {margin})"
+                      f"{' - NaN, cannot compare' if math.isnan(drop) else ''}")
+                if failed:
+                    failures.append((label, metric, drop))
+
+        return len(failures) == 0, failures, {'full': baseline, 'trimmed': candidate}
+
+    def report(self, model_dir):
+        """Load time, RSS and size on disk of the original and trimmed models"""
+        rows = {}
+        for name, path in [('full', self.model_path), ('trimmed', model_dir)]:
+            seconds, rss_mb = load_footprint(path)
+            rows[name] = {'load_seconds': seconds, 'load_rss_mb': rss_mb, 'size_mb': directory_mb(path)}
+
+        print(f"\n{'':<10}{'load s':>9}{'load RSS MB':>13}{'size MB':>10}")
+        for name, row in rows.items():
+            rss = f"{row['load_rss_mb']:.1f}" if row['load_rss_mb'] is not None else 'n/a'
+            print(f"{name:<10}{row['load_seconds']:>9.2f}{rss:>13}{row['size_mb']:>10.1f}")
+
+        full, trimmed = rows['full'], rows['trimmed']
+        print(f"\n📉 Size: -{1 - trimmed['size_mb'] / full['size_mb']:.0%}, "
+              f"load time: -{1 - trimmed['load_seconds'] / full['load_seconds']:.0%}"
+              + (f", RSS: -{full['load_rss_mb'] - trimmed['load_rss_mb']:.0f} MB"
+                 if full['load_rss_mb'] is not None else ''))
+        return rows
+
+    def promote(self):
+        """Replace the trimmed model with the candidate"""
+        if os.path.exists(self.output_dir):
+            shutil.rmtree(self.output_dir)
+        os.rename(self.candidate_dir, self.output_dir)
+        print(f"\n🚀 Promoted trimmed model to: {self.output_dir}")
+
+    def run(self):
+        """Trim, check tokenization and accuracy, report, and promote if the gate passes"""
+        summary = self.trim()
+        summary['test_tokenized_identically'] = self.test_coverage()
+        print(f"🔤 {summary['test_tokenized_identically']:.1%} of test texts tokenize exactly as before")
+
+        passed, failures, metrics = self.check_accuracy()
+        if not passed:
+            shutil.rmtree(self.candidate_dir)
+            unchecked = sum(1 for _, _, drop in failures if math.isnan(drop))
+            print(f"\n⛔ Not promoting: {len(failures) - unchecked} metric(s) dropped more than the allowed margin"
+                  f"{f', {unchecked} NaN' if unchecked else ''}")
+            print("   Add more representative text to vocab_trimming.corpus, or lower min_count")
+            return False
+
+        self.promote()
+        report = {'base': self.model_path, 'corpus': self.corpus_paths, **summary,
+                  **self.report(self.output_dir), 'metrics': metrics}
+        report_path = os.path.join(self.output_dir, REPORT_FILE)
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2, default=float)
+        print(f"💾 Report saved to: {report_path}")
+        return True
+
+def main():
+    """Main vocabulary trimming function"""
+    parser = argparse.ArgumentParser(description='Trim the classifier vocabulary to a corpus')
+    parser.add_argument('--corpus', nargs='+', help='CSV files with a text column (default: vocab_trimming.corpus)')
+    parser.add_argument('--report-only', action='store_true', help='Only compare load time, RSS and size')
+    args = parser.parse_args()
+
+    try:
+        trimmer = VocabTrimmer(corpus=args.corpus)
+        if args.report_only:
+            trimmer.report(trimmer.output_dir)
+            return
+
+        if trimmer.run():
+            print("\n✨ Vocabulary trimming successful!")
+            print(f"   Serve it with: MODEL_PATH={trimmer.config['output_dir']} python app.py")
+        else:
+            sys.exit(1)
+
+    except Exception as e:
+        print(f"\n❌ Vocabulary trimming failed: {str(e)}")
+        raise
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Sliding-Window Inference
+Settings for splitting texts longer than the model's window into
+overlapping token windows, and the combination of the window scores per
+text. The windows themselves are made and scored by inference_engine.py.
+"""
+
+import numpy as np
+from settings import load_config_section
+
+DEFAULT_LONG_TEXT_CONFIG = {
+    'enabled': True,
+    'stride': 64,               # tokens shared by consecutive windows
+    'aggregation': 'max'        # max | attention
+}
+
+def load_long_text_config(config_path='config.yaml'):
+    """Read inference.long_text from config.yaml"""
+    inference = load_config_section('inference', {}, config_path)
+    return {**DEFAULT_LONG_TEXT_CONFIG, **(inference.get('long_text') or {})}
+
+def aggregate_windows(logits, sample_map, num_texts, aggregation='max'):
+    """
+    Combine per-window logits into per-text probabilities
+
+    Args:
+        logits: (num_windows, num_labels) array
+        sample_map: text index for each window
+        aggregation: 'max' takes the most toxic window per label;
+            'attention' weights each window by softmax of its logit per label,
+            a smooth max that still lets several borderline windows add up
+    """
+    # Imported here: inference_engine imports this module
+    from inference_engine import sigmoid
+
+    probs = sigmoid(logits)
+    # Windows come out of the tokenizer grouped by text, in text order
+    sample_map = np.asarray(sample_map)
+    starts = np.searchsorted(sample_map, np.arange(num_texts), side='left')
+    ends = np.searchsorted(sample_map, np.arange(num_texts), side='right')
+    combined = np.zeros((num_texts, logits.shape[1]), dtype=np.float32)
+
+    for text_index in range(num_texts):
+        window_logits = logits[starts[text_index]:ends[text_index]]
+        window_probs = probs[starts[text_index]:ends[text_index]]
+
+        if aggregation == 'max':
+            combined[text_index] = window_probs.max(axis=0)
+        elif aggregation == 'attention':
+            weights = np.exp(window_logits - window_logits.max(axis=0))
+            weights /= weights.sum(axis=0)
+            combined[text_index] = (weights * window_probs).sum(axis=0)
+        else:
+            raise ValueError(f"Unknown aggregation: {aggregation}")
+
+    return combined